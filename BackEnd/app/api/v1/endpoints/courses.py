@@ -47,7 +47,7 @@ async def plan_course(request: CourseRequest):
     """
     
     try:
-        course_json = await ai_service.generate_structured_content(prompt)
+        course_json = await ai_service.generate_structured_content(prompt, task="course")
         
         # Add module_id to each module
         modules_with_ids = []
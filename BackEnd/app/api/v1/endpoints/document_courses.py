@@ -8,8 +8,8 @@ from app.models.module import ModuleResponse
 from app.models.lesson import LessonResponse, QuizQuestion
 from app.services.document_ai_service import DocumentAIService
 
-# Import the document_store from the documents endpoint
-from app.api.v1.endpoints.documents import document_store
+# Documents are loaded from the store of the documents endpoint
+from app.api.v1.endpoints.documents import load_document
 
 router = APIRouter()
 
@@ -43,14 +43,13 @@ async def generate_course_from_document(request: DocumentCourseRequest):
     Generate a complete course structure from an uploaded document.
     """
     # Check if document exists
-    if request.document_id not in document_store:
+    document = await load_document(request.document_id)
+    if document is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Document with ID {request.document_id} not found or still processing"
         )
     
-    document = document_store[request.document_id]
-    
     # Check if there was an error during document processing
     if isinstance(document, dict) and document.get("error", False):
         raise HTTPException(
@@ -87,14 +86,13 @@ async def generate_module_from_document(request: DocumentModuleRequest):
     Generate detailed module content from a document.
     """
     # Check if document exists
-    if request.document_id not in document_store:
+    document = await load_document(request.document_id)
+    if document is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Document with ID {request.document_id} not found or still processing"
         )
     
-    document = document_store[request.document_id]
-    
     # Check if there was an error during document processing
     if isinstance(document, dict) and document.get("error", False):
         raise HTTPException(
@@ -120,14 +118,13 @@ async def generate_lesson_from_document(request: DocumentLessonRequest):
     Generate detailed lesson content from a document.
     """
     # Check if document exists
-    if request.document_id not in document_store:
+    document = await load_document(request.document_id)
+    if document is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Document with ID {request.document_id} not found or still processing"
         )
     
-    document = document_store[request.document_id]
-    
     # Check if there was an error during document processing
     if isinstance(document, dict) and document.get("error", False):
         raise HTTPException(
@@ -153,14 +150,13 @@ async def generate_quiz_from_document(request: DocumentQuizRequest):
     Generate a comprehensive quiz from document and lesson content.
     """
     # Check if document exists
-    if request.document_id not in document_store:
+    document = await load_document(request.document_id)
+    if document is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Document with ID {request.document_id} not found or still processing"
         )
     
-    document = document_store[request.document_id]
-    
     # Check if there was an error during document processing
     if isinstance(document, dict) and document.get("error", False):
         raise HTTPException(
@@ -1,49 +1,82 @@
+import asyncio
 import os
 import aiofiles
+from typing import Any, Dict, Optional, Union
 from fastapi import APIRouter, File, UploadFile, HTTPException, status, BackgroundTasks
 from app.models.document import DocumentUploadResponse, DocumentContent
 from app.services.document_processing_service import DocumentProcessingService
+from app.services.document_context_cache import document_context_cache
+from app.services.extraction_pool import extraction_pool
+from app.config import get_settings
+from app.services.repository import get_repository
 from app.utils.id_generator import generate_id
+from app.utils.metrics import metrics
 
 router = APIRouter()
 
-# In-memory store for document content (in a production app, this would be a database)
-document_store = {}
+document_backlog = metrics.gauge(
+    "document_processing_backlog", "Uploaded documents waiting for or in content extraction"
+)
+
+# Extracted document content, or the error of a failed extraction, shared by all workers;
+# only recently used documents stay in memory, the rest are reloaded from disk
+document_store = get_repository(
+    "documents",
+    cache_bytes=get_settings().document_store_memory_bytes,
+    ttl=get_settings().document_store_ttl_seconds,
+    compress=True
+)
+def _release_context(document_id: str, reason: str):
+    # A document that only made room for others is reloaded on its next use,
+    # so keep its registered context and the provider cache already paid for
+    if reason != "evicted":
+        document_context_cache.evict(document_id)
+
+# A document's registered context, and its provider cache, go when the document
+# is deleted or unused for DOCUMENT_STORE_TTL_SECONDS
+document_store.on_evict(_release_context)
 
 # Initialize document processing service
 document_service = DocumentProcessingService()
 
+async def load_document(document_id: str) -> Optional[Union[DocumentContent, Dict[str, Any]]]:
+    """Return a processed document, the error record of a failed one, or None while it is processing"""
+    record = await document_store.get(document_id)
+    if record is None or record.get("error", False):
+        return record
+    return DocumentContent.model_validate(record)
+
 async def process_document_async(file_path: str, document_id: str):
     """Background task to process a document after upload"""
     try:
-        # Extract content from the document
-        document_data = await document_service.process_document(file_path)
-        
-        # Create DocumentContent object
-        document_content = DocumentContent(
-            document_id=document_id,
-            filename=os.path.basename(file_path),
-            file_path=file_path,
-            content=document_data["content"],
-            metadata=document_data["metadata"],
-            structure=document_data["structure"]
+        # Extract, chunk and encode the document content in a worker process
+        record, encoded = await document_service.process_document(
+            file_path, document_id, document_store.compress
         )
         
         # Store document content
-        document_store[document_id] = document_content
+        await document_store.set(document_id, record, encoded)
         
         print(f"Document {document_id} processed successfully")
+    except asyncio.CancelledError:
+        # Without a record the document would stay "processing" forever
+        await asyncio.shield(_store_error(document_id, file_path, "Document processing was cancelled"))
+        raise
     except Exception as e:
         print(f"Error processing document {document_id}: {str(e)}")
-        
-        # Store error information in document_store to report to clients
-        document_store[document_id] = {
-            "error": True,
-            "error_message": str(e),
-            "document_id": document_id,
-            "filename": os.path.basename(file_path),
-            "file_path": file_path
-        }
+        await _store_error(document_id, file_path, str(e))
+    finally:
+        document_backlog.dec()
+
+async def _store_error(document_id: str, file_path: str, message: str):
+    # Store error information in document_store to report to clients
+    await document_store.set(document_id, {
+        "error": True,
+        "error_message": message,
+        "document_id": document_id,
+        "filename": os.path.basename(file_path),
+        "file_path": file_path
+    })
 
 @router.post("/upload", response_model=DocumentUploadResponse)
 async def upload_document(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
@@ -72,6 +105,14 @@ async def upload_document(background_tasks: BackgroundTasks, file: UploadFile =
             detail=f"Invalid file type. Only PDF, PPTX, and DOCX are allowed."
         )
 
+    # Turn uploads away while every extraction worker and queue slot is taken
+    if document_backlog.value() >= extraction_pool.capacity:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Document processing is at capacity. Please try again later.",
+            headers={"Retry-After": str(get_settings().extraction_retry_after_seconds)}
+        )
+
     # Generate a unique document ID
     document_id = generate_id("doc")
 
@@ -90,6 +131,7 @@ async def upload_document(background_tasks: BackgroundTasks, file: UploadFile =
         
         # Schedule background task to process the document
         background_tasks.add_task(process_document_async, file_path, document_id)
+        document_backlog.inc()
         
         # Return response immediately without waiting for processing to complete
         return DocumentUploadResponse(
@@ -109,14 +151,13 @@ async def get_document(document_id: str):
     """
     Retrieves document content by ID.
     """
-    if document_id not in document_store:
+    document_data = await load_document(document_id)
+    if document_data is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Document with ID {document_id} not found or still processing"
         )
     
-    document_data = document_store[document_id]
-    
     # Check if there was an error during processing
     if isinstance(document_data, dict) and document_data.get("error", False):
         raise HTTPException(
@@ -28,7 +28,7 @@ async def create_lesson_content(request: LessonRequest):
     """
     
     try:
-        lesson_content = await ai_service.generate_content(prompt)
+        lesson_content = await ai_service.generate_content(prompt, task="lesson")
         
         # Validate response content
         if not lesson_content:
@@ -79,7 +79,7 @@ async def create_quiz(request: LessonRequest):
     """
     
     try:
-        quiz_json = await ai_service.generate_structured_content(prompt)
+        quiz_json = await ai_service.generate_structured_content(prompt, task="quiz")
         return QuizResponse(quiz=quiz_json.get("quiz", []))
     
     except Exception as e:
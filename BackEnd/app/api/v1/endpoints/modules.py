@@ -39,7 +39,7 @@ async def plan_module(request: ModuleRequest):
     """
     
     try:
-        module_json = await ai_service.generate_structured_content(prompt)
+        module_json = await ai_service.generate_structured_content(prompt, task="module")
         
         # Add lesson_id to each lesson
         lessons_with_ids = []
@@ -1,10 +1,14 @@
-from fastapi import APIRouter, HTTPException, status, Query
-from app.models.v2.course import CourseRequest, CourseResponse, ResourceItem, ModuleInfo
+from fastapi import APIRouter, HTTPException, Request, Response, status, Query
+from fastapi.responses import StreamingResponse
+from app.models.v2.course import CourseRequest, CourseResponse, ModuleInfo
+from app.models.v2.module import ModuleRequest
 from app.services.ai_service_v2 import AIServiceV2
+from app.services.prefetch import prefetcher
+from app.services.course_export import EXPORT_FORMATS, course_exporter
+from app.services.course_tree import course_store
 from app.utils.id_generator import generate_id
+from app.utils.tracing import span
 from datetime import datetime
-import json
-import re
 import logging
 
 # Configure logging
@@ -13,9 +17,6 @@ logger = logging.getLogger("course_generation_api")
 router = APIRouter(tags=["courses"])
 ai_service = AIServiceV2()
 
-# In-memory storage for course data
-course_store = {}
-
 @router.get("/")
 async def v2_root():
     """
@@ -36,93 +37,29 @@ async def v2_root():
 @router.post("/plan-course", response_model=CourseResponse, status_code=status.HTTP_201_CREATED)
 async def plan_course(request: CourseRequest):
     # Prepare the prompt for course planning
-    prompt = ai_service.create_course_planning_prompt(request)
+    with span("prompt.build", task="course") as build:
+        prompt = ai_service.create_course_planning_prompt(request)
+        build.set("prompt_chars", len(prompt))
     
     try:
         # Generate course plan
         logger.info(f"Generating course plan for: {request.title}")
-        course_data = await ai_service.generate_ai_content(prompt, temperature=0.7)
-        
-        # Clean and parse the response
-        if "```" in course_data:
-            # Extract JSON from code blocks if present
-            json_match = re.search(r'```(?:json)?(.*?)```', course_data, re.DOTALL)
-            if json_match:
-                course_data = json_match.group(1).strip()
-        
-        # Parse the JSON with explicit error handling
-        try:
-            course_json = json.loads(course_data)
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse JSON response: {str(e)}")
-            logger.debug(f"Raw response: {course_data}")
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to parse AI response. Please try again."
-            )
-        
-        # Validate required fields are present
-        required_fields = ["course_title", "course_description", "course_introduction", 
-                          "learning_outcomes", "prerequisites", "target_audience_description", 
-                          "estimated_total_duration", "modules"]
+        course_json = await ai_service.generate_validated(prompt, CourseResponse, task="course")
         
-        for field in required_fields:
-            if field not in course_json:
-                logger.error(f"Missing required field in response: {field}")
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail=f"AI response missing required field: {field}"
-                )
-        
-        # Check that modules have required fields
-        modules_with_ids = []
-        for i, module in enumerate(course_json["modules"]):
-            # Ensure module has required fields
-            module_required_fields = ["module_title", "module_summary", "estimated_duration", "key_concepts"]
-            for field in module_required_fields:
-                if field not in module:
-                    logger.error(f"Module {i} missing required field: {field}")
-                    # Add default values for missing fields
-                    if field == "module_title":
-                        module["module_title"] = f"Module {i+1}"
-                    elif field == "module_summary":
-                        module["module_summary"] = "Module details not provided."
-                    elif field == "estimated_duration":
-                        module["estimated_duration"] = "1-2 hours"
-                    elif field == "key_concepts":
-                        module["key_concepts"] = ["Concept 1", "Concept 2"]
-            
-            module_with_id = {
-                "module_id": generate_id("mod"),
-                "module_title": module["module_title"],
-                "module_summary": module["module_summary"],
-                "estimated_duration": module["estimated_duration"],
-                "key_concepts": module["key_concepts"]
-            }
-            modules_with_ids.append(ModuleInfo(**module_with_id))
-        
-        # Prepare recommended resources if available
-        recommended_resources = None
-        if "recommended_resources" in course_json and request.include_resources:
-            try:
-                recommended_resources = [ResourceItem(**resource) for resource in course_json["recommended_resources"]]
-            except Exception as e:
-                logger.warning(f"Error parsing recommended resources: {str(e)}")
-                # Continue without resources if there's an error
+        # Assign server-side IDs to the generated modules
+        modules_with_ids = [
+            ModuleInfo(module_id=generate_id("mod"), **module) for module in course_json["modules"]
+        ]
         
         # Create the response object
         course_id = generate_id("course")
         course_response = CourseResponse(
+            **{
+                **course_json,
+                "modules": modules_with_ids,
+                "recommended_resources": course_json.get("recommended_resources") if request.include_resources else None
+            },
             course_id=course_id,
-            course_title=course_json["course_title"],
-            course_description=course_json["course_description"],
-            course_introduction=course_json["course_introduction"],
-            learning_outcomes=course_json["learning_outcomes"],
-            prerequisites=course_json["prerequisites"],
-            target_audience_description=course_json["target_audience_description"],
-            estimated_total_duration=course_json["estimated_total_duration"],
-            modules=modules_with_ids,
-            recommended_resources=recommended_resources,
             metadata={
                 "created_at": datetime.now().isoformat(),
                 "difficulty_level": request.difficulty_level.value,
@@ -131,13 +68,27 @@ async def plan_course(request: CourseRequest):
             }
         )
         
-        # Store course data in memory
+        # Store course context for module generation, and the plan for export
         course_context_data = {
             "course_title": course_json["course_title"],
             "course_description": course_json["course_description"],
-            "target_audience_description": course_json["target_audience_description"]
+            "target_audience_description": course_json["target_audience_description"],
+            "course": course_response.model_dump(mode="json")
         }
-        course_store[course_id] = course_context_data
+        await course_store.set(course_id, course_context_data)
+        
+        # Start planning the modules the client is expected to request next
+        prefetcher.schedule("plan-module", [
+            ModuleRequest(
+                course_id=course_id,
+                module_title=module.module_title,
+                module_summary=module.module_summary,
+                key_concepts=module.key_concepts,
+                difficulty_level=request.difficulty_level,
+                content_style=request.content_style
+            )
+            for module in modules_with_ids
+        ])
         
         return course_response
     
@@ -154,28 +105,46 @@ async def plan_course(request: CourseRequest):
 @router.get("/export-course/{course_id}", status_code=status.HTTP_200_OK)
 async def export_course(
     course_id: str,
-    format: str = Query("md", description="Export format: md, html, pdf")
+    request: Request,
+    format: str = Query("md", description="Export format: md, html, pdf, or an LMS package: scorm12, scorm2004, imscc")
 ):
     """
     Export an entire course in various formats
+
+    The export is streamed as it is rendered and cached by content hash,
+    which is also its ETag; repeated downloads of an unchanged course are
+    served from the cache.
     """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unsupported export format: {format}. Use one of: {', '.join(EXPORT_FORMATS)}"
+        )
+
     try:
+        content_hash = await course_exporter.content_hash(course_id, format)
+        etag = f'"{content_hash}"'
+        if request.headers.get("if-none-match") == etag and await course_store.contains(course_id):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+        with span("course.export", format=format):
+            stream = await course_exporter.export(course_id, format, content_hash)
         # Check if course exists
-        if course_id not in course_store:
+        if stream is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Course with ID {course_id} not found"
             )
-        
-        # In a real implementation, we would fetch all modules, lessons, etc.
-        # and generate the appropriate format
-        
-        # For now, return a simple confirmation
-        return {
-            "status": "success", 
-            "message": f"Course export in {format} format will be available shortly",
-            "course_id": course_id
-        }
+
+        export_format = EXPORT_FORMATS[format]
+        return StreamingResponse(
+            stream,
+            media_type=export_format.media_type,
+            headers={
+                "Content-Disposition": f'attachment; filename="{course_id}.{export_format.extension}"',
+                "ETag": etag
+            }
+        )
     
     except HTTPException:
         raise
@@ -1,24 +1,113 @@
+import asyncio
 from fastapi import APIRouter, status
+from fastapi.responses import JSONResponse
 from datetime import datetime
-import os
 import json
+import resource
+from typing import Any, Dict, List
+from app.config import get_settings
+from app.services.llm_cache import llm_cache
+from app.services.rate_limiter import quota_limiter
+from app.services.model_router import model_router
+from app.services.document_context_cache import document_context_cache
+from app.services.job_queue import job_queue
+from app.services.prefetch import prefetcher
+from app.services.loop_monitor import loop_monitor
+from app.services.mcp_service import mcp_pool
+from app.services.extraction_pool import extraction_pool
+from app.services.ai_service_v2 import get_generation_slots
+from app.api.v1.endpoints.documents import document_store, document_backlog
+from app.services.course_tree import course_store, module_store, lesson_store, quiz_store
+from app.utils.json_parser import parse_llm_json
 
 router = APIRouter(tags=["health"])
 
-MODEL_NAME = os.getenv("MODEL_NAME", "gemini-2.0-flash-exp")
+def _memory() -> Dict[str, int]:
+    """Current and peak resident memory of this worker in bytes"""
+    usage = {"peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}
+    try:
+        with open("/proc/self/statm") as f:
+            usage["rss_bytes"] = int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        # Not Linux; only the peak is available
+        pass
+    return usage
+
+def _saturation() -> Dict[str, Any]:
+    """Load on the resources requests wait for, and which of them are past their limits"""
+    settings = get_settings()
+    slots = get_generation_slots()
+    queued_calls = slots.queued() + quota_limiter.queued()
+    loop_lag = loop_monitor.percentile(95)
+    backlog = int(document_backlog.value())
+
+    reasons: List[str] = []
+    if queued_calls > settings.ready_max_queued_calls:
+        reasons.append(f"{queued_calls} model calls queued (limit {settings.ready_max_queued_calls})")
+    if loop_lag > settings.ready_max_loop_lag_seconds:
+        reasons.append(f"event loop lag p95 {loop_lag:.2f}s (limit {settings.ready_max_loop_lag_seconds}s)")
+    if backlog > settings.ready_max_document_backlog:
+        reasons.append(f"{backlog} documents awaiting processing (limit {settings.ready_max_document_backlog})")
+    if extraction_pool.full():
+        reasons.append(f"document extraction pool full ({extraction_pool.capacity} jobs)")
+
+    return {
+        "saturated": bool(reasons),
+        "reasons": reasons,
+        "llm_calls_in_flight": slots.running,
+        "llm_calls_queued": queued_calls,
+        "document_backlog": backlog,
+        "extraction_pool": extraction_pool.status(),
+        "event_loop_lag_p95_seconds": round(loop_lag, 4)
+    }
 
 @router.get("/health", status_code=status.HTTP_200_OK)
 async def health_check():
     """
-    Endpoint for monitoring system health
+    Endpoint for monitoring system health and saturation
     """
+    settings = get_settings()
+    saturation = _saturation()
     return {
-        "status": "healthy",
+        "status": "saturated" if saturation["saturated"] else "healthy",
         "api_version": "2.0.0",
-        "model": MODEL_NAME,
+        "model": settings.model_name,
+        "backend": settings.llm_backend,
+        "saturation": saturation,
+        "event_loop": loop_monitor.status(),
+        "memory": _memory(),
+        "stores": {
+            "backend": settings.store_backend,
+            "courses": await course_store.count(),
+            "modules": await module_store.count(),
+            "lessons": await lesson_store.count(),
+            "quizzes": await quiz_store.count(),
+            "documents": await document_store.count(),
+            "documents_in_memory": document_store.status()
+        },
+        "cache": llm_cache.stats(),
+        # Both read the shared SQLite stores, which may wait on other workers' locks
+        "rate_limits": await asyncio.to_thread(quota_limiter.status),
+        "scheduler": get_generation_slots().status(),
+        "routing": model_router.status(),
+        "mcp": mcp_pool.status(),
+        "document_contexts": document_context_cache.status(),
+        "jobs": await asyncio.to_thread(job_queue.status),
+        "prefetch": prefetcher.status(),
         "timestamp": datetime.now().isoformat()
     }
 
+@router.get("/ready")
+async def readiness_check():
+    """
+    Readiness probe for load balancers: 503 while this worker is saturated
+    """
+    saturation = _saturation()
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE if saturation["saturated"] else status.HTTP_200_OK,
+        content={"ready": not saturation["saturated"], **saturation}
+    )
+
 @router.post("/feedback", status_code=status.HTTP_201_CREATED)
 async def submit_feedback(feedback: dict):
     """
@@ -64,20 +153,13 @@ async def debug_ai(request: dict):
         prompt = request.get("prompt", "Create a JSON response with the following structure: {\"test\": \"This is a test\"}")
         
         # Generate content
-        content = await ai_service.generate_ai_content(prompt, temperature=0.2)
+        content = await ai_service.generate_ai_content(prompt, temperature=0.2, task="debug")
         
         # Try to parse as JSON
         json_data = None
         try:
-            if "```" in content:
-                import re
-                json_match = re.search(r'```(?:json)?(.*?)```', content, re.DOTALL)
-                if json_match:
-                    content_cleaned = json_match.group(1).strip()
-                    json_data = json.loads(content_cleaned)
-            else:
-                json_data = json.loads(content)
-        except:
+            json_data = parse_llm_json(content)
+        except json.JSONDecodeError:
             pass
         
         return {
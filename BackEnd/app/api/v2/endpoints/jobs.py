@@ -0,0 +1,109 @@
+import json
+from datetime import datetime
+from typing import Any, Dict, Optional
+from fastapi import APIRouter, HTTPException, status
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from app.models.v2.course import CourseRequest
+from app.models.v2.module import ModuleRequest
+from app.models.v2.lesson import LessonRequest, QuizRequest
+from app.models.v2.pipeline import FullCourseRequest
+from app.models.v2.job import JobKind, JobRequest, JobResponse
+from app.services.job_queue import job_queue, SUCCEEDED, FAILED
+from app.api.v2.endpoints.courses import plan_course
+from app.api.v2.endpoints.modules import plan_module
+from app.api.v2.endpoints.lessons import create_lesson_content, create_quiz
+from app.api.v2.endpoints.pipeline import generate_full_course
+import logging
+
+# Configure logging
+logger = logging.getLogger("course_generation_api")
+
+router = APIRouter(tags=["jobs"])
+
+# The synchronous generation handlers run as the executors of their job kinds
+job_queue.register(JobKind.PLAN_COURSE.value, CourseRequest, plan_course)
+job_queue.register(JobKind.PLAN_MODULE.value, ModuleRequest, plan_module)
+job_queue.register(JobKind.CREATE_LESSON_CONTENT.value, LessonRequest, create_lesson_content)
+job_queue.register(JobKind.CREATE_QUIZ.value, QuizRequest, create_quiz)
+job_queue.register(JobKind.GENERATE_FULL_COURSE.value, FullCourseRequest, generate_full_course)
+
+def _timestamp(value: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(value).isoformat() if value is not None else None
+
+def _job_response(job: Dict[str, Any]) -> JobResponse:
+    return JobResponse(
+        job_id=job["id"],
+        kind=job["kind"],
+        status=job["status"],
+        attempts=job["attempts"],
+        max_attempts=job["max_attempts"],
+        progress=job["progress"],
+        error=job["error"],
+        created_at=_timestamp(job["created_at"]),
+        updated_at=_timestamp(job["updated_at"]),
+        finished_at=_timestamp(job["finished_at"])
+    )
+
+async def _get_job(job_id: str) -> Dict[str, Any]:
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job with ID {job_id} not found")
+    return job
+
+@router.post("/jobs", response_model=JobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def submit_job(request: JobRequest):
+    """
+    Queue a generation in the background and return its job ID right away.
+    """
+    try:
+        job = await job_queue.submit(request.kind.value, request.payload)
+    except ValidationError as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=json.loads(e.json(include_url=False))
+        )
+
+    logger.info(f"Queued {request.kind.value} job {job['id']}")
+    return _job_response(job)
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str):
+    """
+    Get the status, attempts and progress of a job.
+    """
+    return _job_response(await _get_job(job_id))
+
+@router.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """
+    Get the result of a finished job: the response the synchronous endpoint would have returned.
+    """
+    job = await _get_job(job_id)
+    if job["status"] == SUCCEEDED:
+        return job["result"]
+    if job["status"] == FAILED:
+        raise HTTPException(status_code=job["error_status"] or 500, detail=job["error"])
+    raise HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail=f"Job {job_id} is {job['status']}; its result is not available yet"
+    )
+
+async def _job_events(job_id: str):
+    async for job in job_queue.events(job_id):
+        if job is None:
+            yield ": keep-alive\n\n"
+        else:
+            yield f"event: status\ndata: {_job_response(job).model_dump_json()}\n\n"
+
+@router.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """
+    Stream a job's status as server-sent events until it succeeds or fails.
+    """
+    await _get_job(job_id)
+    return StreamingResponse(
+        _job_events(job_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
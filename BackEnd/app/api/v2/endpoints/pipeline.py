@@ -0,0 +1,132 @@
+import asyncio
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, List, TypeVar
+from fastapi import APIRouter, HTTPException, status
+from app.config import get_settings
+from app.models.v2.module import ModuleRequest
+from app.models.v2.lesson import LessonRequest, QuizRequest
+from app.models.v2.pipeline import (
+    FullCourseRequest, FullCourseResponse, FullCourseModule, FullCourseLesson
+)
+from app.api.v2.endpoints.courses import plan_course
+from app.api.v2.endpoints.modules import plan_module
+from app.api.v2.endpoints.lessons import create_lesson_content, create_quiz
+from app.services.job_queue import job_queue
+import logging
+
+# Configure logging
+logger = logging.getLogger("course_generation_api")
+
+router = APIRouter(tags=["pipeline"])
+
+T = TypeVar("T")
+
+async def _gather_or_cancel(steps: List[Awaitable[T]]) -> List[T]:
+    """Run steps concurrently; the first failure cancels the others"""
+    tasks = [asyncio.ensure_future(step) for step in steps]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+class _CoursePipeline:
+    """
+    Generates a whole course as a dependency graph.
+
+    The course plan is generated first. Every module is then planned
+    concurrently, each lesson starts as soon as its own module plan is
+    ready, and each quiz as soon as its lesson is. The steps reuse the
+    single-item handlers, so course_store, module_store and lesson_store
+    carry the context down the graph exactly as for separate requests.
+    """
+
+    def __init__(self, request: FullCourseRequest):
+        self.request = request
+        self.slots = asyncio.Semaphore(get_settings().pipeline_max_concurrency)
+        self.steps = 0
+        self.completed_steps = 0
+
+    async def _step(self, fn: Callable[..., Awaitable[T]], step_request) -> T:
+        # Bounds this pipeline's steps; model calls are also bounded process-wide
+        async with self.slots:
+            self.steps += 1
+            result = await fn(step_request)
+        self.completed_steps += 1
+        # Visible through /api/v2/jobs when the pipeline runs as a background job
+        await job_queue.report_progress(completed_steps=self.completed_steps, last_step=fn.__name__)
+        return result
+
+    async def run(self) -> FullCourseResponse:
+        started = time.monotonic()
+        course = await self._step(plan_course, self.request)
+
+        modules = await _gather_or_cancel([
+            self._build_module(course.course_id, module_info) for module_info in course.modules
+        ])
+
+        return FullCourseResponse(
+            course=course,
+            modules=modules,
+            metadata={
+                "created_at": datetime.now().isoformat(),
+                "generation_steps": self.steps,
+                "generation_seconds": round(time.monotonic() - started, 2)
+            }
+        )
+
+    async def _build_module(self, course_id: str, module_info) -> FullCourseModule:
+        module = await self._step(plan_module, ModuleRequest(
+            course_id=course_id,
+            module_title=module_info.module_title,
+            module_summary=module_info.module_summary,
+            key_concepts=module_info.key_concepts,
+            difficulty_level=self.request.difficulty_level,
+            content_style=self.request.content_style
+        ))
+
+        lessons = await _gather_or_cancel([
+            self._build_lesson(module.module_id, lesson_info) for lesson_info in module.lessons
+        ])
+        return FullCourseModule(module_title=module_info.module_title, module=module, lessons=lessons)
+
+    async def _build_lesson(self, module_id: str, lesson_info) -> FullCourseLesson:
+        lesson = await self._step(create_lesson_content, LessonRequest(
+            module_id=module_id,
+            lesson_title=lesson_info.lesson_title,
+            lesson_objective=lesson_info.lesson_objective,
+            difficulty_level=self.request.difficulty_level,
+            content_style=self.request.content_style,
+            focus_areas=lesson_info.key_points
+        ))
+
+        quiz = None
+        if self.request.include_quizzes:
+            quiz = await self._step(create_quiz, QuizRequest(
+                lesson_id=lesson.lesson_id,
+                difficulty_level=self.request.difficulty_level,
+                num_questions=self.request.num_questions
+            ))
+        return FullCourseLesson(lesson=lesson, quiz=quiz)
+
+@router.post("/generate-full-course", response_model=FullCourseResponse, status_code=status.HTTP_201_CREATED)
+async def generate_full_course(request: FullCourseRequest):
+    """
+    Generate a complete course with all modules, lessons and quizzes in one request.
+    """
+    try:
+        logger.info(f"Generating full course for: {request.title}")
+        return await _CoursePipeline(request).run()
+
+    except HTTPException:
+        # Re-raise HTTP exceptions
+        raise
+    except Exception as e:
+        logger.error(f"Error generating full course: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error generating full course: {str(e)}"
+        )
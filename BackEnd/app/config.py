@@ -2,7 +2,7 @@ import os
 from functools import lru_cache
 from pydantic_settings import BaseSettings
 from dotenv import load_dotenv
-from typing import Optional
+from typing import Any, Dict, Optional
 
 load_dotenv()
 
@@ -11,6 +11,155 @@ class Settings(BaseSettings):
     google_api_key: str = os.getenv("GOOGLE_API_KEY", "")
     model_name: str = "gemini-2.0-flash-exp"
     
+    # "gemini", or "fake" for the simulated model used by benchmarks and local testing
+    llm_backend: str = "gemini"
+    fake_llm_latency_seconds: float = 1.0
+    fake_llm_latency_distribution: str = "lognormal"
+    fake_llm_latency_sigma: float = 0.5
+    fake_llm_tokens_per_second: float = 400.0
+    fake_llm_error_rate: float = 0.0
+    fake_llm_quota_error_rate: float = 0.0
+    fake_llm_seed: Optional[int] = None
+    
+    # Maximum number of concurrent model calls per worker process
+    llm_max_concurrency: int = 8
+    
+    # MCP server pool used by the v1 LangChain agent
+    mcp_health_check_interval: float = 30.0
+    mcp_health_check_timeout: float = 5.0
+    # How long replaced MCP servers stay up for the calls still using them
+    mcp_drain_timeout: float = 120.0
+    
+    # Two-tier LLM response cache
+    llm_cache_enabled: bool = True
+    llm_cache_memory_bytes: int = 64 * 1024 * 1024
+    llm_cache_path: str = "data/llm_cache.sqlite3"
+    llm_cache_ttl_seconds: int = 7 * 24 * 3600
+    
+    # Per-model rate limits, e.g. {"gemini-2.0-flash-exp": {"rpm": 10, "tpm": 4000000}}; with
+    # the sqlite store backend they hold for all workers of a host together, otherwise per worker
+    model_rate_limits: Dict[str, Dict[str, int]] = {
+        "gemini-2.0-flash-exp": {"rpm": 10, "tpm": 4000000},
+        "gemini-2.0-flash-lite": {"rpm": 30, "tpm": 1000000}
+    }
+    default_rpm: int = 15
+    default_tpm: int = 1000000
+    quota_backoff_seconds: float = 30.0
+    quota_max_requeues: int = 5
+    
+    # Request hedging: send a duplicate call when the first is slower than this latency percentile
+    hedging_enabled: bool = False
+    hedge_percentile: float = 95.0
+    hedge_min_samples: int = 20
+    hedge_budget_ratio: float = 0.1
+    
+    # Model and output budget per task; tasks not listed use model_name
+    model_routes: Dict[str, Dict[str, Any]] = {
+        "course": {"model": "gemini-2.0-flash-exp", "max_output_tokens": 8192},
+        "module": {"model": "gemini-2.0-flash-lite", "max_output_tokens": 4096},
+        "lesson": {"model": "gemini-2.0-flash-exp", "max_output_tokens": 8192},
+        "quiz": {"model": "gemini-2.0-flash-lite", "max_output_tokens": 2048},
+        "document": {"model": "gemini-2.0-flash-exp", "max_output_tokens": 8192}
+    }
+    default_max_output_tokens: int = 8192
+    
+    # Circuit breaker that moves a model's traffic to the fallback model
+    fallback_model_name: Optional[str] = "gemini-1.5-flash"
+    circuit_error_threshold: float = 0.5
+    circuit_latency_threshold: float = 60.0
+    circuit_min_calls: int = 10
+    circuit_window_seconds: float = 60.0
+    circuit_open_seconds: float = 30.0
+    
+    # Document chunk size, the token budget of the shared document context and
+    # of the extra excerpts added to each prompt
+    document_chunk_tokens: int = 300
+    document_context_budgets: Dict[str, int] = {
+        "course": 6000,
+        "module": 3000,
+        "lesson": 3000,
+        "quiz": 1500
+    }
+    
+    # Provider-side cached content for documents large enough to qualify
+    document_context_cache_enabled: bool = True
+    document_cache_min_tokens: int = 32768
+    document_cache_max_tokens: int = 500000
+    document_cache_ttl_seconds: int = 3600
+    # Registered document contexts kept in memory per worker
+    document_context_memory_bytes: int = 16 * 1024 * 1024
+    
+    # Rounds of regenerating only the invalid parts of a schema-constrained response
+    structured_output_repair_rounds: int = 2
+    
+    # Concurrent steps of one /generate-full-course run
+    pipeline_max_concurrency: int = 8
+    
+    # Priority classes of model calls: weights for fair queuing, the class of
+    # requests without an X-Priority header, and classes forced per X-API-Key
+    priority_weights: Dict[str, float] = {"interactive": 8.0, "batch": 2.0, "speculative": 1.0}
+    default_priority: str = "interactive"
+    priority_api_keys: Dict[str, str] = {}
+    
+    # Speculative generation of the module plans and lessons clients request next
+    speculative_prefetch_enabled: bool = False
+    prefetch_max_inflight: int = 4
+    prefetch_max_entries: int = 256
+    prefetch_ttl_seconds: int = 900
+    
+    # Course, module, lesson and document state: "sqlite" shares it between the
+    # workers of a host, "memory" keeps it in each process
+    store_backend: str = "sqlite"
+    store_path: str = "data/store.sqlite3"
+    store_cache_bytes: int = 32 * 1024 * 1024
+    store_commit_interval: float = 0.005
+    store_commit_max_batch: int = 256
+    store_compression_level: int = 6
+    # Extracted documents kept in memory, by total size and idle time; the
+    # rest stay compressed on disk and are reloaded when used
+    document_store_memory_bytes: int = 64 * 1024 * 1024
+    document_store_ttl_seconds: int = 3600
+    
+    # Rendered course exports, cached on disk by content hash
+    export_cache_dir: str = "data/exports"
+    export_cache_max_bytes: int = 256 * 1024 * 1024
+    export_chunk_bytes: int = 64 * 1024
+    
+    # Persistent background job queue for /api/v2/jobs
+    job_queue_path: str = "data/jobs.sqlite3"
+    job_workers: int = 4
+    job_max_attempts: int = 3
+    job_retry_backoff_seconds: float = 10.0
+    job_poll_interval: float = 1.0
+    # Running jobs whose owner has not renewed them for this long are queued again
+    job_lease_seconds: float = 60.0
+    job_retention_seconds: int = 7 * 24 * 3600
+    
+    # Rolling event loop lag sampling, and the saturation limits beyond which
+    # /api/v2/ready takes the worker out of rotation
+    loop_lag_interval: float = 0.25
+    loop_lag_window_seconds: float = 30.0
+    ready_max_loop_lag_seconds: float = 0.5
+    ready_max_queued_calls: int = 32
+    ready_max_document_backlog: int = 8
+    
+    # Worker processes that extract uploaded documents, off the event loop
+    extraction_workers: int = 2
+    extraction_max_queued: int = 16
+    extraction_timeout_seconds: float = 120.0
+    extraction_retry_after_seconds: int = 10
+    
+    # Watchdog thread that logs the stack of any callback holding the event loop
+    # longer than the threshold; meant for staging, not production
+    loop_watchdog_enabled: bool = False
+    loop_watchdog_threshold_seconds: float = 0.1
+    loop_watchdog_stack_depth: int = 15
+    
+    # Export of per-request tracing spans as OTLP/JSON lines
+    tracing_enabled: bool = False
+    tracing_export_path: str = "data/traces.jsonl"
+    tracing_service_name: str = "tuteai"
+    
     class Config:
         env_file = ".env"
 
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 import uuid
@@ -20,6 +20,17 @@ class DocumentStructureItem(BaseModel):
     page: Optional[int] = None
     slide: Optional[int] = None
 
+class DocumentChunk(BaseModel):
+    """A paragraph-aligned span of document content with its token count."""
+    index: int
+    start: int
+    end: int
+    token_count: int
+    
+    def text(self, content: str) -> str:
+        """The chunk's text, sliced from the content of its document."""
+        return content[self.start:self.end]
+
 class DocumentRequest(BaseModel):
     """Request model for document-based operations."""
     document_id: str
@@ -33,8 +44,18 @@ class DocumentContent(BaseModel):
     content: str
     metadata: DocumentMetadata
     structure: List[DocumentStructureItem]
+    chunks: List[DocumentChunk] = []
     extracted_at: datetime = Field(default_factory=datetime.now)
     
+    @field_validator("chunks", mode="before")
+    @classmethod
+    def _drop_text_chunks(cls, chunks: Any) -> Any:
+        # Documents stored before chunks were spans carry a copy of each chunk's text;
+        # drop those chunks so they are rebuilt from the content on first use
+        if chunks and isinstance(chunks[0], dict) and "start" not in chunks[0]:
+            return []
+        return chunks
+    
 class DocumentUploadResponse(BaseModel):
     """Response model for document upload."""
     document_id: str
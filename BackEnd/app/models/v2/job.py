@@ -0,0 +1,32 @@
+from pydantic import BaseModel
+from typing import Any, Dict, Optional
+from enum import Enum
+
+class JobKind(str, Enum):
+    PLAN_COURSE = "plan-course"
+    PLAN_MODULE = "plan-module"
+    CREATE_LESSON_CONTENT = "create-lesson-content"
+    CREATE_QUIZ = "create-quiz"
+    GENERATE_FULL_COURSE = "generate-full-course"
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+class JobRequest(BaseModel):
+    kind: JobKind
+    payload: Dict[str, Any]
+
+class JobResponse(BaseModel):
+    job_id: str
+    kind: JobKind
+    status: JobStatus
+    attempts: int
+    max_attempts: int
+    progress: Dict[str, Any] = {}
+    error: Optional[str] = None
+    created_at: str
+    updated_at: str
+    finished_at: Optional[str] = None
@@ -0,0 +1,23 @@
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Optional
+from app.models.v2.course import CourseRequest, CourseResponse
+from app.models.v2.module import ModuleResponse
+from app.models.v2.lesson import LessonResponse, QuizResponse
+
+class FullCourseRequest(CourseRequest):
+    include_quizzes: Optional[bool] = True
+    num_questions: Optional[int] = Field(5, ge=3, le=10)
+
+class FullCourseLesson(BaseModel):
+    lesson: LessonResponse
+    quiz: Optional[QuizResponse] = None
+
+class FullCourseModule(BaseModel):
+    module_title: str
+    module: ModuleResponse
+    lessons: List[FullCourseLesson]
+
+class FullCourseResponse(BaseModel):
+    course: CourseResponse
+    modules: List[FullCourseModule]
+    metadata: Dict[str, Any] = {}
@@ -1,38 +1,75 @@
 import json
 import os
+import time
 from typing import Any, Dict
 from fastapi import HTTPException
 from app.config import get_settings
 from app.services.mcp_service import LangChainAgent # mcp server adapter
+from app.services.llm_cache import llm_cache
+from app.utils.json_parser import parse_llm_json
+from app.services.single_flight import SingleFlight
+from app.services.rate_limiter import quota_limiter, estimate_tokens
+from app.services.model_router import model_router
+
+# Identical requests arriving together share one agent call
+_inflight_generations = SingleFlight("ai_service")
 
 class AIService:
     def __init__(self):
         settings = get_settings()
-        if not settings.google_api_key:
+        if settings.llm_backend == "gemini" and not settings.google_api_key:
             raise ValueError("GOOGLE_API_KEY environment variable not set")
         
         # Initialize the LangChain agent
         self.lang_chain_agent = LangChainAgent()
     
-    async def generate_content(self, prompt: str) -> str:
-        """Generate content using the AI model"""
+    def _cache_key(self, prompt: str, task: str) -> str:
+        route = model_router.route(task)
+        return llm_cache.make_key(
+            route.model_name, prompt, None,
+            {"agent": "mcp-react", "max_output_tokens": route.max_output_tokens}
+        )
+    
+    async def generate_content(self, prompt: str, task: str = "default") -> str:
+        """Generate content using the AI model routed for the task"""
+        cache_key = self._cache_key(prompt, task)
+        cached = await llm_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
         try:
-            response = await self.lang_chain_agent.get_response(prompt)
-            return response
+            return await _inflight_generations.do(
+                cache_key, lambda: self._generate_and_cache(prompt, cache_key, task)
+            )
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Error generating content: {str(e)}")
     
-    async def generate_structured_content(self, prompt: str) -> Dict[str, Any]:
+    async def _generate_and_cache(self, prompt: str, cache_key: str, task: str) -> str:
+        route = model_router.select(task)
+        # The agent shares the Gemini quota with the v2 service
+        await quota_limiter.acquire(route.model_name, estimate_tokens(prompt))
+        
+        started = time.monotonic()
+        try:
+            response = await self.lang_chain_agent.get_response(
+                prompt, self.lang_chain_agent.get_model(route.model_name, route.max_output_tokens), task
+            )
+        except Exception:
+            model_router.record_failure(route.model_name)
+            raise
+        model_router.record_success(route.model_name, time.monotonic() - started)
+        
+        # The key names the primary model, so the fallback's responses are not cached under it
+        if route.tier == "primary":
+            await llm_cache.set(cache_key, response)
+        return response
+    
+    async def generate_structured_content(self, prompt: str, task: str = "default") -> Dict[str, Any]:
         """Generate content and parse it as JSON"""
         try:
-            response = await self.generate_content(prompt)
-            
-            # Remove markdown code block syntax if present
-            if response.startswith("```json"):
-                response = response.replace("```json", "", 1)
-            if response.endswith("```"):
-                response = response.replace("```", "", 1)
-                
-            return json.loads(response.strip())
+            response = await self.generate_content(prompt, task)
+            return parse_llm_json(response)
         except json.JSONDecodeError as e:
+            # Plain text responses are cached too; drop this one so the retry asks the agent again
+            await llm_cache.delete(self._cache_key(prompt, task))
             raise HTTPException(status_code=500, detail=f"Invalid JSON response: {str(e)}")
\ No newline at end of file
@@ -1,67 +1,451 @@
+import asyncio
 import json
-from typing import Any, Dict
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple, Type
+from pydantic import BaseModel
 import google.generativeai as genai
+from google.api_core.exceptions import ResourceExhausted
 from fastapi import HTTPException
 from app.config import get_settings
+from app.services.llm_cache import llm_cache
+from app.services.single_flight import SingleFlight
+from app.services.rate_limiter import quota_limiter, estimate_tokens
+from app.services.hedging import LatencyTracker, HedgeBudget, hedged_call
+from app.services.model_router import Route, model_router
+from app.services.fake_llm import FakeGenerativeModel
+from app.services.scheduler import PriorityScheduler, SchedulerPreempted
+from app.utils.json_parser import is_valid_json, parse_llm_json
+from app.utils.request_context import record_tokens
+from app.utils.tracing import current_span, span
+from app.utils.schema import (
+    Path, draft_model, response_schema as schema_for_model, schema_at, invalid_subtrees,
+    format_path, get_path, set_path
+)
 import logging
-import re
-from tenacity import retry, stop_after_attempt, wait_exponential
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("ai_service_v2")
 
+# Shared by every AIServiceV2 instance so the concurrency limit applies per process
+_generation_slots: Optional[PriorityScheduler] = None
+
+def get_generation_slots() -> PriorityScheduler:
+    """Return the process-wide scheduler bounding concurrent model calls by priority class"""
+    global _generation_slots
+    if _generation_slots is None:
+        _generation_slots = PriorityScheduler(get_settings().llm_max_concurrency, "generation")
+    return _generation_slots
+
+# Identical requests arriving together share one model call
+_inflight_generations = SingleFlight("ai_service_v2")
+
+# Observed latencies per task drive the hedge delay; the budget caps the extra quota spent
+latency_tracker = LatencyTracker()
+_hedge_budget = HedgeBudget(get_settings().hedge_budget_ratio)
+
+def _is_retryable(exception: BaseException) -> bool:
+    # Quota exhaustion is already requeued by the rate limiter, so don't retry it blindly;
+    # preempted speculation is dropped on purpose
+    if isinstance(exception, SchedulerPreempted):
+        return False
+    return not (isinstance(exception, HTTPException) and exception.status_code == 429)
+
+def _count_retry(retry_state):
+    # Runs in the task of the call being retried, so this is its llm.generate span
+    current = current_span()
+    if current is not None:
+        current.add("retries")
+
+def _retry_after(error: ResourceExhausted) -> float:
+    """Use the provider's retry delay when it sends one"""
+    for detail in getattr(error, "details", None) or []:
+        retry_delay = getattr(detail, "retry_delay", None)
+        if retry_delay is not None and retry_delay.seconds:
+            return float(retry_delay.seconds)
+    return get_settings().quota_backoff_seconds
+
+def _record_usage(task: str, usage: Any, estimated_tokens: int, text: str):
+    """Count the tokens of a response, estimating them when the provider sent no usage"""
+    record_tokens(
+        task,
+        getattr(usage, "prompt_token_count", None) or estimated_tokens,
+        getattr(usage, "candidates_token_count", None) or estimate_tokens(text)
+    )
+
+def _quota_exhausted() -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail="Model quota exhausted. Please try again later.",
+        headers={"Retry-After": str(int(get_settings().quota_backoff_seconds))}
+    )
+
 class AIServiceV2:
     def __init__(self):
         settings = get_settings()
-        if not settings.google_api_key:
+        if settings.llm_backend == "gemini" and not settings.google_api_key:
             raise ValueError("GOOGLE_API_KEY environment variable not set")
         
         # Initialize the model
         genai.configure(api_key=settings.google_api_key)
-        self.model = genai.GenerativeModel(settings.model_name)
+        self.model_name = settings.model_name
+        self._models: Dict[str, genai.GenerativeModel] = {}
+        self.model = self._model(self.model_name)
     
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
-    async def generate_ai_content(self, prompt: str, temperature=0.7) -> str:
-        """Generate content using the AI model with retry logic"""
-        try:
-            generation_config = {
-                "temperature": temperature,
-                "top_p": 0.95,
-                "top_k": 40,
-                "max_output_tokens": 8192,
-                "response_mime_type": "application/json" # Request JSON format if supported
-            }
+    def _model(self, model_name: str) -> genai.GenerativeModel:
+        """Return the client for a routed model, creating it on first use"""
+        model = self._models.get(model_name)
+        if model is None:
+            if get_settings().llm_backend == "fake":
+                model = FakeGenerativeModel(model_name)
+            else:
+                model = genai.GenerativeModel(model_name)
+            self._models[model_name] = model
+        return model
+    
+    def _generation_config(
+        self, temperature: float, max_output_tokens: int = 8192,
+        response_schema: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        config = {
+            "temperature": temperature,
+            "top_p": 0.95,
+            "top_k": 40,
+            "max_output_tokens": max_output_tokens,
+            "response_mime_type": "application/json" # Request JSON format if supported
+        }
+        if response_schema is not None:
+            # Constrain decoding to the shape of the response model
+            config["response_schema"] = response_schema
+        return config
+    
+    def _cache_key(
+        self, prompt: str, temperature: float, task: str, response_schema: Optional[Dict[str, Any]]
+    ) -> Tuple[str, Dict[str, Any]]:
+        """
+        Return the response cache key of a request and its generation config.
+        
+        Keys name the task's primary model; responses of the fallback model
+        are not cached under them, see _generate_and_cache().
+        """
+        route = model_router.route(task)
+        generation_config = self._generation_config(temperature, route.max_output_tokens, response_schema)
+        return llm_cache.make_key(route.model_name, prompt, temperature, generation_config), generation_config
+    
+    async def generate_ai_content(
+        self, prompt: str, temperature=0.7, task: str = "default",
+        response_schema: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """Generate content using the model routed for the task, serving repeated requests from the cache"""
+        cache_key, generation_config = self._cache_key(prompt, temperature, task, response_schema)
+        with span("llm.generate", task=task, prompt_chars=len(prompt)) as generation:
+            cached = await llm_cache.get(cache_key)
+            generation.set("cache_hit", cached is not None)
+            if cached is not None:
+                logger.debug("AI response served from cache")
+                generation.set("output_chars", len(cached))
+                return cached
             
-            response = self.model.generate_content(
-                prompt,
-                generation_config=generation_config
+            text = await _inflight_generations.do(
+                cache_key, lambda: self._generate_and_cache(prompt, generation_config, cache_key, task)
+            )
+            generation.set("output_chars", len(text))
+            return text
+    
+    async def _generate_and_cache(self, prompt: str, generation_config: Dict[str, Any], cache_key: str, task: str) -> str:
+        text, route = await self._generate(prompt, generation_config, task)
+        # Unparseable output is not cached, so a retry asks the model again, and neither is
+        # the fallback model's, which would keep being served after the primary recovers
+        if route.tier == "primary" and is_valid_json(text):
+            await llm_cache.set(cache_key, text)
+        return text
+    
+    @retry(
+        retry=retry_if_exception(_is_retryable),
+        stop=stop_after_attempt(3),
+        wait=wait_exponential(multiplier=1, min=2, max=10),
+        before_sleep=_count_retry
+    )
+    async def _generate(self, prompt: str, generation_config: Dict[str, Any], task: str) -> Tuple[str, Route]:
+        """Call the model with retry logic, hedging slow calls when enabled; returns the text and the route that served it"""
+        settings = get_settings()
+        # Route every attempt so retries move to the fallback model once the circuit opens
+        route = model_router.select(task)
+        model_name = route.model_name
+        
+        delay = None
+        if settings.hedging_enabled:
+            delay = latency_tracker.percentile(task, settings.hedge_percentile, settings.hedge_min_samples)
+        if delay is None:
+            return await self._call_model(prompt, generation_config, task, model_name), route
+        
+        text = await hedged_call(
+            lambda started: self._call_model(prompt, generation_config, task, model_name, started),
+            delay,
+            _hedge_budget,
+            task,
+            is_valid_json
+        )
+        return text, route
+    
+    @retry(
+        retry=retry_if_exception(_is_retryable),
+        stop=stop_after_attempt(3),
+        wait=wait_exponential(multiplier=1, min=2, max=10),
+        before_sleep=_count_retry
+    )
+    async def generate_from_cached_content(
+        self, cached_content: Any, model_name: str, context_text: str, context_tokens: int,
+        prompt: str, generation_config: Dict[str, Any], task: str
+    ) -> Tuple[str, Route]:
+        """
+        Generate from a provider-cached context with the quota, retry and circuit handling of _generate().
+        
+        The cached content is bound to its model, so while that model's
+        circuit is open the context text is sent inline to the model the
+        router selects instead. Returns the text and the route that served it.
+        """
+        if model_router.breaker(model_name).allow():
+            route = model_router.route(task)._replace(model_name=model_name)
+            client = genai.GenerativeModel.from_cached_content(cached_content)
+            text = await self._call_model(
+                prompt, generation_config, task, model_name, client=client, context_tokens=context_tokens
             )
+            return text, route
+        
+        route = model_router.select(task)
+        text = await self._call_model(context_text + prompt, generation_config, task, route.model_name)
+        return text, route
+    
+    async def _call_model(
+        self, prompt: str, generation_config: Dict[str, Any], task: str, model_name: str,
+        started: Optional[asyncio.Event] = None, client: Optional[genai.GenerativeModel] = None,
+        context_tokens: int = 0
+    ) -> str:
+        """
+        Send one request to the model, waiting for rate limit quota first.
+        
+        `client` replaces the routed model's client, e.g. one bound to cached
+        content whose `context_tokens` count against the quota as well.
+        """
+        estimated_tokens = estimate_tokens(prompt) + context_tokens
+        
+        for _ in range(get_settings().quota_max_requeues + 1):
+            with span("quota.wait", model=model_name) as quota_wait:
+                quota_wait.set("waited_seconds", await quota_limiter.acquire(model_name, estimated_tokens))
+            try:
+                # Use the native async client so the event loop keeps serving other requests
+                async with get_generation_slots():
+                    if started is not None:
+                        started.set()
+                    call_started = time.monotonic()
+                    with span("llm.call", model=model_name, task=task, prompt_chars=len(prompt)) as call:
+                        response = await (client or self._model(model_name)).generate_content_async(
+                            prompt,
+                            generation_config=generation_config
+                        )
+                        text = response.text
+                        usage = getattr(response, "usage_metadata", None)
+                        call.set("output_chars", len(text))
+                        call.set("tokens_in", getattr(usage, "prompt_token_count", None) or estimated_tokens)
+                        call.set("tokens_out", getattr(usage, "candidates_token_count", None) or estimate_tokens(text))
+            except ResourceExhausted as e:
+                # Queue the call again behind the limiter instead of failing the request
+                await quota_limiter.penalize(model_name, _retry_after(e))
+                continue
+            except SchedulerPreempted:
+                raise
+            except Exception as e:
+                model_router.record_failure(model_name)
+                logger.error(f"AI generation error: {str(e)}")
+                raise HTTPException(status_code=500, detail=f"Error generating content: {str(e)}")
+            
+            latency = time.monotonic() - call_started
+            latency_tracker.record(task, latency)
+            model_router.record_success(model_name, latency)
+            await quota_limiter.record_usage(
+                model_name, estimated_tokens, getattr(usage, "total_token_count", None)
+            )
+            _record_usage(task, usage, estimated_tokens, text)
             
             # Log a truncated version of the response for debugging
-            response_preview = response.text[:200] + "..." if len(response.text) > 200 else response.text
+            response_preview = text[:200] + "..." if len(text) > 200 else text
             logger.debug(f"AI response preview: {response_preview}")
             
-            return response.text
-        except Exception as e:
-            logger.error(f"AI generation error: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Error generating content: {str(e)}")
+            return text
+        
+        logger.error(f"Quota for {model_name} still exhausted after requeueing")
+        raise _quota_exhausted()
+    
+    async def stream_ai_content(
+        self, prompt: str, temperature=0.7, task: str = "default",
+        response_schema: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[str]:
+        """Stream generated text as it arrives; a cached response is replayed as one chunk"""
+        cache_key, generation_config = self._cache_key(prompt, temperature, task, response_schema)
+        cached = await llm_cache.get(cache_key)
+        if cached is not None:
+            logger.debug("AI response served from cache")
+            yield cached
+            return
+        
+        route = model_router.select(task)
+        model_name = route.model_name
+        estimated_tokens = estimate_tokens(prompt)
+        
+        parts = []
+        usage = None
+        for _ in range(get_settings().quota_max_requeues + 1):
+            await quota_limiter.acquire(model_name, estimated_tokens)
+            try:
+                async with get_generation_slots():
+                    call_started = time.monotonic()
+                    response = await self._model(model_name).generate_content_async(
+                        prompt,
+                        generation_config=generation_config,
+                        stream=True
+                    )
+                    async for chunk in response:
+                        # The last chunk carries the usage of the whole response
+                        usage = getattr(chunk, "usage_metadata", None) or usage
+                        try:
+                            text = chunk.text
+                        except ValueError:
+                            # Chunks without text parts only carry finish metadata
+                            continue
+                        if text:
+                            parts.append(text)
+                            yield text
+            except ResourceExhausted as e:
+                await quota_limiter.penalize(model_name, _retry_after(e))
+                if parts:
+                    # The client already has part of this response, so it cannot be requested again
+                    raise _quota_exhausted()
+                # Queue the stream again behind the limiter, as _call_model() does
+                continue
+            except Exception as e:
+                model_router.record_failure(model_name)
+                logger.error(f"AI streaming error: {str(e)}")
+                raise HTTPException(status_code=500, detail=f"Error generating content: {str(e)}")
+            break
+        else:
+            logger.error(f"Quota for {model_name} still exhausted after requeueing")
+            raise _quota_exhausted()
+        
+        latency = time.monotonic() - call_started
+        latency_tracker.record(task, latency)
+        model_router.record_success(model_name, latency)
+        await quota_limiter.record_usage(model_name, estimated_tokens, getattr(usage, "total_token_count", None))
+        text = "".join(parts)
+        _record_usage(task, usage, estimated_tokens, text)
+        if route.tier == "primary" and is_valid_json(text):
+            await llm_cache.set(cache_key, text)
+    
+    async def generate_validated(
+        self, prompt: str, model: Type[BaseModel], task: str = "default", temperature=0.7,
+        check: Optional[Callable[[Dict[str, Any]], List[Path]]] = None
+    ) -> Dict[str, Any]:
+        """
+        Generate JSON constrained to a response model's schema and validate it.
+        
+        Server-assigned fields (IDs, metadata) are left out of the schema and
+        the result. Invalid parts are regenerated on their own, see
+        validate_and_repair().
+        """
+        response_schema = schema_for_model(model)
+        text = await self.generate_ai_content(prompt, temperature, task, response_schema)
+        try:
+            with span("llm.parse", output_chars=len(text)):
+                data = parse_llm_json(text)
+        except json.JSONDecodeError as e:
+            logger.error(f"Failed to parse JSON response: {str(e)}")
+            raise HTTPException(status_code=500, detail="Failed to parse AI response. Please try again.")
+        try:
+            return await self.validate_and_repair(model, data, prompt, task, check)
+        except HTTPException as e:
+            if e.status_code == 500:
+                # Don't serve the same invalid response to the retry the error asks for
+                await llm_cache.delete(self._cache_key(prompt, temperature, task, response_schema)[0])
+            raise
+    
+    async def validate_and_repair(
+        self, model: Type[BaseModel], data: Any, prompt: str, task: str = "default",
+        check: Optional[Callable[[Dict[str, Any]], List[Path]]] = None
+    ) -> Dict[str, Any]:
+        """
+        Validate generated data in one pass and re-request only its invalid subtrees.
+        
+        `check` may report additional invalid subtrees that the schema cannot
+        express. Raises a 500 when the data is still invalid after the
+        configured number of repair rounds.
+        """
+        with span("schema.validate", model=model.__name__) as validation:
+            for round_number in range(get_settings().structured_output_repair_rounds + 1):
+                subtrees = invalid_subtrees(model, data)
+                if not subtrees and check is not None:
+                    subtrees = {path: ["value is inconsistent"] for path in check(data)}
+                if not subtrees:
+                    # Normalize types and drop keys the schema does not know
+                    return draft_model(model).model_validate(data).model_dump()
+                if () in subtrees or not isinstance(data, dict):
+                    break
+                if round_number == get_settings().structured_output_repair_rounds:
+                    break
+                
+                logger.warning(f"Regenerating invalid parts of {model.__name__}: {', '.join(format_path(p) for p in subtrees)}")
+                validation.set("repair_rounds", round_number + 1)
+                validation.add("repaired_subtrees", len(subtrees))
+                repaired = await asyncio.gather(*(
+                    self._repair_subtree(model, data, path, errors, prompt, task)
+                    for path, errors in subtrees.items()
+                ))
+                for path, value in zip(subtrees, repaired):
+                    set_path(data, path, value)
+            
+            remaining = invalid_subtrees(model, data)
+            validation.set("invalid_subtrees", len(remaining))
+            errors = [message for messages in remaining.values() for message in messages]
+            logger.error(f"AI response failed validation: {errors[:5]}")
+            raise HTTPException(status_code=500, detail="AI response did not match the expected format. Please try again.")
+    
+    async def _repair_subtree(
+        self, model: Type[BaseModel], data: Dict[str, Any], path: Path,
+        errors: List[str], prompt: str, task: str
+    ) -> Any:
+        repair_prompt = self.create_repair_prompt(prompt, format_path(path), get_path(data, path), errors)
+        text = await self.generate_ai_content(repair_prompt, 0.4, task, schema_at(model, path))
+        try:
+            return parse_llm_json(text)
+        except json.JSONDecodeError:
+            # Leave the part invalid; the next validation round reports it
+            return get_path(data, path)
     
     async def generate_structured_content(self, prompt: str) -> Dict[str, Any]:
         """Generate content and parse it as JSON"""
         try:
             response = await self.generate_ai_content(prompt)
-            
-            # Clean the response to extract JSON
-            if "```" in response:
-                json_match = re.search(r'```(?:json)?(.*?)```', response, re.DOTALL)
-                if json_match:
-                    response = json_match.group(1).strip()
-                
-            return json.loads(response.strip())
+            return parse_llm_json(response)
         except json.JSONDecodeError as e:
             raise HTTPException(status_code=500, detail=f"Invalid JSON response: {str(e)}")
     
+    def create_repair_prompt(self, prompt: str, path: str, value: Any, errors: List[str]) -> str:
+        """Create a prompt that regenerates one invalid part of an earlier response"""
+        return f"""
+        The response to the request below was valid except for the part at `{path}`.
+        
+        # ORIGINAL REQUEST
+        {prompt}
+        
+        # INVALID PART
+        {json.dumps(value, indent=2)}
+        
+        # VALIDATION ERRORS
+        {chr(10).join(f"- {error}" for error in errors)}
+        
+        Return only a corrected, complete value for `{path}` that fits the original request.
+        """
+    
     def create_course_planning_prompt(self, request) -> str:
         """Create a detailed prompt for course planning"""
         objectives_text = "\n".join([f"- {obj}" for obj in request.learning_objectives]) if request.learning_objectives else "No specific objectives provided."
@@ -115,57 +499,7 @@ class AIServiceV2:
         If resources are requested, recommend 5-8 high-quality learning resources (books, articles, videos, etc.)
         that supplement the course material.
         
-        Format the response as a structured JSON object with EXACTLY this structure:
-        ```json
-        {{
-          "course_title": "The title of the course",
-          "course_description": "A comprehensive description of the course",
-          "course_introduction": "An introduction to the course that spans multiple paragraphs",
-          "learning_outcomes": [
-            "Outcome 1: Learn something important",
-            "Outcome 2: Master a specific skill",
-            "Outcome 3: Apply knowledge in real-world contexts"
-          ],
-          "prerequisites": [
-            "Prerequisite 1",
-            "Prerequisite 2"
-          ],
-          "target_audience_description": "Detailed description of target audience",
-          "estimated_total_duration": "X weeks, Y hours per week",
-          "modules": [
-            {{
-              "module_title": "Title of Module 1",
-              "module_summary": "Summary of what module 1 covers",
-              "estimated_duration": "X hours",
-              "key_concepts": [
-                "Concept 1",
-                "Concept 2",
-                "Concept 3"
-              ]
-            }},
-            {{
-              "module_title": "Title of Module 2",
-              "module_summary": "Summary of what module 2 covers",
-              "estimated_duration": "Y hours",
-              "key_concepts": [
-                "Concept 1",
-                "Concept 2",
-                "Concept 3"
-              ]
-            }}
-          ],
-          "recommended_resources": [
-            {{
-              "title": "Resource Title",
-              "description": "Brief description of the resource",
-              "type": "book/article/video/website",
-              "url": "http://example.com/resource"
-            }}
-          ]
-        }}
-        ```
-        
-        IMPORTANT: Follow the EXACT format above, with all required fields. Each module MUST have module_title, module_summary, estimated_duration, and key_concepts fields.
+        Respond with a JSON object that follows the provided response schema. Include recommended_resources only if resources are requested.
         """
     
     def create_module_planning_prompt(self, request, course_context: Dict) -> str:
@@ -211,53 +545,7 @@ class AIServiceV2:
         
         Include 3-5 high-quality recommended resources that specifically support this module's content.
         
-        Format the response as a structured JSON object with EXACTLY this structure:
-        ```json
-        {{
-          "module_introduction": "A compelling introduction to the module...",
-          "learning_path": "Description of how the concepts build upon each other...",
-          "lessons": [
-            {{
-              "lesson_title": "Title of Lesson 1",
-              "lesson_objective": "Specific objective for lesson 1",
-              "estimated_duration": "30-45 minutes",
-              "key_points": [
-                "Key point 1",
-                "Key point 2",
-                "Key point 3"
-              ]
-            }},
-            {{
-              "lesson_title": "Title of Lesson 2",
-              "lesson_objective": "Specific objective for lesson 2",
-              "estimated_duration": "45-60 minutes",
-              "key_points": [
-                "Key point 1",
-                "Key point 2",
-                "Key point 3"
-              ]
-            }}
-          ],
-          "activities": [
-            {{
-              "activity_title": "Title of Activity 1",
-              "activity_type": "exercise",
-              "activity_description": "Description of the activity",
-              "estimated_duration": "20 minutes"
-            }}
-          ],
-          "resources": [
-            {{
-              "title": "Resource Title",
-              "description": "Description of the resource",
-              "type": "book/article/video",
-              "url": "http://example.com/resource"
-            }}
-          ]
-        }}
-        ```
-        
-        IMPORTANT: Follow the EXACT format above, with all required fields. Each lesson MUST include lesson_title, lesson_objective, estimated_duration, and key_points (as an array).
+        Respond with a JSON object that follows the provided response schema.
         """
     
     def create_lesson_content_prompt(self, request, module_context: Dict) -> str:
@@ -305,40 +593,7 @@ class AIServiceV2:
         
         6. 2-4 recommended resources for further exploration
         
-        You MUST format the response as a valid JSON object with the following structure:
-        {{
-          "lesson_title": "{request.lesson_title}",
-          "introduction": "An engaging introduction to the lesson...",
-          "sections": [
-            {{
-              "heading": "First Section Heading",
-              "content": "Detailed content for the first section...",
-              "importance": 2
-            }},
-            {{
-              "heading": "Second Section Heading",
-              "content": "Detailed content for the second section...",
-              "importance": 3
-            }}
-          ],
-          "summary": "A concise summary of the lesson...",
-          "reflection_questions": [
-            "First reflection question?",
-            "Second reflection question?",
-            "Third reflection question?"
-          ],
-          "next_steps": "Guidance on how to apply or extend the learning...",
-          "resources": [
-            {{
-              "title": "Resource Title",
-              "description": "Description of the resource",
-              "type": "book/article/video",
-              "url": "http://example.com/resource"
-            }}
-          ]
-        }}
-        
-        CRITICAL: The response MUST be a valid JSON object that can be directly parsed. Do not include any explanation or markdown formatting outside the JSON structure. Ensure ALL required fields are included with appropriate values.
+        Respond with a JSON object that follows the provided response schema. Use "{request.lesson_title}" as the lesson_title and rate each section's importance from 1 to 3.
         """
     
     def create_quiz_prompt(self, request, lesson_context: Dict) -> str:
@@ -383,28 +638,5 @@ class AIServiceV2:
         
         Set an appropriate passing score based on the quiz difficulty.
         
-        You MUST format the response as a valid JSON object with the following structure:
-        {{
-          "quiz_introduction": "A brief introduction to the quiz...",
-          "questions": [
-            {{
-              "question": "First question text?",
-              "options": ["A. First option", "B. Second option", "C. Third option", "D. Fourth option"],
-              "correct_answer": "B. Second option",
-              "explanation": "Explanation of why B is correct...",
-              "difficulty": "medium"
-            }},
-            {{
-              "question": "Second question text?",
-              "options": ["A. First option", "B. Second option", "C. Third option", "D. Fourth option"],
-              "correct_answer": "A. First option",
-              "explanation": "Explanation of why A is correct...",
-              "difficulty": "easy"
-            }}
-          ],
-          "passing_score": 80,
-          "difficulty_level": "{difficulty}"
-        }}
-        
-        CRITICAL: The response MUST be a valid JSON object that can be directly parsed. Do not include any explanation or markdown formatting outside the JSON structure. Ensure ALL required fields are included with appropriate values.
+        Respond with a JSON object that follows the provided response schema. The correct_answer must repeat one of the options exactly, and difficulty_level must be "{difficulty}".
         """
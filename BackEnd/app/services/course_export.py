@@ -0,0 +1,315 @@
+import hashlib
+import html
+import logging
+import os
+import uuid
+from typing import AsyncIterator, Dict, List, NamedTuple, Optional, Tuple
+
+import aiofiles
+
+from app.config import get_settings
+from app.services.course_tree import (
+    children, course_store, get_full, latest_by_title, lesson_store, module_store, quiz_store, subtree_edges
+)
+from app.services.lms_package import package_course
+from app.utils.metrics import metrics
+from app.utils.pdf import StreamingPDFWriter
+
+logger = logging.getLogger("course_export")
+
+course_exports = metrics.counter(
+    "course_exports_total", "Course exports by format and whether they were served from the export cache",
+    ("format", "result")
+)
+
+# Bump when the rendered output changes so cached exports are not served
+_RENDER_VERSION = "1"
+
+class ExportFormat(NamedTuple):
+    media_type: str
+    extension: str
+    # LMS packages are streamed straight from the tree without touching the disk
+    cached: bool = True
+
+EXPORT_FORMATS: Dict[str, ExportFormat] = {
+    "md": ExportFormat("text/markdown; charset=utf-8", "md"),
+    "html": ExportFormat("text/html; charset=utf-8", "html"),
+    "pdf": ExportFormat("application/pdf", "pdf"),
+    "scorm12": ExportFormat("application/zip", "zip", cached=False),
+    "scorm2004": ExportFormat("application/zip", "zip", cached=False),
+    "imscc": ExportFormat("application/zip", "imscc", cached=False),
+}
+
+# A rendered course is a sequence of (kind, text) blocks: title, h1-h3, p, li and page breaks
+Block = Tuple[str, str]
+
+def _paragraphs(text: Optional[str]) -> List[Block]:
+    return [("p", part.strip()) for part in (text or "").split("\n\n") if part.strip()]
+
+def _items(items: Optional[List[str]]) -> List[Block]:
+    return [("li", item) for item in items or []]
+
+async def _lesson_blocks(lesson_id: str, number: str, info: dict) -> AsyncIterator[Block]:
+    yield ("h2", f"Lesson {number}: {info['lesson_title']}")
+    lesson = await get_full(lesson_store, lesson_id, "lesson") if lesson_id else None
+    if lesson is None:
+        # Only planned so far
+        for block in [("p", info.get("lesson_objective", ""))] + _items(info.get("key_points")):
+            yield block
+        return
+
+    for block in _paragraphs(lesson["introduction"]):
+        yield block
+    for section in lesson["sections"]:
+        yield ("h3", section["heading"])
+        for block in _paragraphs(section["content"]):
+            yield block
+    yield ("h3", "Summary")
+    for block in _paragraphs(lesson["summary"]) + [("h3", "Reflection questions")] + _items(lesson["reflection_questions"]):
+        yield block
+    yield ("h3", "Next steps")
+    for block in _paragraphs(lesson["next_steps"]):
+        yield block
+
+    quizzes = await children(lesson_id)
+    quiz = await get_full(quiz_store, quizzes[-1]["id"], "quiz") if quizzes else None
+    if quiz is not None:
+        yield ("h3", "Quiz")
+        for block in _paragraphs(quiz["quiz_introduction"]):
+            yield block
+        for i, question in enumerate(quiz["questions"], 1):
+            yield ("p", f"{i}. {question['question']}")
+            for block in _items(question["options"]):
+                yield block
+            yield ("p", f"Answer: {question['correct_answer']}. {question.get('explanation') or ''}".strip())
+
+async def course_blocks(course_id: str, record: dict) -> AsyncIterator[Block]:
+    """
+    Walk a course tree in reading order, loading one module or lesson at a time.
+
+    Each planned module and lesson is matched by title to its most recent
+    generation; items that were only planned are rendered from the plan.
+    """
+    # Courses stored before full plans were kept only have their context fields
+    course = record.get("course") or record
+    yield ("title", course["course_title"])
+    for block in _paragraphs(course["course_description"]) + _paragraphs(course.get("course_introduction")):
+        yield block
+    if course.get("learning_outcomes"):
+        yield ("h2", "Learning outcomes")
+        for block in _items(course["learning_outcomes"]):
+            yield block
+    if course.get("prerequisites"):
+        yield ("h2", "Prerequisites")
+        for block in _items(course["prerequisites"]):
+            yield block
+
+    module_plans = latest_by_title(await children(course_id))
+    for i, info in enumerate(course.get("modules") or [], 1):
+        yield ("break", "")
+        yield ("h1", f"Module {i}: {info['module_title']}")
+        for block in _paragraphs(info["module_summary"]):
+            yield block
+
+        module_id = module_plans.get(info["module_title"])
+        module = await get_full(module_store, module_id, "module") if module_id else None
+        if module is None:
+            yield ("h2", "Key concepts")
+            for block in _items(info.get("key_concepts")):
+                yield block
+            continue
+
+        for block in _paragraphs(module["module_introduction"]):
+            yield block
+        lesson_ids = latest_by_title(await children(module_id))
+        for j, lesson_info in enumerate(module["lessons"], 1):
+            async for block in _lesson_blocks(lesson_ids.get(lesson_info["lesson_title"]), f"{i}.{j}", lesson_info):
+                yield block
+        if module.get("activities"):
+            yield ("h2", "Activities")
+            for activity in module["activities"]:
+                yield ("li", f"{activity['activity_title']} ({activity['activity_type']}): {activity['activity_description']}")
+
+    if course.get("recommended_resources"):
+        yield ("break", "")
+        yield ("h1", "Recommended resources")
+        for resource in course["recommended_resources"]:
+            yield ("li", f"{resource['title']}: {resource['description']}" + (f" {resource['url']}" if resource.get("url") else ""))
+
+class MarkdownRenderer:
+    _PREFIXES = {"title": "# ", "h1": "## ", "h2": "### ", "h3": "#### "}
+
+    def __init__(self, title: str):
+        self._in_list = False
+
+    def start(self) -> bytes:
+        return b""
+
+    def block(self, kind: str, text: str) -> bytes:
+        if kind == "break":
+            return b""
+        out = "\n" if self._in_list and kind != "li" else ""
+        self._in_list = kind == "li"
+        if kind == "li":
+            out += f"- {text}\n"
+        else:
+            out += f"{self._PREFIXES.get(kind, '')}{text}\n\n"
+        return out.encode("utf-8")
+
+    def finish(self) -> bytes:
+        return b""
+
+class HTMLRenderer:
+    _TAGS = {"title": "h1", "h1": "h2", "h2": "h3", "h3": "h4", "p": "p"}
+    _STYLE = (
+        "body{font-family:system-ui,sans-serif;max-width:48rem;margin:2rem auto;padding:0 1rem;line-height:1.6}"
+        "h2{margin-top:2.5rem;border-bottom:1px solid #ddd}"
+    )
+
+    def __init__(self, title: str):
+        self.title = title
+        self._in_list = False
+
+    def start(self) -> bytes:
+        return (
+            f"<!DOCTYPE html>\n<html lang=\"en\">\n<head>\n<meta charset=\"utf-8\">\n"
+            f"<title>{html.escape(self.title)}</title>\n<style>{self._STYLE}</style>\n</head>\n<body>\n"
+        ).encode("utf-8")
+
+    def block(self, kind: str, text: str) -> bytes:
+        out = ""
+        if self._in_list and kind != "li":
+            out += "</ul>\n"
+        elif not self._in_list and kind == "li":
+            out += "<ul>\n"
+        self._in_list = kind == "li"
+        if kind == "li":
+            out += f"<li>{html.escape(text)}</li>\n"
+        elif kind != "break":
+            tag = self._TAGS.get(kind, "p")
+            out += f"<{tag}>{html.escape(text).replace(chr(10), '<br>')}</{tag}>\n"
+        return out.encode("utf-8")
+
+    def finish(self) -> bytes:
+        return (b"</ul>\n" if self._in_list else b"") + b"</body>\n</html>\n"
+
+class PDFRenderer:
+    def __init__(self, title: str):
+        self.writer = StreamingPDFWriter(title)
+
+    def start(self) -> bytes:
+        return self.writer.start()
+
+    def block(self, kind: str, text: str) -> bytes:
+        if kind == "break":
+            return self.writer.page_break()
+        return b"".join(self.writer.add(kind, line) for line in text.split("\n"))
+
+    def finish(self) -> bytes:
+        return self.writer.finish()
+
+_RENDERERS = {"md": MarkdownRenderer, "html": HTMLRenderer, "pdf": PDFRenderer}
+
+async def render_course(course_id: str, record: dict, format: str) -> AsyncIterator[bytes]:
+    """Render a course in chunks of about EXPORT_CHUNK_BYTES as its tree is walked"""
+    chunk_bytes = get_settings().export_chunk_bytes
+    course = record.get("course") or record
+    renderer = _RENDERERS[format](course["course_title"])
+
+    buffer = bytearray(renderer.start())
+    async for kind, text in course_blocks(course_id, record):
+        buffer += renderer.block(kind, text)
+        if len(buffer) >= chunk_bytes:
+            yield bytes(buffer)
+            buffer.clear()
+    buffer += renderer.finish()
+    yield bytes(buffer)
+
+class CourseExporter:
+    """
+    Streams course exports and caches them on disk by content hash.
+
+    Every item of a course tree is immutable, so the set of edges under a
+    course identifies its content. The hash of those edges names the
+    cached file; an unchanged course is served from the file with no
+    rendering, and adding a module, lesson or quiz changes the hash.
+    LMS packages are not cached; the hash only serves as their ETag.
+    """
+
+    def __init__(self):
+        settings = get_settings()
+        self.directory = settings.export_cache_dir
+        self.max_bytes = settings.export_cache_max_bytes
+
+    async def content_hash(self, course_id: str, format: str) -> str:
+        edges = sorted(await subtree_edges(course_id))
+        payload = "\n".join([_RENDER_VERSION, format, course_id] + edges)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, content_hash: str, format: str) -> str:
+        return os.path.join(self.directory, f"{content_hash}.{EXPORT_FORMATS[format].extension}")
+
+    async def export(self, course_id: str, format: str, content_hash: str) -> Optional[AsyncIterator[bytes]]:
+        """Return the export as a stream of chunks, or None when the course does not exist"""
+        record = await course_store.get(course_id)
+        if record is None:
+            return None
+
+        if not EXPORT_FORMATS[format].cached:
+            course_exports.inc(format=format, result="uncached")
+            return package_course(course_id, record, format)
+
+        path = self._path(content_hash, format)
+        if os.path.exists(path):
+            course_exports.inc(format=format, result="hit")
+            return self._read(path)
+        course_exports.inc(format=format, result="miss")
+        return self._render_and_cache(course_id, record, format, path)
+
+    async def _read(self, path: str) -> AsyncIterator[bytes]:
+        chunk_bytes = get_settings().export_chunk_bytes
+        async with aiofiles.open(path, "rb") as f:
+            while True:
+                chunk = await f.read(chunk_bytes)
+                if not chunk:
+                    return
+                yield chunk
+
+    async def _render_and_cache(self, course_id: str, record: dict, format: str, path: str) -> AsyncIterator[bytes]:
+        os.makedirs(self.directory, exist_ok=True)
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        completed = False
+        try:
+            async with aiofiles.open(temp_path, "wb") as f:
+                async for chunk in render_course(course_id, record, format):
+                    await f.write(chunk)
+                    yield chunk
+            # Readers only ever see complete files
+            os.replace(temp_path, path)
+            completed = True
+        finally:
+            if not completed and os.path.exists(temp_path):
+                # The client went away or rendering failed
+                os.remove(temp_path)
+        self._prune()
+
+    def _prune(self):
+        """Delete the least recently written exports beyond the size limit"""
+        try:
+            extensions = tuple(f".{export_format.extension}" for export_format in EXPORT_FORMATS.values() if export_format.cached)
+            entries = [entry for entry in os.scandir(self.directory) if entry.name.endswith(extensions)]
+            files = sorted(((entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in entries), reverse=True)
+        except OSError as e:
+            logger.warning(f"Could not list the export cache: {str(e)}")
+            return
+        total = 0
+        for _, size, path in files:
+            total += size
+            if total > self.max_bytes:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+# Shared exporter for this process
+course_exporter = CourseExporter()
@@ -0,0 +1,46 @@
+import time
+from typing import Any, Dict, List, Optional
+
+from app.services.repository import get_repository
+
+# Every generated item, with the context its follow-up requests need and the
+# full response. Shared by all workers.
+course_store = get_repository("courses")
+module_store = get_repository("modules")
+lesson_store = get_repository("lessons")
+quiz_store = get_repository("quizzes")
+
+# Edges from each item to the items generated from it, keyed "<parent_id>/<child_id>"
+course_tree = get_repository("course_tree")
+
+async def add_child(parent_id: str, child_id: str, title: str):
+    """Record that an item was generated for a parent, e.g. a module plan for a course"""
+    await course_tree.set(f"{parent_id}/{child_id}", {"title": title, "created_at": time.time()})
+
+async def children(parent_id: str) -> List[Dict[str, Any]]:
+    """Items generated for a parent, oldest first"""
+    edges = await course_tree.items(f"{parent_id}/")
+    items = [{"id": key.split("/", 1)[1], **edge} for key, edge in edges]
+    return sorted(items, key=lambda item: item["created_at"])
+
+def latest_by_title(items: List[Dict[str, Any]]) -> Dict[str, str]:
+    """Map each title to the ID of its most recent generation"""
+    return {item["title"]: item["id"] for item in items}
+
+async def subtree_edges(root_id: str, depth: int = 3) -> List[str]:
+    """Keys of every edge below an item; items never change, so these identify the subtree's content"""
+    edges: List[str] = []
+    frontier = [root_id]
+    for _ in range(depth):
+        next_frontier: List[str] = []
+        for parent_id in frontier:
+            for key, _ in await course_tree.items(f"{parent_id}/"):
+                edges.append(key)
+                next_frontier.append(key.split("/", 1)[1])
+        frontier = next_frontier
+    return edges
+
+async def get_full(store, item_id: str, field: str) -> Optional[Dict[str, Any]]:
+    """The full response stored with an item, if it has one"""
+    record = await store.get(item_id)
+    return record.get(field) if record else None
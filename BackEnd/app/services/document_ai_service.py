@@ -2,11 +2,17 @@ from typing import Dict, Any, List, Optional
 import json
 from fastapi import HTTPException
 
+from app.config import get_settings
 from app.services.ai_service import AIService
-from app.models.document import DocumentContent
+from app.services.document_processing_service import DocumentProcessingService
+from app.services.document_context_cache import document_context_cache, DocumentContext
+from app.services.model_router import model_router
+from app.models.document import DocumentContent, DocumentChunk
 from app.models.course import CourseResponse, ModuleInfo
 from app.models.module import ModuleResponse, LessonInfo
 from app.models.lesson import LessonResponse, QuizQuestion
+from app.utils.json_parser import parse_llm_json
+from app.utils.tokens import pack_by_score, pack_spread
 
 class DocumentAIService:
     """Service for generating educational content based on document content."""
@@ -14,6 +20,7 @@ class DocumentAIService:
     def __init__(self):
         """Initialize the document AI service."""
         self.ai_service = AIService()
+        self.processing_service = DocumentProcessingService()
     
     async def generate_course_from_document(
         self, document: DocumentContent, additional_context: Optional[str] = None
@@ -28,36 +35,18 @@ class DocumentAIService:
         Returns:
             A complete course structure including modules
         """
-        # Extract key information from the document
-        doc_content = document.content
-        doc_structure = document.structure
-        doc_metadata = document.metadata
-        
-        # Use the first 10000 characters of content for the initial course generation (to avoid token limits)
-        context_text = doc_content[:10000]
-        
-        # For PDF or PPTX with many headings, summarize the structure
-        structure_text = ""
-        if doc_structure and len(doc_structure) > 0:
-            headings = [item.heading for item in doc_structure[:20]]  # Get first 20 headings
-            structure_text = "\nDocument structure includes these key topics:\n" + "\n".join(
-                [f"- {heading}" for heading in headings]
-            )
+        # Register the document once; module, lesson and quiz calls reuse its context
+        context = await self._get_context(document)
+        use_provider_cache = self._uses_provider_cache(context)
+        # Without the provider cache, sample the whole document within the course budget
+        document_sample = "" if use_provider_cache else self._sample_content(document)
         
         additional_instructions = additional_context if additional_context else ""
         
         # Create prompt for course generation
         prompt = f"""
-        Generate a comprehensive course based on the following document content.
-        
-        DOCUMENT TITLE: {doc_metadata.title}
-        DOCUMENT AUTHOR: {doc_metadata.author}
-        
-        DOCUMENT CONTENT:
-        {context_text}
-        
-        {structure_text}
-        
+        Generate a comprehensive course based on the document provided above.
+        {document_sample}
         {additional_instructions}
         
         Create a structured course with the following:
@@ -88,7 +77,7 @@ class DocumentAIService:
         
         try:
             # Generate course structure using AI
-            course_json = await self.ai_service.generate_structured_content(prompt)
+            course_json = await self._generate_with_context(context, prompt, use_provider_cache)
             
             # Add module_id to each module
             from app.utils.id_generator import generate_id
@@ -144,19 +133,21 @@ class DocumentAIService:
         
         # Extract relevant content for this module based on module title
         module_title = module_info.get("module_title", "")
-        module_relevant_content = self._extract_relevant_content(document, module_title)
+        context = await self._get_context(document)
+        use_provider_cache = self._uses_provider_cache(context)
+        module_relevant_content = self._extract_relevant_content(
+            document, module_title, "module", context if use_provider_cache else None
+        )
         
         additional_instructions = additional_context if additional_context else ""
         
         # Create prompt for module generation
         prompt = f"""
-        Generate a detailed module for a course based on the following document content.
+        Generate a detailed module for a course based on the document provided above.
         
         COURSE TITLE: {course_info.get("course_title", "")}
         MODULE TITLE: {module_title}
         MODULE SUMMARY: {module_info.get("module_summary", "")}
-        
-        RELEVANT DOCUMENT CONTENT:
         {module_relevant_content}
         
         {additional_instructions}
@@ -189,7 +180,7 @@ class DocumentAIService:
         
         try:
             # Generate module structure using AI
-            module_json = await self.ai_service.generate_structured_content(prompt)
+            module_json = await self._generate_with_context(context, prompt, use_provider_cache)
             
             # Add lesson_id to each lesson
             from app.utils.id_generator import generate_id
@@ -249,21 +240,21 @@ class DocumentAIService:
         lesson_title = lesson_info.get("lesson_title", "")
         module_title = module_info.get("module_title", "")
         
+        context = await self._get_context(document)
+        use_provider_cache = self._uses_provider_cache(context)
         lesson_relevant_content = self._extract_relevant_content(
-            document, f"{module_title} {lesson_title}"
+            document, f"{module_title} {lesson_title}", "lesson", context if use_provider_cache else None
         )
         
         additional_instructions = additional_context if additional_context else ""
         
         # Create prompt for lesson generation
         prompt = f"""
-        Generate a comprehensive lesson for a course module based on the following document content.
+        Generate a comprehensive lesson for a course module based on the document provided above.
         
         MODULE TITLE: {module_title}
         LESSON TITLE: {lesson_title}
         LESSON SUMMARY: {lesson_info.get("lesson_summary", "")}
-        
-        RELEVANT DOCUMENT CONTENT:
         {lesson_relevant_content}
         
         {additional_instructions}
@@ -302,7 +293,7 @@ class DocumentAIService:
         
         try:
             # Generate lesson structure using AI
-            lesson_json = await self.ai_service.generate_structured_content(prompt)
+            lesson_json = await self._generate_with_context(context, prompt, use_provider_cache)
             
             # Convert quiz questions to the expected format
             quiz_questions = []
@@ -391,19 +382,21 @@ Summary:
             lesson_content = "\n\n".join([part for part in lesson_parts if part])
         
         # Extract relevant content for this quiz
-        relevant_content = self._extract_relevant_content(document, lesson_title)
+        context = await self._get_context(document)
+        use_provider_cache = self._uses_provider_cache(context)
+        relevant_content = self._extract_relevant_content(
+            document, lesson_title, "quiz", context if use_provider_cache else None
+        )
         
         additional_instructions = additional_context if additional_context else ""
         
         # Create prompt for quiz generation
         prompt = f"""
-        Generate a comprehensive quiz based on the following lesson content.
+        Generate a comprehensive quiz based on the following lesson content and the document provided above.
         
         LESSON TITLE: {lesson_title}
         LESSON CONTENT: 
         {lesson_content}
-        
-        RELEVANT DOCUMENT CONTENT:
         {relevant_content}
         
         {additional_instructions}
@@ -435,7 +428,7 @@ Summary:
         
         try:
             # Generate quiz questions using AI
-            quiz_json = await self.ai_service.generate_structured_content(prompt)
+            quiz_json = await self._generate_with_context(context, prompt, use_provider_cache)
             
             # Convert to expected format
             quiz_questions = []
@@ -454,50 +447,84 @@ Summary:
                 status_code=500, detail=f"Error generating quiz from document: {str(e)}"
             )
     
-    def _extract_relevant_content(self, document: DocumentContent, topic: str) -> str:
+    def _get_chunks(self, document: DocumentContent) -> List[DocumentChunk]:
+        """Return the token-counted chunks of a document, chunking it once if needed."""
+        if not document.chunks and document.content:
+            document.chunks = self.processing_service.chunk_content(document.content)
+        return document.chunks
+    
+    async def _get_context(self, document: DocumentContent) -> DocumentContext:
+        """Return the registered context of a document, registering it on first use."""
+        return await document_context_cache.register(document, self._get_chunks(document))
+    
+    def _uses_provider_cache(self, context: DocumentContext) -> bool:
+        """Whether prompts for this context can reference the provider-cached document right now"""
+        return context.is_cached and model_router.breaker(context.model_name).allow()
+    
+    async def _generate_with_context(self, context: DocumentContext, prompt: str, use_provider_cache: bool) -> Any:
         """
-        Extract content relevant to a specific topic from the document.
+        Generate structured content for a prompt that refers to the document context.
         
-        This is a basic implementation that could be enhanced with more sophisticated
-        semantic search or text chunking/embedding techniques.
+        Provider-cached contexts are referenced instead of resent; otherwise
+        only the document header is sent ahead of the prompt, which carries
+        its own excerpts, through the agent.
+        """
+        if use_provider_cache:
+            return parse_llm_json(await document_context_cache.generate(context, prompt))
+        return await self.ai_service.generate_structured_content(context.header + prompt, task="document")
+    
+    def _sample_content(self, document: DocumentContent) -> str:
+        """Prompt section sampling the whole document within the course token budget"""
+        chunks = self._get_chunks(document)
+        selected = pack_spread([chunk.token_count for chunk in chunks], self._context_budget("course"))
+        if not selected:
+            return ""
+        sample = "\n\n".join(chunks[i].text(document.content) for i in selected)
+        return f"\n        DOCUMENT CONTENT:\n{sample}\n"
+    
+    def _context_budget(self, task: str) -> int:
+        """Token budget for document content in a prompt for the given task."""
+        return get_settings().document_context_budgets.get(task, 3000)
+    
+    def _extract_relevant_content(
+        self, document: DocumentContent, topic: str, task: str, context: Optional[DocumentContext]
+    ) -> str:
+        """
+        Extract content relevant to a specific topic that the document context lacks.
+        
+        Chunks are scored by the number of topic keywords they contain and the
+        best ones not already in the registered context are packed into the
+        token budget of the task.
         
         Args:
             document: The processed document
             topic: The topic to find relevant content for
+            task: The generation task whose token budget applies
+            context: The provider-cached context of the document, whose chunks are
+                already available to the model, or None when it is not used
             
         Returns:
-            String containing the most relevant content
+            Prompt section with the relevant excerpts, empty when the context covers them
         """
-        # Simple approach: split document by paragraphs and find those containing keywords
-        content = document.content
-        paragraphs = content.split('\n\n')
+        chunks = self._get_chunks(document)
+        token_counts = [chunk.token_count for chunk in chunks]
+        budget = self._context_budget(task)
         
         # Extract keywords from topic
         keywords = topic.lower().split()
         
-        # Score paragraphs based on keyword matches
-        relevant_paragraphs = []
-        for paragraph in paragraphs:
-            paragraph_lower = paragraph.lower()
-            score = sum(1 for keyword in keywords if keyword in paragraph_lower)
-            if score > 0:
-                relevant_paragraphs.append((paragraph, score))
-        
-        # Sort by relevance score
-        relevant_paragraphs.sort(key=lambda x: x[1], reverse=True)
-        
-        # Get top paragraphs (up to 5000 characters)
-        result = ""
-        char_count = 0
-        for paragraph, _ in relevant_paragraphs:
-            if char_count + len(paragraph) > 5000:
-                break
-            result += paragraph + "\n\n"
-            char_count += len(paragraph) + 2
-        
-        # If we have too little content, add some general content from the beginning of the document
-        if char_count < 1000:
-            general_content = content[:5000 - char_count]
-            result += "\n\nAdditional document content:\n\n" + general_content
-        
-        return result
+        # Score chunks based on keyword matches
+        scores = []
+        for i, chunk in enumerate(chunks):
+            if context is not None and i in context.chunk_ids:
+                scores.append(0)
+                continue
+            chunk_lower = chunk.text(document.content).lower()
+            scores.append(sum(1 for keyword in keywords if keyword in chunk_lower))
+        
+        selected = pack_by_score(token_counts, scores, budget)
+        if not selected:
+            return ""
+        
+        relevant = "\n\n".join(chunks[i].text(document.content) for i in sorted(selected))
+        return f"\n        RELEVANT DOCUMENT CONTENT:\n{relevant}\n"
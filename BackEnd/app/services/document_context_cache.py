@@ -0,0 +1,210 @@
+import asyncio
+import logging
+import time
+from datetime import timedelta
+from typing import Any, Dict, List, Optional, Set
+
+from google.generativeai import caching
+
+from app.config import get_settings
+from app.models.document import DocumentContent, DocumentChunk
+from app.services.ai_service_v2 import AIServiceV2
+from app.services.llm_cache import llm_cache
+from app.services.model_router import model_router
+from app.services.single_flight import SingleFlight
+from app.utils.metrics import metrics
+from app.utils.json_parser import is_valid_json
+from app.utils.lru import ByteLRU
+from app.utils.tokens import estimate_tokens, pack_spread
+
+logger = logging.getLogger("document_context_cache")
+
+document_contexts = metrics.counter(
+    "document_context_registrations_total", "Document contexts registered by backend", ("backend",)
+)
+
+_SYSTEM_INSTRUCTION = (
+    "You are an expert instructional designer. The cached document is the source material "
+    "for a course; base every answer on it and respond with JSON only."
+)
+
+class DocumentContext:
+    """The stable text of one document, registered once and referenced by later prompts"""
+
+    def __init__(self, document_id: str, header: str, text: str, tokens: int, chunk_ids: List[int]):
+        self.document_id = document_id
+        # Title, author and outline, small enough to send with every prompt
+        self.header = header
+        self.text = text
+        self.tokens = tokens
+        # Chunks included in the context text; prompts only add excerpts from the others
+        self.chunk_ids = set(chunk_ids)
+        self.cached_content: Optional[caching.CachedContent] = None
+        self.model_name: Optional[str] = None
+        self.expires_at = 0.0
+
+    @property
+    def is_cached(self) -> bool:
+        """Whether the provider holds the context and prompts may omit it"""
+        return self.cached_content is not None and time.time() < self.expires_at
+
+def _sizeof(context: DocumentContext) -> int:
+    # Local contexts are only the header
+    if context.text is context.header:
+        return len(context.text)
+    return len(context.text) + len(context.header)
+
+class DocumentContextCache:
+    """
+    Registers each document's stable text once and serves prompts that refer to it.
+
+    Documents large enough for the provider's cached-content feature are
+    uploaded once as a CachedContent, and later prompts only carry their
+    task instructions. Smaller documents, or any document when provider
+    caching fails, only register their header: inlining a large context
+    into every prompt costs more than it saves when nothing caches it, so
+    those prompts carry the header and their own per-task excerpts.
+
+    Contexts are kept in a byte-bounded LRU and evicted when their
+    document is deleted or expires from the document store, see evict().
+    """
+
+    def __init__(self):
+        self._contexts = ByteLRU(
+            get_settings().document_context_memory_bytes, sizeof=_sizeof,
+            on_evict=lambda document_id, context: self._release(context)
+        )
+        self._registrations = SingleFlight("document_context")
+        self._deletions: Set[asyncio.Task] = set()
+        self._ai_service: Optional[AIServiceV2] = None
+
+    async def register(self, document: DocumentContent, chunks: List[DocumentChunk]) -> DocumentContext:
+        """Return the context of a document, registering it on first use"""
+        context = self._contexts.get(document.document_id)
+        if context is not None and (context.cached_content is None or context.is_cached):
+            return context
+        return await self._registrations.do(document.document_id, lambda: self._register(document, chunks))
+
+    async def _register(self, document: DocumentContent, chunks: List[DocumentChunk]) -> DocumentContext:
+        settings = get_settings()
+        token_counts = [chunk.token_count for chunk in chunks]
+        total_tokens = sum(token_counts)
+
+        use_provider = (
+            settings.document_context_cache_enabled
+            and settings.llm_backend == "gemini"
+            and total_tokens >= settings.document_cache_min_tokens
+        )
+        header = self._build_header(document)
+        context = DocumentContext(document.document_id, header, header, estimate_tokens(header), [])
+
+        if use_provider:
+            selected = pack_spread(token_counts, settings.document_cache_max_tokens)
+            content = "\n\n".join(chunks[i].text(document.content) for i in selected)
+            cached = DocumentContext(
+                document.document_id, header, f"{header}DOCUMENT CONTENT:\n{content}\n",
+                sum(token_counts[i] for i in selected), selected
+            )
+            try:
+                await self._create_cached_content(cached)
+                context = cached
+            except Exception as e:
+                # Fall back to the header-only context rather than failing generation
+                logger.warning(f"Provider context cache unavailable for {document.document_id}: {str(e)}")
+
+        document_contexts.inc(backend="provider" if context.cached_content is not None else "local")
+        self._contexts.set(document.document_id, context)
+        return context
+
+    @staticmethod
+    def _build_header(document: DocumentContent) -> str:
+        headings = [item.heading for item in document.structure[:50]]
+        outline = "\n".join(f"- {heading}" for heading in headings)
+        return (
+            f"DOCUMENT TITLE: {document.metadata.title}\n"
+            f"DOCUMENT AUTHOR: {document.metadata.author}\n\n"
+            f"DOCUMENT STRUCTURE:\n{outline or '- (no headings detected)'}\n\n"
+        )
+
+    async def _create_cached_content(self, context: DocumentContext):
+        settings = get_settings()
+        model_name = model_router.route("document").model_name
+        ttl = settings.document_cache_ttl_seconds
+
+        cached_content = await asyncio.to_thread(
+            caching.CachedContent.create,
+            model=f"models/{model_name}",
+            display_name=context.document_id,
+            system_instruction=_SYSTEM_INSTRUCTION,
+            contents=[context.text],
+            ttl=timedelta(seconds=ttl)
+        )
+        context.cached_content = cached_content
+        context.model_name = model_name
+        # Stop using the cache a little before the provider expires it
+        context.expires_at = time.time() + ttl - 60
+        logger.info(f"Cached {context.tokens} document tokens for {context.document_id} as {cached_content.name}")
+
+    async def generate(self, context: DocumentContext, prompt: str, task: str = "document") -> str:
+        """Generate JSON content from the provider-cached context of a document"""
+        cache_key = llm_cache.make_key(
+            context.model_name, prompt, 0.7, {"cached_content": context.document_id, "task": task}
+        )
+        cached = await llm_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        if self._ai_service is None:
+            self._ai_service = AIServiceV2()
+        generation_config = {
+            "temperature": 0.7,
+            "max_output_tokens": model_router.route(task).max_output_tokens,
+            "response_mime_type": "application/json"
+        }
+        # Quota requeueing, retries and the circuit breakers work as for every other model call
+        text, route = await self._ai_service.generate_from_cached_content(
+            context.cached_content, context.model_name, context.text, context.tokens,
+            prompt, generation_config, task
+        )
+        # Unparseable output is not cached, so a retry asks the model again, and neither is
+        # the fallback model's, which would keep being served after the primary recovers
+        if route.tier == "primary" and is_valid_json(text):
+            await llm_cache.set(cache_key, text)
+        return text
+
+    def evict(self, document_id: str):
+        """Forget a document's context, e.g. when the document is deleted, and delete its provider cache"""
+        context = self._contexts.pop(document_id)
+        if context is not None:
+            self._release(context)
+
+    def _release(self, context: DocumentContext):
+        if context.cached_content is None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No loop to delete it from; the provider drops it at its TTL
+            return
+        task = loop.create_task(self._delete_cached_content(context))
+        self._deletions.add(task)
+        task.add_done_callback(self._deletions.discard)
+
+    async def _delete_cached_content(self, context: DocumentContext):
+        try:
+            await asyncio.to_thread(context.cached_content.delete)
+        except Exception as e:
+            logger.warning(f"Could not delete cached content for {context.document_id}: {str(e)}")
+
+    def status(self) -> Dict[str, Any]:
+        """Summarize registered document contexts for monitoring"""
+        contexts = self._contexts.values()
+        return {
+            "documents": len(contexts),
+            "provider_cached": sum(1 for context in contexts if context.is_cached),
+            "tokens": sum(context.tokens for context in contexts),
+            "memory_bytes": self._contexts.current_bytes
+        }
+
+# Shared document context cache for this process
+document_context_cache = DocumentContextCache()
@@ -1,10 +1,23 @@
 import os
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Tuple, Union
 import PyPDF2
 import docx
 from pptx import Presentation
 import re
 from fastapi import HTTPException
+from app.config import get_settings
+from app.models.document import DocumentChunk, DocumentContent
+from app.services.extraction_pool import ExtractionPoolFull, extraction_pool
+from app.services.repository import encode_record
+from app.utils.tokens import chunk_text
+
+# Extraction method by file extension
+EXTRACTORS = {
+    ".pdf": "_process_pdf",
+    ".docx": "_process_docx",
+    ".pptx": "_process_pptx",
+    ".ppt": "_process_pptx",
+}
 
 class DocumentProcessingService:
     """Service for processing uploaded documents and extracting their content."""
@@ -13,34 +26,63 @@ class DocumentProcessingService:
         """Initialize the document processing service."""
         pass
     
-    async def process_document(self, file_path: str) -> Dict[str, Any]:
+    async def process_document(
+        self, file_path: str, document_id: str, compress: bool = False
+    ) -> Tuple[Dict[str, Any], Tuple[Union[str, bytes], int]]:
         """
-        Process a document file and extract its content.
+        Process a document file into its stored DocumentContent record.
+        
+        Extraction, chunking and encoding the record are CPU-bound, so
+        they all run in the extraction worker processes rather than on
+        the event loop.
         
         Args:
             file_path: Path to the document file
+            document_id: ID of the document the record is stored under
+            compress: Whether the record is encoded for a compressed store
             
         Returns:
-            Dictionary containing the extracted content and metadata
+            The record and its encode_record() form, for Repository.set()
         """
         if not os.path.exists(file_path):
             raise HTTPException(status_code=404, detail=f"File not found: {file_path}")
         
         file_extension = os.path.splitext(file_path)[1].lower()
+        if file_extension not in EXTRACTORS:
+            raise HTTPException(status_code=400, detail=f"Unsupported file type: {file_extension}")
         
         try:
-            if file_extension == '.pdf':
-                return await self._process_pdf(file_path)
-            elif file_extension == '.docx':
-                return await self._process_docx(file_path)
-            elif file_extension in ['.pptx', '.ppt']:
-                return await self._process_pptx(file_path)
-            else:
-                raise HTTPException(status_code=400, detail=f"Unsupported file type: {file_extension}")
+            return await extraction_pool.run(extract_document, file_path, document_id, compress)
+        except ExtractionPoolFull as e:
+            raise HTTPException(status_code=503, detail=f"Document extraction is at capacity: {str(e)}")
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Error processing document: {str(e)}")
     
-    async def _process_pdf(self, file_path: str) -> Dict[str, Any]:
+    def extract(self, file_path: str) -> Dict[str, Any]:
+        """Extract a document's content in this process; blocks until done"""
+        file_extension = os.path.splitext(file_path)[1].lower()
+        return getattr(self, EXTRACTORS[file_extension])(file_path)
+    
+    def chunk_content(self, content: str) -> List[DocumentChunk]:
+        """
+        Split extracted content into token-counted chunks.
+        
+        Token counts are computed once here so prompts can be packed
+        against a token budget without re-counting the document. Chunks
+        only record their span of the content, so it is not stored twice.
+        
+        Args:
+            content: The extracted document text
+            
+        Returns:
+            List of chunks in document order
+        """
+        return [
+            DocumentChunk(index=i, start=start, end=end, token_count=tokens)
+            for i, (start, end, tokens) in enumerate(chunk_text(content, get_settings().document_chunk_tokens))
+        ]
+    
+    def _process_pdf(self, file_path: str) -> Dict[str, Any]:
         """Process a PDF document and extract its content."""
         content = []
         structure = []
@@ -84,7 +126,7 @@ class DocumentProcessingService:
         except Exception as e:
             raise Exception(f"Error processing PDF: {str(e)}")
     
-    async def _process_docx(self, file_path: str) -> Dict[str, Any]:
+    def _process_docx(self, file_path: str) -> Dict[str, Any]:
         """Process a Word document and extract its content."""
         try:
             doc = docx.Document(file_path)
@@ -128,7 +170,7 @@ class DocumentProcessingService:
         except Exception as e:
             raise Exception(f"Error processing DOCX: {str(e)}")
     
-    async def _process_pptx(self, file_path: str) -> Dict[str, Any]:
+    def _process_pptx(self, file_path: str) -> Dict[str, Any]:
         """Process a PowerPoint presentation and extract its content."""
         try:
             prs = Presentation(file_path)
@@ -171,3 +213,20 @@ class DocumentProcessingService:
             }
         except Exception as e:
             raise Exception(f"Error processing PPTX: {str(e)}")
+
+def extract_document(
+    file_path: str, document_id: str, compress: bool
+) -> Tuple[Dict[str, Any], Tuple[Union[str, bytes], int]]:
+    """Entry point of extraction jobs in the worker processes"""
+    service = DocumentProcessingService()
+    document_data = service.extract(file_path)
+    record = DocumentContent(
+        document_id=document_id,
+        filename=os.path.basename(file_path),
+        file_path=file_path,
+        content=document_data["content"],
+        metadata=document_data["metadata"],
+        structure=document_data["structure"],
+        chunks=service.chunk_content(document_data["content"])
+    ).model_dump(mode="json")
+    return record, encode_record(record, compress)
@@ -0,0 +1,189 @@
+import asyncio
+import logging
+import multiprocessing
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional
+
+from app.config import get_settings
+from app.utils.metrics import metrics
+from app.utils.tracing import span
+
+logger = logging.getLogger("extraction_pool")
+
+extraction_jobs = metrics.gauge(
+    "extraction_pool_jobs", "Extraction jobs running in or queued for the worker processes", ("state",)
+)
+extraction_results = metrics.counter(
+    "extraction_jobs_total", "Extraction jobs by outcome: ok, error, timeout, crashed or rejected", ("result",)
+)
+extraction_seconds = metrics.histogram(
+    "extraction_job_seconds", "Time extraction jobs spent in a worker process",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+)
+
+# Time past the deadline after which a worker that ignored its alarm is abandoned
+_GRACE_SECONDS = 5.0
+
+class ExtractionPoolFull(Exception):
+    """Every worker is busy and the queue is at its limit"""
+
+# Set in a worker when its current job's alarm fired
+_expired = False
+
+def _expire(signum, frame):
+    global _expired
+    _expired = True
+    raise TimeoutError("Extraction exceeded its time limit")
+
+def _call_with_deadline(fn: Callable[..., Any], args: tuple, timeout: float) -> Any:
+    """Run a job in a worker process, interrupted by SIGALRM once it is past its deadline"""
+    global _expired
+    _expired = False
+    previous = signal.signal(signal.SIGALRM, _expire)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return fn(*args)
+    except Exception:
+        if _expired:
+            # Extractors wrap their errors, so report the deadline itself
+            raise TimeoutError("Extraction exceeded its time limit") from None
+        raise
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+class ExtractionPool:
+    """
+    Runs CPU-bound document extraction in a bounded pool of worker processes.
+
+    At most `workers` jobs run at once and up to `max_queued` more wait
+    for a worker; beyond that run() raises ExtractionPoolFull so callers
+    can turn uploads away instead of piling up work. Each job is stopped
+    after `timeout` seconds by an alarm in its worker. A worker that does
+    not return within a short grace period after that, or that dies, gets
+    its pool replaced and the old pool's processes terminated. Jobs that
+    were running in the old pool alongside it are resubmitted once to the
+    new pool.
+
+    Workers are spawned rather than forked so they do not inherit the
+    event loop's threads and locks, and are started on first use.
+    """
+
+    def __init__(self):
+        settings = get_settings()
+        self.workers = settings.extraction_workers
+        self.max_queued = settings.extraction_max_queued
+        self.timeout = settings.extraction_timeout_seconds
+        self.running = 0
+        self.queued = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots = asyncio.Semaphore(self.workers)
+
+    @property
+    def capacity(self) -> int:
+        return self.workers + self.max_queued
+
+    def full(self) -> bool:
+        return self.running + self.queued >= self.capacity
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def _replace_executor(self, executor: ProcessPoolExecutor):
+        # Jobs failing together on a broken pool must only replace it once
+        if self._executor is not executor:
+            return
+        self._executor = None
+        # A stuck worker ignores shutdown, so stop the processes themselves; the
+        # other jobs of the pool then fail with BrokenProcessPool and are resubmitted
+        processes = list((executor._processes or {}).values())
+        executor.shutdown(wait=False)
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    def _update_gauges(self):
+        extraction_jobs.set(self.running, state="running")
+        extraction_jobs.set(self.queued, state="queued")
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run fn(*args) in a worker process; fn must be a module-level function"""
+        if self.full():
+            extraction_results.inc(result="rejected")
+            raise ExtractionPoolFull(f"{self.running} extractions running and {self.queued} queued")
+
+        self.queued += 1
+        self._update_gauges()
+        try:
+            with span("extraction.wait"):
+                await self._slots.acquire()
+        finally:
+            self.queued -= 1
+            self._update_gauges()
+
+        self.running += 1
+        self._update_gauges()
+        started = time.monotonic()
+        result = "ok"
+        try:
+            return await self._submit(fn, args)
+        except TimeoutError:
+            result = "timeout"
+            raise TimeoutError(f"Extraction took longer than {self.timeout}s")
+        except BrokenProcessPool:
+            result = "crashed"
+            raise
+        except Exception:
+            result = "error"
+            raise
+        finally:
+            extraction_seconds.observe(time.monotonic() - started)
+            extraction_results.inc(result=result)
+            self.running -= 1
+            self._slots.release()
+            self._update_gauges()
+
+    async def _submit(self, fn: Callable[..., Any], args: tuple) -> Any:
+        for attempt in range(2):
+            executor = self._get_executor()
+            started = time.monotonic()
+            try:
+                with span("extraction.run", function=fn.__name__):
+                    future = executor.submit(_call_with_deadline, fn, args, self.timeout)
+                    return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout + _GRACE_SECONDS)
+            except TimeoutError:
+                if time.monotonic() - started >= self.timeout + _GRACE_SECONDS:
+                    logger.warning(f"Terminating an extraction worker stuck past {self.timeout}s in {fn.__name__}")
+                    self._replace_executor(executor)
+                raise
+            except BrokenProcessPool:
+                if self._executor is not executor and attempt == 0:
+                    # Another job already replaced the pool; this one was only running beside it
+                    logger.info(f"Resubmitting {fn.__name__} after its extraction pool was replaced")
+                    continue
+                logger.error(f"An extraction worker died running {fn.__name__}; restarting the pool")
+                self._replace_executor(executor)
+                raise
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "running": self.running,
+            "queued": self.queued,
+            "capacity": self.capacity,
+            "timeout_seconds": self.timeout
+        }
+
+    async def stop(self):
+        if self._executor is not None:
+            self._replace_executor(self._executor)
+
+# Shared pool for this process
+extraction_pool = ExtractionPool()
@@ -0,0 +1,207 @@
+import asyncio
+import json
+import random
+import re
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from google.api_core.exceptions import InternalServerError, ResourceExhausted
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from app.config import get_settings
+from app.utils.json_parser import parse_llm_json
+from app.utils.tokens import estimate_tokens
+
+_WORDS = (
+    "learners explore core concepts through worked examples practical exercises and short reflections "
+    "that connect each idea to real projects while building confidence with key techniques and tools"
+).split()
+
+# Fields that hold running text rather than a title or a short phrase
+_LONG_FIELDS = (
+    "content", "introduction", "description", "summary", "explanation", "main_content",
+    "examples", "learning_path", "next_steps", "lesson_content"
+)
+
+_ITEMS = 3
+
+def _is_long(name: Optional[str]) -> bool:
+    return name is not None and any(name.endswith(field) for field in _LONG_FIELDS)
+
+class FakeLLM:
+    """
+    Simulated model that answers with well-formed JSON after a sampled delay.
+
+    With a response schema the answer is generated from the schema; without
+    one it mirrors the example JSON in the prompt, filling every string, so
+    the v1 prompts and document prompts get the structure they ask for.
+    Prompts without an example get prose. Latency is a sampled base
+    delay plus the output tokens at a fixed generation rate, and calls fail
+    with injected provider or quota errors at configurable rates.
+    """
+
+    def __init__(self):
+        settings = get_settings()
+        self._random = random.Random(settings.fake_llm_seed)
+
+    def _text(self, name: Optional[str]) -> str:
+        words = self._random.randint(40, 90) if _is_long(name) else self._random.randint(3, 8)
+        text = " ".join(self._random.choice(_WORDS) for _ in range(words))
+        return text[0].upper() + text[1:] + ("." if _is_long(name) else "")
+
+    def _from_schema(self, schema: Dict[str, Any], name: Optional[str] = None) -> Any:
+        kind = schema.get("type", "STRING").upper()
+        if "enum" in schema:
+            return self._random.choice(schema["enum"])
+        if kind == "OBJECT":
+            value = {key: self._from_schema(field, key) for key, field in schema.get("properties", {}).items()}
+            return self._consistent(value)
+        if kind == "ARRAY":
+            return [self._from_schema(schema.get("items", {}), name) for _ in range(_ITEMS)]
+        if kind == "INTEGER":
+            return self._random.randint(1, 3)
+        if kind == "NUMBER":
+            return round(self._random.uniform(1, 3), 2)
+        if kind == "BOOLEAN":
+            return self._random.random() < 0.5
+        return self._text(name)
+
+    def _from_example(self, example: Any, name: Optional[str] = None) -> Any:
+        if isinstance(example, dict):
+            return self._consistent({key: self._from_example(value, key) for key, value in example.items()})
+        if isinstance(example, list):
+            if not example:
+                return [self._text(name) for _ in range(_ITEMS)]
+            return [self._from_example(example[0], name) for _ in range(max(_ITEMS, len(example)))]
+        if isinstance(example, str):
+            return self._text(name)
+        return example
+
+    @staticmethod
+    def _consistent(value: Dict[str, Any]) -> Dict[str, Any]:
+        # Quiz answers have to be one of the options
+        options = value.get("options")
+        if "correct_answer" in value and isinstance(options, list) and options:
+            value["correct_answer"] = options[0]
+        return value
+
+    @staticmethod
+    def _example(prompt: str) -> Any:
+        """The JSON example following the last mention of JSON in the prompt, if any"""
+        marker = prompt.rfind("JSON")
+        match = re.search(r"[\[{]", prompt[marker:]) if marker >= 0 else None
+        if match is None:
+            return None
+        # Drop the "..." placeholders that stand for more items
+        example = re.sub(r",\s*\.\.\.\s*(?=[\]}])", "", prompt[marker + match.start():])
+        example = re.sub(r"\[\s*\.\.\.\s*\]", "[]", example)
+        try:
+            return parse_llm_json(example)
+        except json.JSONDecodeError:
+            return None
+
+    def respond(self, prompt: str, response_schema: Optional[Dict[str, Any]] = None) -> str:
+        if response_schema is not None:
+            return json.dumps(self._from_schema(response_schema))
+        example = self._example(prompt)
+        if example is not None:
+            return json.dumps(self._from_example(example))
+        return "\n\n".join(self._text("content") for _ in range(_ITEMS))
+
+    def _latency(self, output_tokens: int) -> float:
+        settings = get_settings()
+        base = settings.fake_llm_latency_seconds
+        distribution = settings.fake_llm_latency_distribution
+        if distribution == "lognormal":
+            base = self._random.lognormvariate(0, settings.fake_llm_latency_sigma) * base
+        elif distribution == "uniform":
+            base = self._random.uniform(0, 2 * base)
+        return base + output_tokens / settings.fake_llm_tokens_per_second
+
+    def _inject_errors(self):
+        settings = get_settings()
+        roll = self._random.random()
+        if roll < settings.fake_llm_quota_error_rate:
+            raise ResourceExhausted("Simulated quota exhaustion")
+        if roll < settings.fake_llm_quota_error_rate + settings.fake_llm_error_rate:
+            raise InternalServerError("Simulated model error")
+
+    async def complete(self, prompt: str, response_schema: Optional[Dict[str, Any]] = None) -> "FakeResponse":
+        """Answer after the simulated latency, or raise an injected error"""
+        text = self.respond(prompt, response_schema)
+        usage = FakeUsage(estimate_tokens(prompt), estimate_tokens(text))
+        await asyncio.sleep(self._latency(usage.candidates_token_count))
+        self._inject_errors()
+        return FakeResponse(text, usage)
+
+    async def stream(self, prompt: str, response_schema: Optional[Dict[str, Any]] = None) -> AsyncIterator["FakeResponse"]:
+        """Yield the answer in chunks at the simulated token rate"""
+        text = self.respond(prompt, response_schema)
+        usage = FakeUsage(estimate_tokens(prompt), estimate_tokens(text))
+        total = self._latency(usage.candidates_token_count)
+        self._inject_errors()
+
+        chunk_size = 200
+        chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+        for i, chunk in enumerate(chunks):
+            await asyncio.sleep(total / len(chunks))
+            yield FakeResponse(chunk, usage if i == len(chunks) - 1 else None)
+
+class FakeUsage:
+    """Same fields as the Gemini usage_metadata"""
+
+    def __init__(self, prompt_token_count: int, candidates_token_count: int):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+        self.total_token_count = prompt_token_count + candidates_token_count
+
+class FakeResponse:
+    def __init__(self, text: str, usage_metadata: Optional[FakeUsage]):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+class FakeGenerativeModel:
+    """Drop-in for genai.GenerativeModel backed by the simulated model"""
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+
+    async def generate_content_async(self, contents, generation_config: Optional[Dict[str, Any]] = None, stream: bool = False):
+        schema = (generation_config or {}).get("response_schema")
+        if stream:
+            return fake_llm.stream(str(contents), schema)
+        return await fake_llm.complete(str(contents), schema)
+
+class FakeChatModel(BaseChatModel):
+    """Drop-in for ChatGoogleGenerativeAI in the v1 LangChain agent; it never calls tools"""
+
+    model: str
+    max_output_tokens: Optional[int] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _generate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        raise NotImplementedError("The fake chat model only runs asynchronously")
+
+    async def _agenerate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        prompt = "\n".join(str(message.content) for message in messages)
+        response = await fake_llm.complete(prompt)
+        usage = response.usage_metadata
+        message = AIMessage(
+            content=response.text,
+            usage_metadata={
+                "input_tokens": usage.prompt_token_count,
+                "output_tokens": usage.candidates_token_count,
+                "total_tokens": usage.total_token_count
+            }
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+# Shared simulated model for this process
+fake_llm = FakeLLM()
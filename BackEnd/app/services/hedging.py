@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import threading
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+from app.utils.metrics import metrics
+
+logger = logging.getLogger("hedging")
+
+llm_call_latency = metrics.histogram(
+    "llm_call_latency_seconds", "Model round-trip latency by task", ("task",)
+)
+hedged_calls = metrics.counter(
+    "llm_hedged_calls_total", "Hedged model calls by task and winner", ("task", "winner")
+)
+
+class LatencyTracker:
+    """Rolling window of recent model latencies per task, used to pick the hedge delay"""
+
+    def __init__(self, window: int = 500):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, task: str, seconds: float):
+        llm_call_latency.observe(seconds, task=task)
+        with self._lock:
+            samples = self._samples.get(task)
+            if samples is None:
+                samples = deque(maxlen=self.window)
+                self._samples[task] = samples
+            samples.append(seconds)
+
+    def percentile(self, task: str, percentile: float, min_samples: int = 1) -> Optional[float]:
+        """Return the latency percentile for a task, or None without enough samples"""
+        with self._lock:
+            samples = sorted(self._samples.get(task, ()))
+        if len(samples) < max(1, min_samples):
+            return None
+        index = min(len(samples) - 1, int(round(percentile / 100.0 * (len(samples) - 1))))
+        return samples[index]
+
+class HedgeBudget:
+    """
+    Caps hedged calls at a fraction of primary calls.
+
+    Every primary call earns `ratio` credit up to a small burst allowance
+    and every hedge spends one credit.
+    """
+
+    def __init__(self, ratio: float, burst: float = 5.0):
+        self.ratio = ratio
+        self.burst = burst
+        self.credit = 0.0
+        self._lock = threading.Lock()
+
+    def record_primary(self):
+        with self._lock:
+            self.credit = min(self.burst, self.credit + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self.credit >= 1.0:
+                self.credit -= 1.0
+                return True
+            return False
+
+async def hedged_call(
+    call: Callable[[asyncio.Event], Awaitable[Any]],
+    delay: float,
+    budget: HedgeBudget,
+    task: str,
+    is_valid: Callable[[Any], bool]
+) -> Any:
+    """
+    Run `call`, and send a duplicate if it is still running `delay` seconds after it started.
+
+    `call` receives an event it sets once the request has actually been sent,
+    so time spent queueing does not count towards the delay. The first valid
+    result wins and the other call is cancelled.
+    """
+    budget.record_primary()
+    primary_started = asyncio.Event()
+    primary = asyncio.ensure_future(call(primary_started))
+    pending = {primary}
+
+    try:
+        started_waiter = asyncio.ensure_future(primary_started.wait())
+        try:
+            await asyncio.wait({primary, started_waiter}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            started_waiter.cancel()
+
+        if not primary.done():
+            await asyncio.wait({primary}, timeout=delay)
+        if primary.done() or not budget.try_spend():
+            return await primary
+
+        logger.info(f"Hedging {task} call after {delay:.1f}s")
+        hedge = asyncio.ensure_future(call(asyncio.Event()))
+        pending.add(hedge)
+
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for finished in done:
+                if finished.exception() is None and is_valid(finished.result()):
+                    hedged_calls.inc(task=task, winner="primary" if finished is primary else "hedge")
+                    return finished.result()
+
+        # Neither call produced a valid result, so report the primary's outcome
+        hedged_calls.inc(task=task, winner="none")
+        return primary.result()
+    finally:
+        for remaining in pending:
+            remaining.cancel()
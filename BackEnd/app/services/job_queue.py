@@ -0,0 +1,461 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, NamedTuple, Optional, Set, Type
+
+from fastapi import HTTPException
+from pydantic import BaseModel
+
+from app.config import get_settings
+from app.utils.metrics import metrics
+from app.utils.request_context import BATCH, set_priority
+
+logger = logging.getLogger("job_queue")
+
+job_transitions = metrics.counter(
+    "jobs_total", "Background job state transitions by kind", ("kind", "status")
+)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+FINISHED = (SUCCEEDED, FAILED)
+
+_COLUMNS = (
+    "id", "kind", "payload", "status", "attempts", "max_attempts", "progress",
+    "result", "error", "error_status", "run_after", "created_at", "updated_at", "finished_at",
+    "owner", "lease_expires"
+)
+
+# Identifies this process as the owner of the jobs it claims
+_OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+class JobStore:
+    """
+    SQLite table of jobs in WAL mode, so status reads do not block the workers' writes.
+
+    Every worker process on the host shares the table. A claimed job
+    records its owner and a lease that the owner renews while it runs;
+    only jobs whose lease expired, because their owner died or stalled,
+    are returned to the queue.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Wait for other workers' transactions instead of failing
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, kind TEXT NOT NULL, payload TEXT NOT NULL, status TEXT NOT NULL, "
+                "attempts INTEGER NOT NULL DEFAULT 0, max_attempts INTEGER NOT NULL, progress TEXT, "
+                "result TEXT, error TEXT, error_status INTEGER, run_after REAL NOT NULL, "
+                "created_at REAL NOT NULL, updated_at REAL NOT NULL, finished_at REAL, "
+                "owner TEXT, lease_expires REAL)"
+            )
+            # Tables created before leases lack their columns
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column, definition in (("owner", "TEXT"), ("lease_expires", "REAL")):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {definition}")
+            conn.commit()
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (status, run_after)")
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def _row(row: Optional[tuple]) -> Optional[Dict[str, Any]]:
+        if row is None:
+            return None
+        job = dict(zip(_COLUMNS, row))
+        job["payload"] = json.loads(job["payload"])
+        job["progress"] = json.loads(job["progress"]) if job["progress"] else {}
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def insert(self, kind: str, payload: Dict[str, Any], max_attempts: int) -> Dict[str, Any]:
+        now = time.time()
+        job_id = f"job_{uuid.uuid4().hex}"
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT INTO jobs (id, kind, payload, status, max_attempts, run_after, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(payload), QUEUED, max_attempts, now, now, now)
+            )
+            conn.commit()
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._connect().execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return self._row(row)
+
+    def claim(self, owner: str, lease: float) -> Optional[Dict[str, Any]]:
+        """
+        Mark the oldest due job as running under a lease and count the attempt.
+
+        The job is picked and taken in one statement inside a write
+        transaction, so two processes never claim the same job.
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "UPDATE jobs SET status = ?, attempts = attempts + 1, owner = ?, lease_expires = ?, updated_at = ? "
+                    "WHERE id = (SELECT id FROM jobs WHERE status = ? AND run_after <= ? ORDER BY created_at LIMIT 1) "
+                    "AND status = ? RETURNING id",
+                    (RUNNING, owner, now + lease, now, QUEUED, now, QUEUED)
+                ).fetchone()
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        if row is None:
+            return None
+        return self.get(row[0])
+
+    def renew(self, job_id: str, owner: str, lease: float) -> bool:
+        """Extend the lease of a running job; False when the owner no longer holds it"""
+        with self._lock:
+            conn = self._connect()
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE id = ? AND owner = ? AND status = ?",
+                (time.time() + lease, job_id, owner, RUNNING)
+            )
+            conn.commit()
+        return cursor.rowcount == 1
+
+    def update(self, job_id: str, held_by: Optional[str] = None, **fields) -> bool:
+        """
+        Set fields of a job; False when nothing was updated.
+
+        With `held_by`, only a running job that owner still holds is updated,
+        so a worker that lost its lease cannot overwrite the new owner's state.
+        """
+        fields["updated_at"] = time.time()
+        for name in ("progress", "result"):
+            if name in fields and fields[name] is not None:
+                fields[name] = json.dumps(fields[name])
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        condition, params = "id = ?", [job_id]
+        if held_by is not None:
+            condition += " AND owner = ? AND status = ?"
+            params += [held_by, RUNNING]
+        with self._lock:
+            conn = self._connect()
+            cursor = conn.execute(f"UPDATE jobs SET {assignments} WHERE {condition}", (*fields.values(), *params))
+            conn.commit()
+        return cursor.rowcount == 1
+
+    def requeue_expired(self) -> int:
+        """Return running jobs whose lease expired to the queue"""
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, owner = NULL, lease_expires = NULL, run_after = ?, updated_at = ? "
+                "WHERE status = ? AND (lease_expires IS NULL OR lease_expires < ?)",
+                (QUEUED, now, now, RUNNING, now)
+            )
+            conn.commit()
+        return cursor.rowcount
+
+    def release(self, owner: str) -> int:
+        """Return the running jobs of a stopping owner to the queue"""
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, owner = NULL, lease_expires = NULL, run_after = ?, updated_at = ? "
+                "WHERE status = ? AND owner = ?",
+                (QUEUED, now, now, RUNNING, owner)
+            )
+            conn.commit()
+        return cursor.rowcount
+
+    def purge(self, older_than: float) -> int:
+        """Delete finished jobs last updated before the given time"""
+        with self._lock:
+            conn = self._connect()
+            cursor = conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?", (*FINISHED, older_than)
+            )
+            conn.commit()
+        return cursor.rowcount
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._connect().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+class Executor(NamedTuple):
+    request_model: Type[BaseModel]
+    fn: Callable[[Any], Awaitable[Any]]
+
+# The job a worker is currently running; tasks spawned by the executor inherit it
+_current_job: ContextVar[Optional[str]] = ContextVar("current_job", default=None)
+
+class JobQueue:
+    """
+    Persistent queue of generation jobs run by background worker tasks.
+
+    Submitting a job stores its validated request and returns at once.
+    Workers claim due jobs in submission order and run the executor
+    registered for the job's kind. Failed attempts are retried with
+    exponential backoff until the job runs out of attempts; client errors
+    (HTTP 4xx from an executor) fail the job immediately. A stopping
+    queue hands its running jobs back; jobs of a process that died are
+    queued again once their lease expires, by whichever process notices.
+    """
+
+    def __init__(self):
+        settings = get_settings()
+        self.store = JobStore(settings.job_queue_path)
+        self._executors: Dict[str, Executor] = {}
+        self._workers: List[asyncio.Task] = []
+        self._reaper_task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        # Progress of the running jobs, merged in memory so concurrent reports do not race
+        self._progress: Dict[str, Dict[str, Any]] = {}
+
+    def register(self, kind: str, request_model: Type[BaseModel], fn: Callable[[Any], Awaitable[Any]]):
+        """Make a handler the executor of a job kind"""
+        self._executors[kind] = Executor(request_model, fn)
+
+    def kinds(self) -> List[str]:
+        return sorted(self._executors)
+
+    async def start(self):
+        """Requeue jobs whose owner died and start the worker tasks"""
+        if self._workers:
+            return
+        settings = get_settings()
+        await self._requeue_expired()
+        await asyncio.to_thread(self.store.purge, time.time() - settings.job_retention_seconds)
+
+        self._wakeup = asyncio.Event()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(settings.job_workers)]
+        self._reaper_task = asyncio.create_task(self._reaper())
+
+    async def stop(self):
+        """Stop the workers and hand the jobs they were running back to the queue"""
+        tasks = self._workers + ([self._reaper_task] if self._reaper_task is not None else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._reaper_task = None
+        released = await asyncio.to_thread(self.store.release, _OWNER)
+        if released:
+            logger.info(f"Returned {released} running jobs to the queue")
+
+    async def _requeue_expired(self):
+        resumed = await asyncio.to_thread(self.store.requeue_expired)
+        if resumed:
+            logger.info(f"Resuming {resumed} jobs whose lease expired")
+            if self._wakeup is not None:
+                self._wakeup.set()
+
+    async def _reaper(self):
+        """Requeue jobs of dead owners while the queue runs"""
+        lease = get_settings().job_lease_seconds
+        while True:
+            await asyncio.sleep(lease / 2)
+            try:
+                await self._requeue_expired()
+            except sqlite3.Error as e:
+                logger.error(f"Could not requeue expired jobs: {str(e)}")
+
+    async def submit(self, kind: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Validate and queue a job.
+
+        Raises KeyError for an unknown kind and pydantic's ValidationError
+        for a payload the kind's request model rejects.
+        """
+        executor = self._executors[kind]
+        request = executor.request_model.model_validate(payload)
+        job = await asyncio.to_thread(
+            self.store.insert, kind, request.model_dump(mode="json"), get_settings().job_max_attempts
+        )
+        job_transitions.inc(kind=kind, status=QUEUED)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    async def events(self, job_id: str, heartbeat: float = 15.0) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """
+        Yield the job's state now and after every change until it finishes.
+
+        Yields None when nothing changed for `heartbeat` seconds, so
+        streaming clients can keep their connection alive.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(job_id, set()).add(queue)
+        try:
+            job = await self.get(job_id)
+            if job is None:
+                return
+            yield job
+            while job["status"] not in FINISHED:
+                try:
+                    job = await asyncio.wait_for(queue.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                yield job
+        finally:
+            subscribers = self._subscribers.get(job_id)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self._subscribers[job_id]
+
+    async def _update(self, job_id: str, held_by: Optional[str] = None, **fields) -> bool:
+        updated = await asyncio.to_thread(self.store.update, job_id, held_by, **fields)
+        if updated and job_id in self._subscribers:
+            job = await self.get(job_id)
+            for queue in self._subscribers.get(job_id, ()):
+                queue.put_nowait(job)
+        return updated
+
+    async def _worker(self):
+        settings = get_settings()
+        # Background jobs yield to interactive requests for model calls
+        set_priority(BATCH)
+        while True:
+            self._wakeup.clear()
+            try:
+                job = await asyncio.to_thread(self.store.claim, _OWNER, settings.job_lease_seconds)
+            except sqlite3.Error as e:
+                logger.error(f"Could not claim a job: {str(e)}")
+                job = None
+
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=settings.job_poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._run(job)
+
+    async def _renew_lease(self, job_id: str, run: asyncio.Task, lost: asyncio.Event):
+        """Keep the job's lease alive, and stop the run once another owner may have the job"""
+        lease = get_settings().job_lease_seconds
+        while True:
+            await asyncio.sleep(lease / 3)
+            try:
+                if not await asyncio.to_thread(self.store.renew, job_id, _OWNER, lease):
+                    logger.warning(f"Lost the lease of job {job_id}, abandoning it")
+                    lost.set()
+                    run.cancel()
+                    return
+            except sqlite3.Error as e:
+                logger.error(f"Could not renew the lease of job {job_id}: {str(e)}")
+
+    async def _run(self, job: Dict[str, Any]):
+        job_id, kind = job["id"], job["kind"]
+        job_transitions.inc(kind=kind, status=RUNNING)
+        await self._update(job_id, held_by=_OWNER, status=RUNNING)
+
+        self._progress[job_id] = dict(job["progress"])
+        token = _current_job.set(job_id)
+        lost = asyncio.Event()
+        renewal = asyncio.create_task(self._renew_lease(job_id, asyncio.current_task(), lost))
+        try:
+            executor = self._executors.get(kind)
+            if executor is None:
+                raise HTTPException(status_code=400, detail=f"Unknown job kind: {kind}")
+            result = await executor.fn(executor.request_model.model_validate(job["payload"]))
+        except asyncio.CancelledError:
+            if not lost.is_set():
+                raise
+            # Cancelled by the lease renewal, not by stop(); the job belongs to someone else now
+            asyncio.current_task().uncancel()
+            job_transitions.inc(kind=kind, status="abandoned")
+            return
+        except Exception as e:
+            await self._fail(job, e)
+            return
+        finally:
+            renewal.cancel()
+            _current_job.reset(token)
+            self._progress.pop(job_id, None)
+
+        if isinstance(result, BaseModel):
+            result = result.model_dump(mode="json")
+        if not await self._update(
+            job_id, held_by=_OWNER, status=SUCCEEDED, result=result, error=None, error_status=None,
+            finished_at=time.time(), owner=None, lease_expires=None
+        ):
+            logger.warning(f"Discarding the result of job {job_id} ({kind}), whose lease was lost")
+            job_transitions.inc(kind=kind, status="abandoned")
+            return
+        job_transitions.inc(kind=kind, status=SUCCEEDED)
+        logger.info(f"Job {job_id} ({kind}) succeeded after {job['attempts']} attempts")
+
+    async def _fail(self, job: Dict[str, Any], error: Exception):
+        job_id, kind = job["id"], job["kind"]
+        if isinstance(error, HTTPException):
+            message, error_status = str(error.detail), error.status_code
+        else:
+            message, error_status = str(error), 500
+
+        if error_status >= 500 and job["attempts"] < job["max_attempts"]:
+            delay = get_settings().job_retry_backoff_seconds * 2 ** (job["attempts"] - 1)
+            logger.warning(f"Job {job_id} ({kind}) attempt {job['attempts']} failed, retrying in {delay:.0f}s: {message}")
+            job_transitions.inc(kind=kind, status="retried")
+            await self._update(
+                job_id, held_by=_OWNER, status=QUEUED, error=message, error_status=error_status,
+                run_after=time.time() + delay, owner=None, lease_expires=None
+            )
+            return
+
+        logger.error(f"Job {job_id} ({kind}) failed: {message}")
+        job_transitions.inc(kind=kind, status=FAILED)
+        await self._update(
+            job_id, held_by=_OWNER, status=FAILED, error=message, error_status=error_status,
+            finished_at=time.time(), owner=None, lease_expires=None
+        )
+
+    async def report_progress(self, **progress):
+        """Merge progress fields into the running job of the current task, if any"""
+        job_id = _current_job.get()
+        if job_id is None or job_id not in self._progress:
+            return
+        self._progress[job_id].update(progress)
+        await self._update(job_id, held_by=_OWNER, progress=dict(self._progress[job_id]))
+
+    def status(self) -> Dict[str, Any]:
+        """Summarize job counts for monitoring"""
+        return {"workers": len(self._workers), "jobs": self.store.counts()}
+
+# Shared job queue for this process
+job_queue = JobQueue()
@@ -0,0 +1,177 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from app.config import get_settings
+from app.utils.lru import ByteLRU
+from app.utils.metrics import metrics
+
+logger = logging.getLogger("llm_cache")
+
+cache_requests = metrics.counter(
+    "llm_cache_requests_total", "LLM response cache lookups by tier and result", ("tier", "result")
+)
+
+def _sizeof(value: str) -> int:
+    return len(value.encode("utf-8"))
+
+class DiskCache:
+    """SQLite-backed cache tier whose entries expire after a fixed TTL"""
+
+    def __init__(self, path: str, ttl: float):
+        self.path = path
+        self.ttl = ttl
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn = conn
+        return self._conn
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        """A live entry's value and expiry time"""
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT value, expires_at FROM llm_cache WHERE key = ? AND expires_at > ?",
+                (key, time.time())
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def set(self, key: str, value: str):
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, time.time() + self.ttl)
+            )
+            self._writes += 1
+            # Purge expired entries now and then instead of on every write
+            if self._writes % 100 == 0:
+                conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (time.time(),))
+            conn.commit()
+
+    def delete(self, key: str):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            conn.commit()
+
+class LLMCache:
+    """
+    Content-addressed cache for model responses.
+
+    Lookups check a byte-bounded in-memory LRU first and fall back to a
+    SQLite tier on disk; disk hits are promoted back into memory.
+    """
+
+    def __init__(self):
+        settings = get_settings()
+        self.enabled = settings.llm_cache_enabled
+        # Memory entries expire like disk ones, so neither tier serves a response past LLM_CACHE_TTL_SECONDS
+        self.memory = ByteLRU(
+            settings.llm_cache_memory_bytes, sizeof=_sizeof, ttl=settings.llm_cache_ttl_seconds
+        )
+        self.disk = DiskCache(settings.llm_cache_path, settings.llm_cache_ttl_seconds)
+
+    @staticmethod
+    def make_key(model_name: str, prompt: str, temperature: Optional[float], config: Dict[str, Any]) -> str:
+        """Build the cache key from the model, normalized prompt and generation settings"""
+        normalized_prompt = " ".join(prompt.split())
+        payload = json.dumps(
+            {
+                "model": model_name,
+                "prompt": normalized_prompt,
+                "temperature": temperature,
+                "config": config
+            },
+            sort_keys=True,
+            default=str
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[str]:
+        """Return a cached response or None"""
+        if not self.enabled:
+            return None
+
+        value = self.memory.get(key)
+        if value is not None:
+            cache_requests.inc(tier="memory", result="hit")
+            return value
+        cache_requests.inc(tier="memory", result="miss")
+
+        try:
+            entry = await asyncio.to_thread(self.disk.get, key)
+        except sqlite3.Error as e:
+            logger.warning(f"LLM disk cache read failed: {str(e)}")
+            entry = None
+
+        if entry is None:
+            cache_requests.inc(tier="disk", result="miss")
+            return None
+
+        cache_requests.inc(tier="disk", result="hit")
+        value, expires_at = entry
+        # Promoted entries expire when their disk entry does
+        self.memory.set(key, value, expires_at)
+        return value
+
+    async def set(self, key: str, value: str):
+        """Store a response in both tiers"""
+        if not self.enabled or not isinstance(value, str) or not value:
+            return
+
+        self.memory.set(key, value)
+        try:
+            await asyncio.to_thread(self.disk.set, key, value)
+        except sqlite3.Error as e:
+            logger.warning(f"LLM disk cache write failed: {str(e)}")
+
+    async def delete(self, key: str):
+        """Drop a response from both tiers, e.g. one that turned out to be unusable"""
+        if not self.enabled:
+            return
+
+        self.memory.pop(key)
+        try:
+            await asyncio.to_thread(self.disk.delete, key)
+        except sqlite3.Error as e:
+            logger.warning(f"LLM disk cache delete failed: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Summarize hit and miss counts for monitoring"""
+        samples = cache_requests.samples()
+        memory_hits = samples.get(("memory", "hit"), 0)
+        disk_hits = samples.get(("disk", "hit"), 0)
+        lookups = memory_hits + samples.get(("memory", "miss"), 0)
+        return {
+            "enabled": self.enabled,
+            "memory_hits": int(memory_hits),
+            "disk_hits": int(disk_hits),
+            "misses": int(samples.get(("disk", "miss"), 0)),
+            "hit_ratio": round((memory_hits + disk_hits) / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(self.memory),
+            "memory_bytes": self.memory.current_bytes,
+            "memory_evictions": self.memory.evictions
+        }
+
+# Shared cache for every AI service in this process
+llm_cache = LLMCache()
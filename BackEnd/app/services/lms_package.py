@@ -0,0 +1,297 @@
+import html
+import io
+import zipfile
+from datetime import datetime
+from typing import AsyncIterator, List, NamedTuple, Optional, Tuple
+from xml.sax.saxutils import escape, quoteattr
+
+from app.services.course_tree import children, get_full, latest_by_title, lesson_store, module_store, quiz_store
+
+class _Entry(NamedTuple):
+    identifier: str
+    title: str
+    href: Optional[str]
+    quiz_href: Optional[str] = None
+
+class _ZipSink(io.RawIOBase):
+    """
+    Write-only file that hands out what was written since the last drain().
+
+    It is not seekable, so zipfile writes a data descriptor after every
+    member instead of seeking back to patch its header, and the archive
+    can be sent while it is being assembled.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._buffer = bytearray()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._buffer += data
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+# Marks the SCO complete with whichever SCORM runtime the LMS provides
+_SCORM_JS = """(function () {
+  function find(name) {
+    var w = window;
+    for (var depth = 0; w && depth < 10; depth++) {
+      try { if (w[name]) { return w[name]; } } catch (e) { return null; }
+      if (w.parent && w.parent !== w) { w = w.parent; } else if (w.opener) { w = w.opener; } else { break; }
+    }
+    return null;
+  }
+  var api2004 = find("API_1484_11");
+  var api12 = api2004 ? null : find("API");
+  window.addEventListener("load", function () {
+    if (api2004) {
+      api2004.Initialize("");
+      api2004.SetValue("cmi.completion_status", "completed");
+      api2004.Commit("");
+    } else if (api12) {
+      api12.LMSInitialize("");
+      api12.LMSSetValue("cmi.core.lesson_status", "completed");
+      api12.LMSCommit("");
+    }
+  });
+  window.addEventListener("unload", function () {
+    if (api2004) { api2004.Terminate(""); } else if (api12) { api12.LMSFinish(""); }
+  });
+})();
+"""
+
+def _page(title: str, body: List[str], scorm: bool) -> str:
+    script = '<script src="../shared/scorm.js"></script>\n' if scorm else ""
+    return (
+        f"<!DOCTYPE html>\n<html lang=\"en\">\n<head>\n<meta charset=\"utf-8\">\n<title>{html.escape(title)}</title>\n"
+        f"{script}</head>\n<body>\n<h1>{html.escape(title)}</h1>\n" + "".join(body) + "</body>\n</html>\n"
+    )
+
+def _paragraphs(text: Optional[str]) -> List[str]:
+    return [f"<p>{html.escape(part.strip())}</p>\n" for part in (text or "").split("\n\n") if part.strip()]
+
+def _list(items: Optional[List[str]]) -> List[str]:
+    if not items:
+        return []
+    return ["<ul>\n"] + [f"<li>{html.escape(item)}</li>\n" for item in items] + ["</ul>\n"]
+
+def _lesson_page(lesson: dict, quiz: Optional[dict], scorm: bool) -> str:
+    body = _paragraphs(lesson["introduction"])
+    for section in lesson["sections"]:
+        body += [f"<h2>{html.escape(section['heading'])}</h2>\n"] + _paragraphs(section["content"])
+    body += ["<h2>Summary</h2>\n"] + _paragraphs(lesson["summary"])
+    body += ["<h2>Reflection questions</h2>\n"] + _list(lesson["reflection_questions"])
+    body += ["<h2>Next steps</h2>\n"] + _paragraphs(lesson["next_steps"])
+    if quiz is not None:
+        # SCORM has no assessment format of its own, so the quiz is also shown on the page
+        body += ["<h2>Quiz</h2>\n"] + _paragraphs(quiz["quiz_introduction"])
+        for i, question in enumerate(quiz["questions"], 1):
+            body += [f"<h3>{i}. {html.escape(question['question'])}</h3>\n"] + _list(question["options"])
+            answer = f"{question['correct_answer']}. {question.get('explanation') or ''}".strip()
+            body.append(f"<details><summary>Answer</summary><p>{html.escape(answer)}</p></details>\n")
+    return _page(lesson["lesson_title"], body, scorm)
+
+def _qti(quiz: dict, identifier: str, title: str) -> str:
+    """A quiz as a QTI 1.2 assessment of single-choice items, in the Common Cartridge profile"""
+    items = []
+    for i, question in enumerate(quiz["questions"], 1):
+        labels = [chr(65 + j) if j < 26 else f"O{j}" for j in range(len(question["options"]))]
+        choices = "".join(
+            f'<response_label ident="{label}"><material><mattext texttype="text/plain">{escape(option)}</mattext>'
+            f"</material></response_label>"
+            for label, option in zip(labels, question["options"])
+        )
+        correct = next(
+            (label for label, option in zip(labels, question["options"]) if option == question["correct_answer"]),
+            labels[0] if labels else ""
+        )
+        feedback = ""
+        if question.get("explanation"):
+            feedback = (
+                '<itemfeedback ident="general_fb"><flow_mat><material>'
+                f'<mattext texttype="text/plain">{escape(question["explanation"])}</mattext>'
+                "</material></flow_mat></itemfeedback>"
+            )
+        items.append(
+            f'<item ident="{identifier}-Q{i}" title="Question {i}">'
+            "<itemmetadata><qtimetadata><qtimetadatafield><fieldlabel>cc_profile</fieldlabel>"
+            "<fieldentry>cc.multiple_choice.v0p1</fieldentry></qtimetadatafield></qtimetadata></itemmetadata>"
+            f'<presentation><material><mattext texttype="text/plain">{escape(question["question"])}</mattext></material>'
+            f'<response_lid ident="response1" rcardinality="Single"><render_choice>{choices}</render_choice>'
+            "</response_lid></presentation>"
+            '<resprocessing><outcomes><decvar varname="SCORE" vartype="Decimal" minvalue="0" maxvalue="100"/></outcomes>'
+            f'<respcondition continue="No"><conditionvar><varequal respident="response1">{correct}</varequal>'
+            '</conditionvar><setvar action="Set" varname="SCORE">100</setvar>'
+            + ('<displayfeedback feedbacktype="Response" linkrefid="general_fb"/>' if feedback else "")
+            + f"</respcondition></resprocessing>{feedback}</item>\n"
+        )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<questestinterop xmlns="http://www.imsglobal.org/xsd/ims_qtiasiv1p2">\n'
+        f"<assessment ident={quoteattr(identifier)} title={quoteattr(title)}>\n"
+        "<qtimetadata><qtimetadatafield><fieldlabel>cc_profile</fieldlabel><fieldentry>cc.exam.v0p1</fieldentry>"
+        "</qtimetadatafield><qtimetadatafield><fieldlabel>cc_maxattempts</fieldlabel><fieldentry>unlimited</fieldentry>"
+        "</qtimetadatafield></qtimetadata>\n"
+        f'<section ident="{identifier}-S">\n' + "".join(items) + "</section>\n</assessment>\n</questestinterop>\n"
+    )
+
+_MANIFEST_HEADERS = {
+    "scorm12": (
+        '<manifest identifier={identifier} version="1.0" xmlns="http://www.imsproject.org/xsd/imscp_rootv1p1p2" '
+        'xmlns:adlcp="http://www.adlnet.org/xsd/adlcp_rootv1p2" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+        'xsi:schemaLocation="http://www.imsproject.org/xsd/imscp_rootv1p1p2 imscp_rootv1p1p2.xsd '
+        'http://www.adlnet.org/xsd/adlcp_rootv1p2 adlcp_rootv1p2.xsd">\n'
+        "<metadata><schema>ADL SCORM</schema><schemaversion>1.2</schemaversion></metadata>\n"
+    ),
+    "scorm2004": (
+        '<manifest identifier={identifier} version="1.0" xmlns="http://www.imsglobal.org/xsd/imscp_v1p1" '
+        'xmlns:adlcp="http://www.adlnet.org/xsd/adlcp_v1p3" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+        'xsi:schemaLocation="http://www.imsglobal.org/xsd/imscp_v1p1 imscp_v1p1.xsd '
+        'http://www.adlnet.org/xsd/adlcp_v1p3 adlcp_v1p3.xsd">\n'
+        "<metadata><schema>ADL SCORM</schema><schemaversion>2004 4th Edition</schemaversion></metadata>\n"
+    ),
+    "imscc": (
+        '<manifest identifier={identifier} xmlns="http://www.imsglobal.org/xsd/imsccv1p1/imscp_v1p1" '
+        'xmlns:lomimscc="http://ltsc.ieee.org/xsd/imsccv1p1/LOM/manifest" '
+        'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+        'xsi:schemaLocation="http://www.imsglobal.org/xsd/imsccv1p1/imscp_v1p1 '
+        'http://www.imsglobal.org/profile/cc/ccv1p1/ccv1p1_imscp_v1p2_v1p0.xsd">\n'
+        "<metadata><schema>IMS Common Cartridge</schema><schemaversion>1.1.0</schemaversion>"
+        "<lomimscc:lom><lomimscc:general><lomimscc:title><lomimscc:string>{title}</lomimscc:string>"
+        "</lomimscc:title></lomimscc:general></lomimscc:lom></metadata>\n"
+    ),
+}
+
+def _manifest(standard: str, course_id: str, title: str, outline: List[Tuple[_Entry, List[_Entry]]]) -> str:
+    scorm = standard != "imscc"
+    scorm_type = {"scorm12": "adlcp:scormtype", "scorm2004": "adlcp:scormType"}.get(standard)
+    parts = [
+        '<?xml version="1.0" encoding="UTF-8"?>\n',
+        _MANIFEST_HEADERS[standard].format(identifier=quoteattr(f"MANIFEST-{course_id}"), title=escape(title)),
+        '<organizations default="ORG-1">\n' if scorm else "<organizations>\n",
+        '<organization identifier="ORG-1">\n' if scorm else '<organization identifier="ORG-1" structure="rooted-hierarchy">\n',
+    ]
+    # Common Cartridge nests everything under a single untitled root item
+    parts.append(f"<title>{escape(title)}</title>\n" if scorm else '<item identifier="ROOT">\n')
+    resources = []
+
+    def item(entry: _Entry):
+        parts.append(
+            f'<item identifier="ITEM-{entry.identifier}" identifierref="RES-{entry.identifier}">'
+            f"<title>{escape(entry.title)}</title></item>\n"
+        )
+        files = [entry.href] + ([entry.quiz_href] if entry.quiz_href and scorm else []) + (["shared/scorm.js"] if scorm else [])
+        resources.append(
+            f'<resource identifier="RES-{entry.identifier}" type="webcontent" '
+            + (f'{scorm_type}="sco" ' if scorm else "")
+            + f'href="{entry.href}">' + "".join(f'<file href="{href}"/>' for href in files) + "</resource>\n"
+        )
+        if entry.quiz_href and not scorm:
+            parts.append(
+                f'<item identifier="ITEM-{entry.identifier}-QUIZ" identifierref="RES-{entry.identifier}-QUIZ">'
+                f"<title>Quiz: {escape(entry.title)}</title></item>\n"
+            )
+            resources.append(
+                f'<resource identifier="RES-{entry.identifier}-QUIZ" type="imsqti_xmlv1p2/imscc_xmlv1p1/assessment">'
+                f'<file href="{entry.quiz_href}"/></resource>\n'
+            )
+
+    for module, lessons in outline:
+        if not lessons:
+            if module.href:
+                item(module)
+            continue
+        parts.append(f'<item identifier="ITEM-{module.identifier}"><title>{escape(module.title)}</title>\n')
+        for lesson in lessons:
+            item(lesson)
+        parts.append("</item>\n")
+
+    parts.append("</organization>\n</organizations>\n" if scorm else "</item>\n</organization>\n</organizations>\n")
+    parts += ["<resources>\n"] + resources + ["</resources>\n</manifest>\n"]
+    return "".join(parts)
+
+def _timestamp(course: dict) -> Tuple[int, int, int, int, int, int]:
+    # Members are dated by the course so that the same course packs to the same bytes
+    try:
+        created = datetime.fromisoformat(course["metadata"]["created_at"])
+    except (KeyError, TypeError, ValueError):
+        created = datetime(1980, 1, 1)
+    return max(created, datetime(1980, 1, 1)).timetuple()[:6]
+
+async def package_course(course_id: str, record: dict, standard: str) -> AsyncIterator[bytes]:
+    """
+    Stream a course as a SCORM 1.2, SCORM 2004 or IMS Common Cartridge 1.1 zip.
+
+    Every lesson becomes an HTML page and every quiz a QTI 1.2 assessment.
+    Members are compressed and sent one at a time as the course tree is
+    walked, so memory holds one lesson and the outline for the manifest,
+    which is written last, whatever the size of the course.
+    """
+    course = record.get("course") or record
+    title = course["course_title"]
+    scorm = standard != "imscc"
+    timestamp = _timestamp(course)
+    sink = _ZipSink()
+    outline: List[Tuple[_Entry, List[_Entry]]] = []
+
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as archive:
+        def add(name: str, content: str) -> bytes:
+            info = zipfile.ZipInfo(name, timestamp)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            archive.writestr(info, content.encode("utf-8"))
+            return sink.drain()
+
+        if scorm:
+            yield add("shared/scorm.js", _SCORM_JS)
+
+        overview = (
+            _paragraphs(course["course_description"]) + _paragraphs(course.get("course_introduction"))
+            + (["<h2>Learning outcomes</h2>\n"] + _list(course["learning_outcomes"]) if course.get("learning_outcomes") else [])
+        )
+        yield add("pages/overview.html", _page(title, overview, scorm))
+        outline.append((_Entry("OVERVIEW", "Course overview", "pages/overview.html"), []))
+
+        module_plans = latest_by_title(await children(course_id))
+        for i, info in enumerate(course.get("modules") or [], 1):
+            module_id = module_plans.get(info["module_title"])
+            module = await get_full(module_store, module_id, "module") if module_id else None
+            if module is None:
+                # Only planned so far
+                body = _paragraphs(info["module_summary"]) + ["<h2>Key concepts</h2>\n"] + _list(info.get("key_concepts"))
+                href = f"pages/module-{i}.html"
+                yield add(href, _page(info["module_title"], body, scorm))
+                outline.append((_Entry(f"M{i}", info["module_title"], href), []))
+                continue
+
+            lessons: List[_Entry] = []
+            lesson_ids = latest_by_title(await children(module_id))
+            for j, lesson_info in enumerate(module["lessons"], 1):
+                lesson_id = lesson_ids.get(lesson_info["lesson_title"])
+                lesson = await get_full(lesson_store, lesson_id, "lesson") if lesson_id else None
+                href = f"lessons/{i}-{j}.html"
+                if lesson is None:
+                    body = [f"<p>{html.escape(lesson_info.get('lesson_objective', ''))}</p>\n"] + _list(lesson_info.get("key_points"))
+                    yield add(href, _page(lesson_info["lesson_title"], body, scorm))
+                    lessons.append(_Entry(f"L{i}-{j}", lesson_info["lesson_title"], href))
+                    continue
+
+                quizzes = await children(lesson_id)
+                quiz = await get_full(quiz_store, quizzes[-1]["id"], "quiz") if quizzes else None
+                yield add(href, _lesson_page(lesson, quiz if scorm else None, scorm))
+                quiz_href = None
+                if quiz is not None:
+                    quiz_href = f"quizzes/{i}-{j}.xml"
+                    yield add(quiz_href, _qti(quiz, f"QUIZ-{i}-{j}", f"Quiz: {lesson_info['lesson_title']}"))
+                lessons.append(_Entry(f"L{i}-{j}", lesson_info["lesson_title"], href, quiz_href))
+            outline.append((_Entry(f"M{i}", info["module_title"], None), lessons))
+
+        yield add("imsmanifest.xml", _manifest(standard, course_id, title, outline))
+    # The central directory is written on close
+    yield sink.drain()
@@ -0,0 +1,188 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from app.config import get_settings
+from app.utils.metrics import metrics
+
+logger = logging.getLogger("loop_monitor")
+
+event_loop_lag = metrics.histogram(
+    "event_loop_lag_seconds", "Delay of the event loop in running a task that was due",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+event_loop_blocked = metrics.counter(
+    "event_loop_blocked_total", "Times a callback held the event loop past the watchdog threshold, by code location",
+    ("location",)
+)
+event_loop_blocked_seconds = metrics.histogram(
+    "event_loop_blocked_seconds", "How long callbacks held the event loop past the watchdog threshold",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+
+# Frames from this directory are the application's own code
+_APP_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def _location(stack: List[traceback.FrameSummary]) -> str:
+    """The innermost application frame of a stack, which is where the blocking call was made"""
+    for frame in reversed(stack):
+        if frame.filename.startswith(_APP_ROOT) and "site-packages" not in frame.filename:
+            return f"{os.path.relpath(frame.filename, _APP_ROOT)}:{frame.name}"
+    return f"{os.path.basename(stack[-1].filename)}:{stack[-1].name}" if stack else "unknown"
+
+class BlockingCallWatchdog:
+    """
+    Catches callbacks that hold the event loop, and where they do it.
+
+    A thread posts a probe callback to the loop and checks that it runs
+    within the threshold. When it does not, the loop thread is busy with
+    synchronous work (file or network I/O, parsing, a blocking client),
+    so the watchdog captures the loop thread's stack right then. When the
+    probe finally runs, the stall is logged with that stack and counted by
+    the innermost application frame, which points at the offending call.
+    """
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._probe_sent: Optional[float] = None
+        self._stall_stack: Optional[List[traceback.FrameSummary]] = None
+        self._lock = threading.Lock()
+        self.stalls = 0
+        self.last_stall: Optional[Dict[str, object]] = None
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        if self._thread is not None:
+            return
+        self._loop = loop
+        self._loop_thread_id = threading.get_ident()
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        threshold = get_settings().loop_watchdog_threshold_seconds
+        while not self._stopped.wait(threshold / 4):
+            with self._lock:
+                now = time.monotonic()
+                if self._probe_sent is None:
+                    self._probe_sent = now
+                    try:
+                        self._loop.call_soon_threadsafe(self._probe, now)
+                    except RuntimeError:
+                        # The loop closed under us
+                        return
+                elif self._stall_stack is None and now - self._probe_sent > threshold:
+                    frame = sys._current_frames().get(self._loop_thread_id)
+                    self._stall_stack = traceback.extract_stack(frame) if frame is not None else []
+
+    def _probe(self, sent: float):
+        # Runs on the loop once whatever held it has returned
+        with self._lock:
+            blocked = time.monotonic() - sent
+            stack, self._stall_stack = self._stall_stack, None
+            self._probe_sent = None
+        if stack is None:
+            return
+
+        location = _location(stack)
+        self.stalls += 1
+        self.last_stall = {"location": location, "blocked_seconds": round(blocked, 3), "at": time.time()}
+        event_loop_blocked.inc(location=location)
+        event_loop_blocked_seconds.observe(blocked)
+        logger.warning(
+            f"Event loop blocked for {blocked:.3f}s in {location}:\n"
+            + "".join(traceback.format_list(stack[-get_settings().loop_watchdog_stack_depth:]))
+        )
+
+    def status(self) -> Dict[str, object]:
+        return {
+            "enabled": self._thread is not None,
+            "stalls": self.stalls,
+            "last_stall": self.last_stall
+        }
+
+class LoopLagMonitor:
+    """
+    Samples how late the event loop runs a task that is due.
+
+    A sampler sleeps for a fixed interval and measures how much later than
+    requested it wakes up. The overshoot is the time other callbacks held
+    the loop, i.e. the delay every request on this worker sees before its
+    next step runs. Samples are kept for a rolling window.
+    """
+
+    def __init__(self):
+        self._samples: Deque[Tuple[float, float]] = deque()
+        self._task: Optional[asyncio.Task] = None
+        self.watchdog = BlockingCallWatchdog()
+
+    async def start(self):
+        """Start sampling, and the blocking-call watchdog when it is enabled"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        if get_settings().loop_watchdog_enabled:
+            self.watchdog.start(asyncio.get_running_loop())
+
+    async def stop(self):
+        self.watchdog.stop()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        settings = get_settings()
+        interval = settings.loop_lag_interval
+        while True:
+            expected = time.monotonic() + interval
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            self.record(max(0.0, now - expected), now)
+
+    def record(self, lag: float, now: Optional[float] = None):
+        now = now if now is not None else time.monotonic()
+        self._samples.append((now, lag))
+        event_loop_lag.observe(lag)
+
+        window = get_settings().loop_lag_window_seconds
+        while self._samples and self._samples[0][0] < now - window:
+            self._samples.popleft()
+
+    def percentile(self, percentile: float) -> float:
+        """Lag at a percentile of the rolling window, 0 before the first sample"""
+        lags = sorted(lag for _, lag in self._samples)
+        if not lags:
+            return 0.0
+        return lags[min(len(lags) - 1, int(len(lags) * percentile / 100))]
+
+    def status(self) -> Dict[str, object]:
+        """Summarize the lag over the rolling window and the watchdog's findings for monitoring"""
+        lags = [lag for _, lag in self._samples]
+        return {
+            "running": self._task is not None,
+            "samples": len(lags),
+            "current_seconds": round(lags[-1], 4) if lags else 0.0,
+            "mean_seconds": round(sum(lags) / len(lags), 4) if lags else 0.0,
+            "p95_seconds": round(self.percentile(95), 4),
+            "max_seconds": round(max(lags), 4) if lags else 0.0,
+            "watchdog": self.watchdog.status()
+        }
+
+# Shared monitor of this process's event loop
+loop_monitor = LoopLagMonitor()
@@ -1,47 +1,269 @@
 import os
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
 from langchain_mcp_adapters.client import MultiServerMCPClient
 from langgraph.prebuilt import create_react_agent
 from langchain_google_genai import ChatGoogleGenerativeAI
+from app.config import get_settings
+from app.services.fake_llm import FakeChatModel
+from app.utils.request_context import record_tokens
+from app.utils.tracing import span
 import json
 
+logger = logging.getLogger("mcp_service")
+
+class _Connection:
+    """One set of MCP server sessions, the agents bound to its tools and the calls using them."""
+
+    def __init__(self, client: Optional[MultiServerMCPClient]):
+        self.client = client
+        self.tools: List[Any] = client.get_tools() if client is not None else []
+        self.agents: Dict[str, Any] = {}
+        self.in_use = 0
+        self.drained = asyncio.Event()
+
+    def agent(self, model: ChatGoogleGenerativeAI):
+        key = f"{model.model}:{model.max_output_tokens}"
+        agent = self.agents.get(key)
+        if agent is None:
+            agent = create_react_agent(model, self.tools)
+            self.agents[key] = agent
+        return agent
+
+class MCPClientPool:
+    """
+    Long-lived MCP server sessions and compiled agents shared by all v1 endpoints.
+
+    When a health check finds a dead server, new calls move to freshly
+    spawned sessions at once, while the old sessions are only shut down
+    after the calls still using them finish, or MCP_DRAIN_TIMEOUT passes.
+    """
+
+    def __init__(self):
+        """Initialize an empty pool; sessions are opened by start()."""
+        self.connection: Optional[_Connection] = None
+        self.restarts = 0
+        self.last_error: Optional[str] = None
+        self._lock = asyncio.Lock()
+        self._health_task: Optional[asyncio.Task] = None
+        # Replaced connections waiting for their calls to finish
+        self._draining: Dict[_Connection, asyncio.Task] = {}
+
+    @property
+    def client(self) -> Optional[MultiServerMCPClient]:
+        return self.connection.client if self.connection is not None else None
+
+    async def start(self):
+        """Spawn the configured MCP servers and start the health check loop."""
+        async with self._lock:
+            if self.connection is None:
+                if get_settings().llm_backend == "fake":
+                    # The simulated model never calls tools, so agents run without servers
+                    self.connection = _Connection(None)
+                    return
+                self.connection = await self._connect()
+
+        if self._health_task is None:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def stop(self):
+        """Stop the health check loop and shut down all MCP servers."""
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+
+        async with self._lock:
+            connection, self.connection = self.connection, None
+            draining, self._draining = self._draining, {}
+            for task in draining.values():
+                task.cancel()
+            await asyncio.gather(*draining.values(), return_exceptions=True)
+            for old in list(draining) + ([connection] if connection is not None else []):
+                await self._disconnect(old)
+
+    @asynccontextmanager
+    async def agent(self, model: ChatGoogleGenerativeAI):
+        """Lease the compiled agent for a model, connecting the pool on first use."""
+        if self.connection is None:
+            await self.start()
+
+        # A restart during the call swaps the pool's connection but leaves this one open
+        connection = self.connection
+        if connection.in_use == 0:
+            # Set by the previous last call; a drain must wait for this one too
+            connection.drained.clear()
+        connection.in_use += 1
+        try:
+            yield connection.agent(model)
+        finally:
+            connection.in_use -= 1
+            if connection.in_use == 0:
+                connection.drained.set()
+
+    async def health_check(self) -> bool:
+        """Ping every MCP session and replace the servers if any of them is dead."""
+        connection = self.connection
+        if connection is None or connection.client is None:
+            return False
+
+        timeout = get_settings().mcp_health_check_timeout
+        for name, session in list(connection.client.sessions.items()):
+            try:
+                await asyncio.wait_for(session.send_ping(), timeout=timeout)
+            except Exception as e:
+                logger.warning(f"MCP server '{name}' failed health check: {str(e)}")
+                async with self._lock:
+                    if self.connection is connection:
+                        self.connection = await self._connect()
+                        self.restarts += 1
+                        self._draining[connection] = asyncio.create_task(self._drain(connection))
+                return False
+        return True
+
+    def status(self) -> Dict[str, Any]:
+        """Summarize the pool state for monitoring."""
+        connection = self.connection
+        return {
+            "connected": self.client is not None,
+            "servers": list(self.client.sessions.keys()) if self.client else [],
+            "tools": len(connection.tools) if connection is not None else 0,
+            "in_use": connection.in_use if connection is not None else 0,
+            "draining": len(self._draining),
+            "restarts": self.restarts,
+            "last_error": self.last_error
+        }
+
+    async def _connect(self) -> _Connection:
+        try:
+            config = LangChainAgent.get_mcp_server_config()
+        except (OSError, json.JSONDecodeError) as e:
+            # Run without tools rather than failing every request
+            logger.warning(f"Could not load MCP server configuration: {str(e)}")
+            self.last_error = str(e)
+            config = {}
+
+        client = MultiServerMCPClient(config)
+        try:
+            await client.__aenter__()
+        except Exception as e:
+            logger.error(f"Error starting MCP servers: {str(e)}")
+            self.last_error = str(e)
+            try:
+                await client.__aexit__(None, None, None)
+            except Exception:
+                pass
+            client = MultiServerMCPClient({})
+            await client.__aenter__()
+
+        # Agents are compiled per connection, bound to its tools
+        connection = _Connection(client)
+        logger.info(f"MCP pool connected with {len(connection.tools)} tools")
+        return connection
+
+    async def _drain(self, connection: _Connection):
+        """Shut down a replaced connection once the calls still using it have finished."""
+        try:
+            if connection.in_use:
+                timeout = get_settings().mcp_drain_timeout
+                try:
+                    await asyncio.wait_for(self._wait_idle(connection), timeout=timeout)
+                except asyncio.TimeoutError:
+                    logger.warning(f"Closing replaced MCP servers with {connection.in_use} calls still running after {timeout:.0f}s")
+            await self._disconnect(connection)
+        finally:
+            self._draining.pop(connection, None)
+
+    @staticmethod
+    async def _wait_idle(connection: _Connection):
+        while connection.in_use:
+            await connection.drained.wait()
+
+    async def _disconnect(self, connection: _Connection):
+        if connection.client is None:
+            return
+        try:
+            await connection.client.__aexit__(None, None, None)
+        except Exception as e:
+            logger.warning(f"Error shutting down MCP servers: {str(e)}")
+
+    async def _health_loop(self):
+        interval = get_settings().mcp_health_check_interval
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.health_check()
+            except Exception as e:
+                logger.error(f"MCP health check error: {str(e)}")
+                self.last_error = str(e)
+
+# Shared pool used by every LangChainAgent in this process
+mcp_pool = MCPClientPool()
+
 class LangChainAgent:
     def __init__(self):
         """Initialize the LangChain agent."""
-        self.model = ChatGoogleGenerativeAI(
-            model="gemini-2.0-flash-exp", 
-            google_api_key=os.getenv("GOOGLE_API_KEY")
-        )
-    
-    async def get_response(self, message):
+        self._models: Dict[Any, ChatGoogleGenerativeAI] = {}
+        self.model = self.get_model(get_settings().model_name)
+
+    def get_model(self, model_name: str, max_output_tokens: Optional[int] = None) -> ChatGoogleGenerativeAI:
+        """Return the chat model for a routed model name and output budget."""
+        key = (model_name, max_output_tokens)
+        model = self._models.get(key)
+        if model is None:
+            if get_settings().llm_backend == "fake":
+                model = FakeChatModel(model=model_name, max_output_tokens=max_output_tokens)
+            else:
+                model = ChatGoogleGenerativeAI(
+                    model=model_name,
+                    max_output_tokens=max_output_tokens,
+                    google_api_key=os.getenv("GOOGLE_API_KEY")
+                )
+            self._models[key] = model
+        return model
+
+    async def get_response(self, message, model: Optional[ChatGoogleGenerativeAI] = None, task: str = "default"):
         """Get a response from the LangChain agent."""
-        # Connect to the MCP clients
-        async with MultiServerMCPClient(self.get_mcp_server_config()) as client:
-            # Create the agent with available tools
-            agent = create_react_agent(self.model, client.get_tools())
-            
-            # Create formatted input for the agent
-            formatted_input = {"messages": [{"type": "human", "content": message}]}
-            
-            # Invoke the agent with the message
-            response = await agent.ainvoke(formatted_input)
-            
+        # Create formatted input for the agent
+        formatted_input = {"messages": [{"type": "human", "content": message}]}
+
+        with span("agent.invoke", task=task, prompt_chars=len(message)) as invocation:
+            # Reuse the warm MCP sessions and compiled agent from the shared pool; the
+            # lease keeps the sessions open until the call is done, even across a restart
+            async with mcp_pool.agent(model or self.model) as agent:
+                # Invoke the agent with the message
+                response = await agent.ainvoke(formatted_input)
+
+            # Every model turn of the agent loop reports its own usage
+            tokens_in = tokens_out = 0
+            for message in response["messages"]:
+                usage = getattr(message, "usage_metadata", None)
+                if usage:
+                    tokens_in += usage.get("input_tokens", 0)
+                    tokens_out += usage.get("output_tokens", 0)
+            record_tokens(task, tokens_in, tokens_out)
+
             response = response["messages"][-1].content
-            
-            # print("LangChain Response:", response)
-            
-            # Return the full response
-            return response
-    
+            invocation.set("output_chars", len(str(response)))
+            invocation.set("tokens_in", tokens_in)
+            invocation.set("tokens_out", tokens_out)
+
+        # print("LangChain Response:", response)
+
+        # Return the full response
+        return response
+
     @staticmethod
     def get_mcp_server_config():
         """Get the MCP server configuration from JSON file."""
-        
+
         # Get the absolute path to the config file
-        config_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 
+        config_path = os.path.join(os.path.dirname(os.path.dirname(__file__)),
                                    'mcp_servers', 'mcp.json')
-        
+
         # Load the configuration from the JSON file
         with open(config_path, 'r') as f:
             config = json.load(f)
-            
+
         return config
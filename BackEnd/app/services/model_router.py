@@ -0,0 +1,192 @@
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, NamedTuple, Tuple
+
+from app.config import get_settings
+from app.utils.metrics import metrics
+
+logger = logging.getLogger("model_router")
+
+circuit_state = metrics.gauge(
+    "llm_circuit_open", "1 while the circuit breaker of a model is open", ("model",)
+)
+routed_calls = metrics.counter(
+    "llm_routed_calls_total", "Model calls by task, model and route tier", ("task", "model", "tier")
+)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class Route(NamedTuple):
+    """Model and output budget selected for one call"""
+    task: str
+    model_name: str
+    max_output_tokens: int
+    tier: str
+
+class CircuitBreaker:
+    """
+    Tracks recent call outcomes of one model and opens when it misbehaves.
+
+    The breaker opens when at least `min_calls` calls in the last `window`
+    seconds have an error rate or a mean latency above the thresholds. After
+    `open_seconds` a single probe call is let through (half-open); a success
+    closes the breaker again and a failure re-opens it.
+    """
+
+    def __init__(
+        self, model_name: str, error_threshold: float, latency_threshold: float,
+        min_calls: int, window: float, open_seconds: float
+    ):
+        self.model_name = model_name
+        self.error_threshold = error_threshold
+        self.latency_threshold = latency_threshold
+        self.min_calls = min_calls
+        self.window = window
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.trips = 0
+        self._probing = False
+        self._probe_started = 0.0
+        self._outcomes: Deque[Tuple[float, bool, float]] = deque()
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a call may be sent to the model right now"""
+        now = time.monotonic()
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and now - self.opened_at >= self.open_seconds:
+                self.state = HALF_OPEN
+                self._probing = False
+            # A probe that never reported back (e.g. a cancelled request) must not block recovery
+            if self.state == HALF_OPEN and (not self._probing or now - self._probe_started >= self.open_seconds):
+                self._probing = True
+                self._probe_started = now
+                return True
+            return False
+
+    def record(self, ok: bool, latency: float = 0.0):
+        """Record the outcome of one call"""
+        now = time.monotonic()
+        with self._lock:
+            if self.state == HALF_OPEN:
+                if ok and latency < self.latency_threshold:
+                    self._close()
+                else:
+                    self._open(now, "probe call failed")
+                return
+
+            self._outcomes.append((now, ok, latency))
+            while self._outcomes and now - self._outcomes[0][0] > self.window:
+                self._outcomes.popleft()
+
+            if self.state != CLOSED or len(self._outcomes) < self.min_calls:
+                return
+            error_rate = sum(1 for _, success, _ in self._outcomes if not success) / len(self._outcomes)
+            latencies = [seconds for _, success, seconds in self._outcomes if success]
+            mean_latency = sum(latencies) / len(latencies) if latencies else 0.0
+            if error_rate >= self.error_threshold:
+                self._open(now, f"error rate {error_rate:.0%}")
+            elif mean_latency >= self.latency_threshold:
+                self._open(now, f"mean latency {mean_latency:.1f}s")
+
+    def _open(self, now: float, reason: str):
+        self.state = OPEN
+        self.opened_at = now
+        self.trips += 1
+        self._probing = False
+        self._outcomes.clear()
+        circuit_state.set(1, model=self.model_name)
+        logger.warning(f"Circuit for {self.model_name} opened ({reason}), using fallback model")
+
+    def _close(self):
+        self.state = CLOSED
+        self._probing = False
+        self._outcomes.clear()
+        circuit_state.set(0, model=self.model_name)
+        logger.info(f"Circuit for {self.model_name} closed")
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self.state,
+                "trips": self.trips,
+                "recent_calls": len(self._outcomes)
+            }
+
+class ModelRouter:
+    """
+    Picks the model and output budget for each task.
+
+    Tasks are looked up in the `model_routes` setting; unknown tasks use
+    `model_name` with the default output budget. While a route's model has an
+    open circuit, calls go to `fallback_model_name` with the same budget.
+    """
+
+    def __init__(self):
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def route(self, task: str) -> Route:
+        """Return the configured primary route of a task"""
+        settings = get_settings()
+        config = settings.model_routes.get(task, {})
+        return Route(
+            task,
+            config.get("model", settings.model_name),
+            config.get("max_output_tokens", settings.default_max_output_tokens),
+            "primary"
+        )
+
+    def select(self, task: str) -> Route:
+        """Return the route to use for the next call, falling back while the primary circuit is open"""
+        route = self.route(task)
+        fallback = get_settings().fallback_model_name
+        if fallback and fallback != route.model_name and not self.breaker(route.model_name).allow():
+            route = route._replace(model_name=fallback, tier="fallback")
+        routed_calls.inc(task=task, model=route.model_name, tier=route.tier)
+        return route
+
+    def breaker(self, model_name: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(model_name)
+            if breaker is None:
+                settings = get_settings()
+                breaker = CircuitBreaker(
+                    model_name,
+                    settings.circuit_error_threshold,
+                    settings.circuit_latency_threshold,
+                    settings.circuit_min_calls,
+                    settings.circuit_window_seconds,
+                    settings.circuit_open_seconds
+                )
+                self._breakers[model_name] = breaker
+            return breaker
+
+    def record_success(self, model_name: str, latency: float):
+        self.breaker(model_name).record(True, latency)
+
+    def record_failure(self, model_name: str):
+        self.breaker(model_name).record(False)
+
+    def status(self) -> Dict[str, Any]:
+        """Summarize the routing table and the circuit state of every model seen so far"""
+        settings = get_settings()
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {
+            "routes": {
+                task: self.route(task)._asdict() for task in settings.model_routes
+            },
+            "fallback_model": settings.fallback_model_name,
+            "circuits": {name: breaker.status() for name, breaker in breakers.items()}
+        }
+
+# Shared router for every AI service in this process
+model_router = ModelRouter()
@@ -0,0 +1,168 @@
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from pydantic import BaseModel
+
+from app.config import get_settings
+from app.services.ai_service_v2 import get_generation_slots
+from app.services.rate_limiter import quota_limiter
+from app.utils.metrics import metrics
+from app.utils.request_context import SPECULATIVE, current_priority, set_priority, start_request
+
+logger = logging.getLogger("prefetch")
+
+speculative_generations = metrics.counter(
+    "speculative_generations_total", "Speculative follow-up generations by kind and outcome", ("kind", "result")
+)
+
+def is_speculative() -> bool:
+    """Whether the current task is a speculative generation, which never speculates further"""
+    return current_priority() == SPECULATIVE
+
+class _Prefetch:
+    __slots__ = ("kind", "task", "expires_at")
+
+    def __init__(self, kind: str, task: asyncio.Task, expires_at: float):
+        self.kind = kind
+        self.task = task
+        self.expires_at = expires_at
+
+class Prefetcher:
+    """
+    Speculatively generates the follow-up requests a client is expected to send.
+
+    After a course plan, each module plan is started in the background with
+    exactly the request a client builds from the plan, and after a module
+    plan each of its lessons. When that request arrives, it takes the
+    finished result or joins the generation still in flight. Results are
+    only stored, and so become part of the course, once a request claims
+    them; unclaimed speculation leaves no trace. Speculation
+    is only started while model calls are idle, and speculation nobody has
+    claimed yet is cancelled as soon as calls queue for a generation slot
+    or for quota.
+    """
+
+    def __init__(self):
+        self._generators: Dict[str, Callable[[Any], Awaitable[Any]]] = {}
+        self._stores: Dict[str, Callable[[Any, Any], Awaitable[None]]] = {}
+        self._entries: "OrderedDict[str, _Prefetch]" = OrderedDict()
+
+    def register(
+        self, kind: str, fn: Callable[[Any], Awaitable[Any]],
+        store: Optional[Callable[[Any, Any], Awaitable[None]]] = None
+    ):
+        """Set the function that generates a request of this kind, and the one that stores its served result"""
+        self._generators[kind] = fn
+        if store is not None:
+            self._stores[kind] = store
+
+    @staticmethod
+    def key(kind: str, request: BaseModel) -> str:
+        payload = f"{kind}:{request.model_dump_json()}"
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def overloaded() -> bool:
+        """Whether real requests are waiting for model capacity"""
+        return get_generation_slots().locked() or quota_limiter.queued() > 0
+
+    def _inflight(self) -> int:
+        return sum(1 for entry in self._entries.values() if not entry.task.done())
+
+    def _discard(self, key: str, result: str):
+        entry = self._entries.pop(key)
+        if not entry.task.done():
+            entry.task.cancel()
+        speculative_generations.inc(kind=entry.kind, result=result)
+
+    def _prune(self):
+        now = time.monotonic()
+        for key in [key for key, entry in self._entries.items() if entry.expires_at <= now]:
+            self._discard(key, "expired")
+
+    def shed(self):
+        """Cancel unclaimed speculation that is still running"""
+        for key in [key for key, entry in self._entries.items() if not entry.task.done()]:
+            self._discard(key, "cancelled")
+
+    def schedule(self, kind: str, requests: List[BaseModel]):
+        """Start speculative generations of the expected follow-up requests"""
+        settings = get_settings()
+        if not settings.speculative_prefetch_enabled or is_speculative():
+            return
+
+        self._prune()
+        if self.overloaded():
+            self.shed()
+            return
+
+        for request in requests:
+            key = self.key(kind, request)
+            if key in self._entries:
+                continue
+            if self._inflight() >= settings.prefetch_max_inflight:
+                speculative_generations.inc(kind=kind, result="skipped")
+                continue
+            while len(self._entries) >= settings.prefetch_max_entries:
+                self._discard(next(iter(self._entries)), "evicted")
+
+            task = asyncio.create_task(self._run(kind, self._generators[kind], request))
+            # Unclaimed failures are expected; don't log them as never retrieved
+            task.add_done_callback(lambda done: done.cancelled() or done.exception())
+            self._entries[key] = _Prefetch(kind, task, time.monotonic() + settings.prefetch_ttl_seconds)
+            speculative_generations.inc(kind=kind, result="started")
+
+    @staticmethod
+    async def _run(kind: str, fn: Callable[[Any], Awaitable[Any]], request: BaseModel) -> Any:
+        # Queued behind real requests, which also drop it from the queue
+        set_priority(SPECULATIVE)
+        # Keep speculative tokens out of the request that triggered them
+        start_request()
+        try:
+            return await fn(request)
+        except Exception as e:
+            logger.info(f"Speculative {kind} generation failed: {str(e)}")
+            raise
+
+    async def serve(self, kind: str, request: BaseModel) -> Any:
+        """Return the speculative result for a request, joining it if in flight, or generate it, and store it"""
+        result = await self._claim_or_generate(kind, request)
+        store = self._stores.get(kind)
+        if store is not None:
+            await store(request, result)
+        return result
+
+    async def _claim_or_generate(self, kind: str, request: BaseModel) -> Any:
+        self._prune()
+        if self.overloaded():
+            self.shed()
+
+        # Cancelled entries leave the store when they are cancelled, so the task is live or finished
+        entry = self._entries.pop(self.key(kind, request), None)
+        if entry is not None:
+            joined = not entry.task.done()
+            try:
+                result = await entry.task
+            except Exception:
+                # Includes speculation preempted by real requests; generate it for real instead
+                speculative_generations.inc(kind=kind, result="failed")
+            else:
+                speculative_generations.inc(kind=kind, result="joined" if joined else "hit")
+                return result
+
+        return await self._generators[kind](request)
+
+    def status(self) -> dict:
+        """Summarize pending speculation for monitoring"""
+        return {
+            "enabled": get_settings().speculative_prefetch_enabled,
+            "entries": len(self._entries),
+            "inflight": self._inflight()
+        }
+
+# Shared prefetcher for this process
+prefetcher = Prefetcher()
@@ -0,0 +1,294 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from app.config import get_settings
+from app.services.scheduler import PriorityScheduler
+from app.utils.metrics import metrics
+from app.utils.tokens import estimate_tokens
+
+logger = logging.getLogger("rate_limiter")
+
+quota_queue_depth = metrics.gauge(
+    "llm_quota_queue_depth", "Model calls waiting for rate limit quota", ("model",)
+)
+quota_wait_seconds = metrics.histogram(
+    "llm_quota_wait_seconds", "Time model calls spent waiting for rate limit quota", ("model",)
+)
+quota_errors = metrics.counter(
+    "llm_quota_errors_total", "Quota errors returned by the model provider", ("model",)
+)
+
+class TokenBucket:
+    """Token bucket that refills continuously up to its capacity"""
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_per_second)
+        self.updated = now
+
+    def time_until(self, amount: float) -> float:
+        """Seconds until `amount` tokens are available"""
+        self._refill()
+        missing = min(amount, self.capacity) - self.tokens
+        return max(0.0, missing / self.refill_per_second)
+
+    def take(self, amount: float):
+        """Consume tokens; the balance may go negative to settle a usage correction"""
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def available(self) -> float:
+        self._refill()
+        return self.tokens
+
+class QuotaStore:
+    """
+    Request and token buckets of every model in a SQLite file shared by the worker processes of a host.
+
+    Each check-and-take runs in one write transaction, so all workers
+    draw from the same per-model budget. Buckets refill by wall-clock time.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Wait for other workers' transactions instead of failing
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS quota_buckets ("
+                "model TEXT PRIMARY KEY, requests REAL NOT NULL, tokens REAL NOT NULL, "
+                "paused_until REAL NOT NULL, updated REAL NOT NULL)"
+            )
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def _load(conn: sqlite3.Connection, model_name: str, rpm: int, tpm: int, now: float) -> Tuple[float, float, float]:
+        """Refilled request and token balances of a model and the time its calls are paused until"""
+        row = conn.execute(
+            "SELECT requests, tokens, paused_until, updated FROM quota_buckets WHERE model = ?", (model_name,)
+        ).fetchone()
+        if row is None:
+            return rpm, tpm, 0.0
+        requests, tokens, paused_until, updated = row
+        elapsed = max(0.0, now - updated)
+        return min(rpm, requests + elapsed * rpm / 60.0), min(tpm, tokens + elapsed * tpm / 60.0), paused_until
+
+    def _update(self, model_name: str, rpm: int, tpm: int, change) -> Any:
+        """Run change(requests, tokens, paused_until, now) on the refilled buckets and store the balances it returns"""
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                requests, tokens, paused_until = self._load(conn, model_name, rpm, tpm, now)
+                requests, tokens, paused_until, result = change(requests, tokens, paused_until, now)
+                conn.execute(
+                    "INSERT OR REPLACE INTO quota_buckets (model, requests, tokens, paused_until, updated) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (model_name, requests, tokens, paused_until, now)
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return result
+
+    def reserve(self, model_name: str, rpm: int, tpm: int, amount: float) -> float:
+        """Take one request and `amount` tokens, or return the seconds until they are available"""
+        amount = min(amount, tpm)
+
+        def change(requests, tokens, paused_until, now):
+            wait = max((1 - requests) * 60.0 / rpm, (amount - tokens) * 60.0 / tpm, paused_until - now)
+            if wait > 0:
+                return requests, tokens, paused_until, wait
+            return requests - 1, tokens - amount, paused_until, 0.0
+
+        return self._update(model_name, rpm, tpm, change)
+
+    def correct(self, model_name: str, rpm: int, tpm: int, amount: float):
+        """Charge a token usage correction; the balance may go negative"""
+        self._update(model_name, rpm, tpm, lambda requests, tokens, paused_until, now: (
+            requests, tokens - min(amount, tpm), paused_until, None
+        ))
+
+    def pause(self, model_name: str, rpm: int, tpm: int, seconds: float):
+        """Stop every worker's calls to the model for the given time"""
+        self._update(model_name, rpm, tpm, lambda requests, tokens, paused_until, now: (
+            requests, tokens, max(paused_until, now + seconds), None
+        ))
+
+    def balances(self, model_name: str, rpm: int, tpm: int) -> Tuple[float, float, float]:
+        """Available requests and tokens and the seconds the model stays paused"""
+        now = time.time()
+        with self._lock:
+            requests, tokens, paused_until = self._load(self._connect(), model_name, rpm, tpm, now)
+        return requests, tokens, max(0.0, paused_until - now)
+
+class ModelQuota:
+    """
+    Requests-per-minute and tokens-per-minute budget of one model.
+
+    The budget lives in the shared QuotaStore when there is one, and in
+    this process's token buckets otherwise.
+    """
+
+    def __init__(self, model_name: str, rpm: int, tpm: int, store: Optional[QuotaStore] = None):
+        self.model_name = model_name
+        self.store = store
+        self.requests = TokenBucket(rpm, rpm / 60.0)
+        self.tokens = TokenBucket(tpm, tpm / 60.0)
+        self.paused_until = 0.0
+        self.waiting = 0
+        # One caller at a time checks the budget, taking turns by priority class
+        self.queue = PriorityScheduler(1, f"quota:{model_name}")
+
+    async def reserve(self, amount: float) -> float:
+        """Take one request and `amount` tokens, or return the seconds until they are available"""
+        if self.store is not None:
+            return await asyncio.to_thread(
+                self.store.reserve, self.model_name, self.requests.capacity, self.tokens.capacity, amount
+            )
+        wait = max(
+            self.requests.time_until(1),
+            self.tokens.time_until(amount),
+            self.paused_until - time.monotonic()
+        )
+        if wait > 0:
+            return wait
+        self.requests.take(1)
+        self.tokens.take(amount)
+        return 0.0
+
+    async def correct(self, amount: float):
+        if self.store is not None:
+            await asyncio.to_thread(
+                self.store.correct, self.model_name, self.requests.capacity, self.tokens.capacity, amount
+            )
+        else:
+            self.tokens.take(amount)
+
+    async def pause(self, seconds: float):
+        if self.store is not None:
+            await asyncio.to_thread(
+                self.store.pause, self.model_name, self.requests.capacity, self.tokens.capacity, seconds
+            )
+        else:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def balances(self) -> Tuple[float, float, float]:
+        """Available requests and tokens and the seconds the model stays paused"""
+        if self.store is not None:
+            return self.store.balances(self.model_name, self.requests.capacity, self.tokens.capacity)
+        return self.requests.available(), self.tokens.available(), max(0.0, self.paused_until - time.monotonic())
+
+class QuotaLimiter:
+    """
+    Queues model calls until the per-model RPM and TPM budgets allow them.
+
+    Callers are served per model in weighted fair order of their priority
+    class. Each call is charged the estimated prompt tokens up front and
+    corrected with the real usage afterwards. A quota error from the provider pauses the model's queue
+    instead of failing the waiting calls.
+
+    With the sqlite store backend the budgets are kept in the shared store,
+    so the configured limits hold for all worker processes of the host
+    together; with the memory backend each process has its own budget.
+    """
+
+    def __init__(self):
+        settings = get_settings()
+        self._quotas: Dict[str, ModelQuota] = {}
+        self._store = QuotaStore(settings.store_path) if settings.store_backend == "sqlite" else None
+
+    def _quota(self, model_name: str) -> ModelQuota:
+        quota = self._quotas.get(model_name)
+        if quota is None:
+            settings = get_settings()
+            limits = settings.model_rate_limits.get(model_name, {})
+            quota = ModelQuota(
+                model_name,
+                limits.get("rpm", settings.default_rpm),
+                limits.get("tpm", settings.default_tpm),
+                self._store
+            )
+            self._quotas[model_name] = quota
+        return quota
+
+    async def acquire(self, model_name: str, estimated_tokens: int) -> float:
+        """Wait until the model has quota for one call and return the time spent waiting"""
+        quota = self._quota(model_name)
+        started = time.monotonic()
+
+        quota.waiting += 1
+        quota_queue_depth.set(quota.waiting, model=model_name)
+        try:
+            async with quota.queue:
+                while True:
+                    wait = await quota.reserve(estimated_tokens)
+                    if wait <= 0:
+                        break
+                    await asyncio.sleep(wait)
+        finally:
+            quota.waiting -= 1
+            quota_queue_depth.set(quota.waiting, model=model_name)
+
+        waited = time.monotonic() - started
+        quota_wait_seconds.observe(waited, model=model_name)
+        if waited > 1:
+            logger.info(f"Model call to {model_name} waited {waited:.1f}s for quota")
+        return waited
+
+    async def record_usage(self, model_name: str, estimated_tokens: int, actual_tokens: Optional[int]):
+        """Correct the token budget with the usage reported by the provider"""
+        if actual_tokens:
+            await self._quota(model_name).correct(actual_tokens - estimated_tokens)
+
+    async def penalize(self, model_name: str, retry_after: float):
+        """Pause the model's queue after the provider reported exhausted quota"""
+        await self._quota(model_name).pause(retry_after)
+        quota_errors.inc(model=model_name)
+        logger.warning(f"Quota exhausted for {model_name}, pausing calls for {retry_after:.0f}s")
+
+    def queued(self) -> int:
+        """Total number of calls waiting for quota across all models"""
+        return sum(quota.waiting for quota in self._quotas.values())
+
+    def status(self) -> Dict[str, Any]:
+        """Summarize remaining headroom and queue depth per model"""
+        status = {}
+        # Copied first, as health checks call this from a thread while the loop adds models
+        for model_name, quota in list(self._quotas.items()):
+            requests, tokens, paused_for = quota.balances()
+            status[model_name] = {
+                "requests_available": round(requests, 2),
+                "requests_per_minute": quota.requests.capacity,
+                "tokens_available": int(tokens),
+                "tokens_per_minute": quota.tokens.capacity,
+                "queued": quota.waiting,
+                "paused_for_seconds": round(paused_for, 1)
+            }
+        return status
+
+# Shared limiter for every AI service in this process
+quota_limiter = QuotaLimiter()
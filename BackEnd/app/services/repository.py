@@ -0,0 +1,354 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from app.config import get_settings
+from app.utils.lru import ByteLRU
+from app.utils.metrics import metrics
+
+logger = logging.getLogger("repository")
+
+repository_reads = metrics.counter(
+    "repository_reads_total", "Repository lookups by namespace and where they were answered", ("namespace", "result")
+)
+repository_cache_bytes = metrics.gauge(
+    "repository_cache_bytes", "Resident size of the records cached in memory by namespace", ("namespace",)
+)
+repository_cache_evictions = metrics.counter(
+    "repository_cache_evictions_total", "Records dropped from memory by size limit or TTL, by namespace", ("namespace",)
+)
+repository_load_seconds = metrics.histogram(
+    "repository_load_seconds", "Time to reload a record from disk into memory by namespace", ("namespace",),
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+)
+repository_commit_batch = metrics.histogram(
+    "repository_commit_batch_size", "Writes committed together in one SQLite transaction",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)
+)
+
+def encode_record(value: Any, compress: bool = False) -> Tuple[Union[str, bytes], int]:
+    """
+    Stored form of a record in the SQLite store and its uncompressed size.
+
+    A pure function, so callers can build large records in a worker
+    process and pass the result to Repository.set().
+    """
+    raw = json.dumps(value, default=str)
+    if not compress:
+        return raw, len(raw)
+    return zlib.compress(raw.encode("utf-8"), get_settings().store_compression_level), len(raw)
+
+class Repository(ABC):
+    """
+    Async key-value store of JSON-serializable records in one namespace.
+
+    Handlers keep the context of generated items here (course, module,
+    lesson and document state) so that follow-up requests can find it.
+    Records are written once under a new ID, so cached copies never go
+    stale. Use get_repository() to get the configured backend.
+    """
+
+    # Whether stored records are zlib-compressed, see encode_record()
+    compress = False
+
+    def __init__(self, namespace: str):
+        self.namespace = namespace
+        self._evict_listeners: List[Callable[[str, str], None]] = []
+
+    def on_evict(self, listener: Callable[[str, str], None]):
+        """
+        Call listener(key, reason) whenever a record leaves this worker's memory or is deleted.
+
+        The reason is "evicted" when the record made room for others and is
+        reloaded on its next access, "expired" when it went unused for the
+        TTL, and "deleted" when it is gone for good.
+        """
+        self._evict_listeners.append(listener)
+
+    def _notify_evicted(self, key: str, reason: str):
+        for listener in self._evict_listeners:
+            try:
+                listener(key, reason)
+            except Exception as e:
+                logger.warning(f"Eviction listener failed for {self.namespace}/{key}: {str(e)}")
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[Any]:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value: Any, encoded: Optional[Tuple[Union[str, bytes], int]] = None):
+        """Store a record; `encoded` is its encode_record() form when the caller already built it"""
+
+    @abstractmethod
+    async def delete(self, key: str):
+        ...
+
+    @abstractmethod
+    async def count(self) -> int:
+        ...
+
+    @abstractmethod
+    async def items(self, prefix: str) -> List[Tuple[str, Any]]:
+        """All records whose key starts with the prefix, in key order"""
+
+    async def contains(self, key: str) -> bool:
+        return await self.get(key) is not None
+
+    def status(self) -> Dict[str, Any]:
+        return {}
+
+class MemoryRepository(Repository):
+    """Records in a dict of this process; only correct with a single worker"""
+
+    def __init__(self, namespace: str):
+        super().__init__(namespace)
+        self._records: Dict[str, Any] = {}
+
+    async def get(self, key: str) -> Optional[Any]:
+        return self._records.get(key)
+
+    async def set(self, key: str, value: Any, encoded: Optional[Tuple[Union[str, bytes], int]] = None):
+        self._records[key] = value
+
+    async def delete(self, key: str):
+        self._records.pop(key, None)
+        self._notify_evicted(key, "deleted")
+
+    async def count(self) -> int:
+        return len(self._records)
+
+    async def items(self, prefix: str) -> List[Tuple[str, Any]]:
+        return sorted(
+            ((key, value) for key, value in self._records.items() if key.startswith(prefix)),
+            key=lambda item: item[0]
+        )
+
+    def status(self) -> Dict[str, Any]:
+        return {"cached": len(self._records)}
+
+class SQLiteDatabase:
+    """
+    SQLite file in WAL mode shared by every worker process on the host.
+
+    Writes are group-committed: writes arriving within a short window are
+    committed in a single transaction, and each writer resumes once its
+    write is durable. This keeps the number of fsyncs low under load
+    without acknowledging anything another worker cannot read yet.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._pending: List[Tuple[str, str, Optional[Union[str, bytes]], asyncio.Future]] = []
+        self._flush: Optional[asyncio.Task] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Wait for other workers' transactions instead of failing
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS records ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, updated_at REAL NOT NULL, "
+                "PRIMARY KEY (namespace, key))"
+            )
+            self._conn = conn
+        return self._conn
+
+    def read(self, namespace: str, key: str) -> Optional[Union[str, bytes]]:
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT value FROM records WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+        return row[0] if row else None
+
+    def scan(self, namespace: str, prefix: str) -> List[Tuple[str, Union[str, bytes]]]:
+        with self._lock:
+            return self._connect().execute(
+                "SELECT key, value FROM records WHERE namespace = ? AND key >= ? AND key < ? ORDER BY key",
+                (namespace, prefix, prefix + "\uffff")
+            ).fetchall()
+
+    def count(self, namespace: str) -> int:
+        with self._lock:
+            return self._connect().execute(
+                "SELECT COUNT(*) FROM records WHERE namespace = ?", (namespace,)
+            ).fetchone()[0]
+
+    def _commit(self, writes: List[Tuple[str, str, Optional[Union[str, bytes]]]]):
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO records (namespace, key, value, updated_at) VALUES (?, ?, ?, ?)",
+                    [(namespace, key, value, now) for namespace, key, value in writes if value is not None]
+                )
+                conn.executemany(
+                    "DELETE FROM records WHERE namespace = ? AND key = ?",
+                    [(namespace, key) for namespace, key, value in writes if value is None]
+                )
+
+    async def write(self, namespace: str, key: str, value: Optional[Union[str, bytes]]):
+        """Queue a write (None deletes) and return once its batch is committed"""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((namespace, key, value, future))
+        if len(self._pending) >= get_settings().store_commit_max_batch:
+            await self._commit_pending()
+        elif self._flush is None:
+            self._flush = asyncio.create_task(self._flush_later())
+        await future
+
+    async def _flush_later(self):
+        try:
+            await asyncio.sleep(get_settings().store_commit_interval)
+        finally:
+            self._flush = None
+        await self._commit_pending()
+
+    async def _commit_pending(self):
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        repository_commit_batch.observe(len(batch))
+        try:
+            await asyncio.to_thread(self._commit, [(namespace, key, value) for namespace, key, value, _ in batch])
+        except Exception as e:
+            logger.error(f"Committing {len(batch)} repository writes failed: {str(e)}")
+            for *_, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for *_, future in batch:
+            if not future.done():
+                future.set_result(None)
+
+def _sizeof(entry: Tuple[Any, int]) -> int:
+    return entry[1]
+
+class SQLiteRepository(Repository):
+    """
+    Records in the shared SQLite database behind a byte-bounded read-through LRU.
+
+    Records leave memory when the LRU is over `cache_bytes` or after `ttl`
+    seconds, and are reloaded from disk on their next access. With
+    `compress` they are stored zlib-compressed, which suits large records
+    such as extracted documents.
+    """
+
+    def __init__(
+        self, namespace: str, database: SQLiteDatabase, cache_bytes: int,
+        ttl: Optional[float] = None, compress: bool = False
+    ):
+        super().__init__(namespace)
+        self.database = database
+        self.compress = compress
+        # Entries are (record, encoded size)
+        self.cache = ByteLRU(
+            cache_bytes, sizeof=_sizeof, ttl=ttl, on_evict=self._evicted, on_expire=self._expired
+        )
+        self._purged_at = time.monotonic()
+
+    def _evicted(self, key: str, entry: Tuple[Any, int]):
+        repository_cache_evictions.inc(namespace=self.namespace)
+        self._notify_evicted(key, "evicted")
+
+    def _expired(self, key: str, entry: Tuple[Any, int]):
+        repository_cache_evictions.inc(namespace=self.namespace)
+        self._notify_evicted(key, "expired")
+
+    def _cache(self, key: str, value: Any, size: int):
+        self.cache.set(key, (value, size))
+        repository_cache_bytes.set(self.cache.current_bytes, namespace=self.namespace)
+
+    def _purge(self):
+        # Expired records only leave the LRU when touched, so sweep now and then
+        if self.cache.ttl and time.monotonic() - self._purged_at > min(60.0, self.cache.ttl):
+            self._purged_at = time.monotonic()
+            if self.cache.purge_expired():
+                repository_cache_bytes.set(self.cache.current_bytes, namespace=self.namespace)
+
+    @staticmethod
+    def _decode(stored: Union[str, bytes]) -> Tuple[Any, int]:
+        raw = zlib.decompress(stored).decode("utf-8") if isinstance(stored, bytes) else stored
+        return json.loads(raw), len(raw)
+
+    async def get(self, key: str) -> Optional[Any]:
+        self._purge()
+        entry = self.cache.get(key)
+        if entry is not None:
+            repository_reads.inc(namespace=self.namespace, result="cache")
+            return entry[0]
+
+        started = time.monotonic()
+        stored = await asyncio.to_thread(self.database.read, self.namespace, key)
+        if stored is None:
+            # Not cached, so a record another worker writes later is found
+            repository_reads.inc(namespace=self.namespace, result="missing")
+            return None
+        value, size = self._decode(stored)
+        repository_load_seconds.observe(time.monotonic() - started, namespace=self.namespace)
+        repository_reads.inc(namespace=self.namespace, result="database")
+        self._cache(key, value, size)
+        return value
+
+    async def set(self, key: str, value: Any, encoded: Optional[Tuple[Union[str, bytes], int]] = None):
+        self._purge()
+        stored, size = encoded or encode_record(value, self.compress)
+        await self.database.write(self.namespace, key, stored)
+        self._cache(key, value, size)
+
+    async def delete(self, key: str):
+        self.cache.pop(key)
+        repository_cache_bytes.set(self.cache.current_bytes, namespace=self.namespace)
+        await self.database.write(self.namespace, key, None)
+        self._notify_evicted(key, "deleted")
+
+    async def count(self) -> int:
+        return await asyncio.to_thread(self.database.count, self.namespace)
+
+    async def items(self, prefix: str) -> List[Tuple[str, Any]]:
+        # Straight from disk, so records other workers added are included
+        rows = await asyncio.to_thread(self.database.scan, self.namespace, prefix)
+        return [(key, self._decode(stored)[0]) for key, stored in rows]
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "cached": len(self.cache),
+            "cached_bytes": self.cache.current_bytes,
+            "evictions": self.cache.evictions
+        }
+
+_database: Optional[SQLiteDatabase] = None
+
+def get_repository(
+    namespace: str, cache_bytes: Optional[int] = None, ttl: Optional[float] = None, compress: bool = False
+) -> Repository:
+    """
+    Create the repository for a namespace with the configured backend.
+
+    `cache_bytes`, `ttl` and `compress` tune the SQLite backend's memory
+    tier and on-disk format; cache_bytes defaults to STORE_CACHE_BYTES.
+    """
+    global _database
+    settings = get_settings()
+    if settings.store_backend == "memory":
+        return MemoryRepository(namespace)
+    if _database is None:
+        _database = SQLiteDatabase(settings.store_path)
+    return SQLiteRepository(
+        namespace, _database, cache_bytes if cache_bytes is not None else settings.store_cache_bytes, ttl, compress
+    )
@@ -0,0 +1,145 @@
+import asyncio
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+from app.config import get_settings
+from app.utils.metrics import metrics
+from app.utils.request_context import PRIORITY_CLASSES, SPECULATIVE, current_priority
+from app.utils.tracing import span
+
+scheduler_wait_seconds = metrics.histogram(
+    "llm_scheduler_wait_seconds", "Time model calls waited for their turn by queue and priority class",
+    ("queue", "priority")
+)
+scheduler_queued = metrics.gauge(
+    "llm_scheduler_queued", "Model calls waiting for their turn by queue and priority class", ("queue", "priority")
+)
+scheduler_preempted = metrics.counter(
+    "llm_scheduler_preempted_total", "Queued speculative calls dropped for other work", ("queue",)
+)
+
+class SchedulerPreempted(Exception):
+    """A queued speculative call was dropped to make room for real requests"""
+
+class _Waiter:
+    __slots__ = ("priority", "tag", "future")
+
+    def __init__(self, priority: str, tag: float, future: asyncio.Future):
+        self.priority = priority
+        self.tag = tag
+        self.future = future
+
+class PriorityScheduler:
+    """
+    Admits up to `capacity` holders at a time, queueing the rest by priority class.
+
+    Waiting callers are served in weighted fair order: each class advances
+    its own virtual finish time by 1/weight per queued call, and the call
+    with the lowest finish time goes next. Under contention each class gets
+    a share of admissions proportional to its weight. No class starves, and
+    a burst of batch work cannot push interactive calls to the back of the
+    line. Queued speculative calls are preempted as soon as any other call
+    has to queue; calls that already hold a slot are never interrupted.
+
+    The class of a caller is taken from the request context, see
+    app.utils.request_context.current_priority.
+    """
+
+    def __init__(self, capacity: int, name: str):
+        self.capacity = capacity
+        self.name = name
+        self.running = 0
+        self._queues: Dict[str, Deque[_Waiter]] = {priority: deque() for priority in PRIORITY_CLASSES}
+        self._finish_tags: Dict[str, float] = {priority: 0.0 for priority in PRIORITY_CLASSES}
+        self._virtual_time = 0.0
+
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def locked(self) -> bool:
+        """Whether a new caller would have to wait"""
+        return self.running >= self.capacity or self.queued() > 0
+
+    async def acquire(self, priority: Optional[str] = None) -> float:
+        """Wait for a slot and return the time spent waiting"""
+        priority = priority or current_priority()
+        if not self.locked():
+            self.running += 1
+            return 0.0
+
+        if priority != SPECULATIVE:
+            self._preempt_speculative()
+
+        weight = get_settings().priority_weights.get(priority, 1.0)
+        tag = max(self._virtual_time, self._finish_tags[priority]) + 1.0 / weight
+        self._finish_tags[priority] = tag
+        waiter = _Waiter(priority, tag, asyncio.get_running_loop().create_future())
+        self._queues[priority].append(waiter)
+        scheduler_queued.set(len(self._queues[priority]), queue=self.name, priority=priority)
+
+        started = time.monotonic()
+        try:
+            with span("queue.wait", queue=self.name, priority=priority):
+                await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # The slot was handed over just as the caller was cancelled
+                self.release()
+            else:
+                self._remove(waiter)
+            raise
+
+        waited = time.monotonic() - started
+        scheduler_wait_seconds.observe(waited, queue=self.name, priority=priority)
+        return waited
+
+    def release(self):
+        self.running -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        while self.running < self.capacity:
+            heads = [queue[0] for queue in self._queues.values() if queue]
+            if not heads:
+                return
+            waiter = min(heads, key=lambda head: head.tag)
+            self._queues[waiter.priority].popleft()
+            scheduler_queued.set(len(self._queues[waiter.priority]), queue=self.name, priority=waiter.priority)
+            if waiter.future.done():
+                # Cancelled, e.g. by a timeout, before its task could leave the queue
+                continue
+            self._virtual_time = waiter.tag
+            self.running += 1
+            waiter.future.set_result(None)
+
+    def _remove(self, waiter: _Waiter):
+        queue = self._queues[waiter.priority]
+        try:
+            queue.remove(waiter)
+        except ValueError:
+            return
+        scheduler_queued.set(len(queue), queue=self.name, priority=waiter.priority)
+
+    def _preempt_speculative(self):
+        queue = self._queues[SPECULATIVE]
+        while queue:
+            waiter = queue.popleft()
+            if not waiter.future.done():
+                waiter.future.set_exception(SchedulerPreempted(f"Speculative call preempted in {self.name}"))
+                scheduler_preempted.inc(queue=self.name)
+        scheduler_queued.set(0, queue=self.name, priority=SPECULATIVE)
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+
+    def status(self) -> Dict[str, int]:
+        return {
+            "running": self.running,
+            "capacity": self.capacity,
+            **{f"queued_{priority}": len(queue) for priority, queue in self._queues.items()}
+        }
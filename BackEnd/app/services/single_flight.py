@@ -0,0 +1,69 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+from app.utils.metrics import metrics
+from app.utils.request_context import SPECULATIVE, current_priority
+
+singleflight_calls = metrics.counter(
+    "singleflight_calls_total", "Calls through a single-flight group by outcome", ("group", "result")
+)
+
+class _Call:
+    def __init__(self, task: asyncio.Future):
+        self.task = task
+        self.waiters = 0
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls that share a key into one in-flight task.
+
+    The first caller for a key starts the work; callers arriving while it is
+    still running attach to the same task and receive the same result or
+    exception. A waiter that is cancelled only detaches itself, and the
+    shared task is cancelled once no waiters are left.
+
+    Speculative callers only share calls among themselves: their model
+    calls may be preempted, which must not fail a real request that joined.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[str, _Call] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run fn for the key, or join the call already in flight for it"""
+        if current_priority() == SPECULATIVE:
+            key = f"{SPECULATIVE}:{key}"
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda task: self._finish(key, call))
+            singleflight_calls.inc(group=self.name, result="leader")
+        else:
+            singleflight_calls.inc(group=self.name, result="joined")
+
+        call.waiters += 1
+        try:
+            # Shield so one waiter disconnecting does not cancel the shared task
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Every waiter has gone away, so nobody needs the result
+                self._forget(key, call)
+                call.task.cancel()
+
+    def in_flight(self) -> int:
+        """Number of distinct calls currently running"""
+        return len(self._calls)
+
+    def _finish(self, key: str, call: _Call):
+        self._forget(key, call)
+        # Mark the exception as retrieved when every waiter already left
+        if not call.task.cancelled():
+            call.task.exception()
+
+    def _forget(self, key: str, call: _Call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
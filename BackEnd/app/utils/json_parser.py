@@ -0,0 +1,282 @@
+import json
+import logging
+from typing import Any, List, Optional, Tuple
+
+from app.utils.tracing import current_span
+
+logger = logging.getLogger("json_parser")
+
+_WHITESPACE = " \t\r\n"
+_CLOSERS = {"{": "}", "[": "]"}
+_PYTHON_LITERALS = {"True": "true", "False": "false", "None": "null"}
+
+class _Frame:
+    """An open object or array on the scanner stack"""
+
+    __slots__ = ("kind", "start", "safe", "key", "index", "expect_key", "key_pending", "after_value")
+
+    def __init__(self, kind: str, start: int):
+        self.kind = kind
+        self.start = start
+        # Buffer length after the last complete member, used to cut truncated output
+        self.safe = start + 1
+        self.key: Optional[str] = None
+        self.index = -1
+        self.expect_key = kind == "{"
+        self.key_pending = False
+        self.after_value = False
+
+    def component(self):
+        return self.key if self.kind == "{" else self.index
+
+class IncrementalJSONParser:
+    """
+    Single-pass, error-tolerant scanner for JSON produced by a language model.
+
+    Text before the first '{' or '[' (prose, code fences) is skipped and the
+    scan stops once the root value is closed. Every completed value whose
+    path is at most `emit_depth` deep is returned from feed() as a
+    (path, value) pair, where path is a tuple of object keys and array indices,
+    so the parser can consume a token stream.
+
+    Common model mistakes are repaired while scanning: trailing commas,
+    missing commas between values, mismatched closing brackets, Python
+    literals and raw control characters inside strings. close() also repairs
+    truncated output by closing the open string and containers and dropping
+    an incomplete trailing member. Every repair is recorded in `repairs`.
+
+    Args:
+        emit_depth: Maximum path length of the values to report; the root
+            value is always reported under the empty path
+    """
+
+    def __init__(self, emit_depth: int = 1):
+        self.emit_depth = emit_depth
+        self.value: Any = None
+        self.done = False
+        self.repairs: List[str] = []
+        self._buf: List[str] = []
+        self._stack: List[_Frame] = []
+        self._started = False
+        self._in_string = False
+        self._escape = False
+        self._string_is_key = False
+        self._string_start = 0
+        self._scalar_start: Optional[int] = None
+        self._pending_comma = False
+
+    def feed(self, chunk: str) -> List[Tuple[tuple, Any]]:
+        """Consume the next piece of text and return the values it completed"""
+        events: List[Tuple[tuple, Any]] = []
+        for ch in chunk:
+            if self.done:
+                break
+            self._consume(ch, events)
+        return events
+
+    def close(self) -> Any:
+        """
+        Finish the scan and return the root value.
+
+        Truncated output is repaired first. Raises json.JSONDecodeError
+        when no JSON value could be recovered.
+        """
+        if not self._started:
+            raise json.JSONDecodeError("No JSON object or array found", "".join(self._buf), 0)
+
+        if not self.done:
+            self._repair_truncation()
+
+        if self.value is None:
+            raise json.JSONDecodeError("Could not repair JSON value", "".join(self._buf), 0)
+        return self.value
+
+    def _consume(self, ch: str, events: List[Tuple[tuple, Any]]):
+        if not self._started:
+            if ch in "{[":
+                self._started = True
+                self._open(ch)
+            return
+
+        if self._in_string:
+            self._buf.append(ch)
+            if self._escape:
+                self._escape = False
+            elif ch == "\\":
+                self._escape = True
+            elif ch == '"':
+                self._in_string = False
+                self._end_string(events)
+            return
+
+        if self._scalar_start is not None:
+            if ch not in ",}]:" + _WHITESPACE:
+                self._buf.append(ch)
+                return
+            self._end_scalar(events)
+
+        if ch in _WHITESPACE:
+            if not self._pending_comma:
+                self._buf.append(ch)
+        elif ch in "}]":
+            if self._pending_comma:
+                self._pending_comma = False
+                self.repairs.append("trailing_comma")
+            frame = self._stack.pop()
+            if ch != _CLOSERS[frame.kind]:
+                self.repairs.append("mismatched_bracket")
+            self._buf.append(_CLOSERS[frame.kind])
+            self._complete(frame.start, events)
+        elif ch == ",":
+            if self._pending_comma or not self._stack[-1].after_value:
+                self.repairs.append("extra_comma")
+            else:
+                self._pending_comma = True
+        elif ch == ":":
+            self._buf.append(ch)
+        else:
+            self._separate()
+            if ch == '"':
+                frame = self._stack[-1]
+                self._string_is_key = frame.kind == "{" and frame.expect_key
+                if not self._string_is_key:
+                    self._begin_value()
+                self._string_start = len(self._buf)
+                self._buf.append(ch)
+                self._in_string = True
+            elif ch in "{[":
+                self._begin_value()
+                self._open(ch)
+            else:
+                self._begin_value()
+                self._scalar_start = len(self._buf)
+                self._buf.append(ch)
+
+    def _separate(self):
+        # Emit the comma held back by trailing-comma detection, or add a missing one
+        frame = self._stack[-1]
+        if not frame.after_value:
+            return
+        if not self._pending_comma:
+            self.repairs.append("missing_comma")
+        self._pending_comma = False
+        self._buf.append(",")
+        frame.after_value = False
+        if frame.kind == "{":
+            frame.expect_key = True
+
+    def _open(self, ch: str):
+        self._stack.append(_Frame(ch, len(self._buf)))
+        self._buf.append(ch)
+
+    def _begin_value(self):
+        frame = self._stack[-1]
+        if frame.kind == "[":
+            frame.index += 1
+
+    def _end_string(self, events: List[Tuple[tuple, Any]]):
+        if self._string_is_key:
+            frame = self._stack[-1]
+            frame.key = json.loads("".join(self._buf[self._string_start:]), strict=False)
+            frame.expect_key = False
+            frame.key_pending = True
+        else:
+            self._complete(self._string_start, events)
+
+    def _end_scalar(self, events: List[Tuple[tuple, Any]]):
+        start, self._scalar_start = self._scalar_start, None
+        literal = "".join(self._buf[start:])
+        if literal in _PYTHON_LITERALS:
+            del self._buf[start:]
+            self._buf.extend(_PYTHON_LITERALS[literal])
+            self.repairs.append("python_literal")
+        self._complete(start, events)
+
+    def _complete(self, start: int, events: List[Tuple[tuple, Any]]):
+        if self._stack:
+            frame = self._stack[-1]
+            frame.after_value = True
+            frame.key_pending = False
+            frame.safe = len(self._buf)
+
+        path = tuple(frame.component() for frame in self._stack)
+        if self._stack and len(path) > self.emit_depth:
+            return
+
+        try:
+            value = json.loads("".join(self._buf[start:]), strict=False)
+        except json.JSONDecodeError:
+            # Malformed values are not reported; the root stays None
+            value = None
+        else:
+            events.append((path, value))
+
+        if not self._stack:
+            self.value = value
+            self.done = True
+
+    def _repair_truncation(self):
+        events: List[Tuple[tuple, Any]] = []
+        self.repairs.append("truncated")
+        self._pending_comma = False
+
+        if self._in_string:
+            self._in_string = False
+            if self._string_is_key:
+                self._cut_to_safe()
+            else:
+                if self._escape:
+                    self._buf.pop()
+                    self._escape = False
+                self._buf.append('"')
+                self._end_string(events)
+        elif self._scalar_start is not None:
+            try:
+                json.loads("".join(self._buf[self._scalar_start:]))
+            except json.JSONDecodeError:
+                self._scalar_start = None
+                self._cut_to_safe()
+            else:
+                self._end_scalar(events)
+
+        # A key without a value cannot be kept
+        if self._stack and self._stack[-1].key_pending:
+            self._cut_to_safe()
+
+        while self._stack:
+            frame = self._stack.pop()
+            self._buf.append(_CLOSERS[frame.kind])
+            self._complete(frame.start, events)
+
+    def _cut_to_safe(self):
+        frame = self._stack[-1]
+        del self._buf[frame.safe:]
+        frame.key_pending = False
+        if frame.kind == "{":
+            frame.expect_key = True
+
+def parse_llm_json(text: str) -> Any:
+    """
+    Parse the JSON value in a model response, repairing common formatting errors.
+
+    Raises json.JSONDecodeError when no JSON value could be recovered.
+    """
+    parser = IncrementalJSONParser(emit_depth=0)
+    parser.feed(text)
+    value = parser.close()
+    if parser.repairs:
+        logger.info(f"Repaired model JSON output: {', '.join(parser.repairs)}")
+        # Attach the repair actions to the stage being traced, usually llm.parse
+        current = current_span()
+        if current is not None:
+            current.add("json_repairs", len(parser.repairs))
+            current.set("json_repair_actions", ", ".join(parser.repairs))
+    return value
+
+def is_valid_json(text: str) -> bool:
+    """Whether parse_llm_json() can recover a JSON value from a model response"""
+    try:
+        parse_llm_json(text)
+        return True
+    except json.JSONDecodeError:
+        return False
@@ -0,0 +1,122 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, List, Optional
+
+class ByteLRU:
+    """
+    In-memory LRU cache bounded by the total byte size of its values.
+
+    Args:
+        max_bytes: Maximum total size of all cached values
+        sizeof: Function returning the size in bytes of a value
+        ttl: Optional time-to-live in seconds for every entry
+        on_evict: Optional callback invoked with (key, value) for every eviction
+        on_expire: Optional callback for entries purged at their TTL; defaults to on_evict
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        sizeof: Callable[[Any], int] = len,
+        ttl: Optional[float] = None,
+        on_evict: Optional[Callable[[str, Any], None]] = None,
+        on_expire: Optional[Callable[[str, Any], None]] = None
+    ):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self.on_expire = on_expire or on_evict
+        self.current_bytes = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return a cached value and mark it as recently used"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            value, size, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                self._remove(key)
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, expires_at: Optional[float] = None):
+        """
+        Insert or replace a value, evicting least recently used entries as needed.
+
+        `expires_at` (a time.time() timestamp) replaces the TTL of this entry,
+        e.g. to keep an entry loaded from another tier no longer than it lives there.
+        """
+        size = self.sizeof(value)
+        evicted = []
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            # Values larger than the whole cache are not worth keeping
+            if size > self.max_bytes:
+                return
+
+            if expires_at is None and self.ttl:
+                expires_at = time.time() + self.ttl
+            self._entries[key] = (value, size, expires_at)
+            self.current_bytes += size
+
+            while self.current_bytes > self.max_bytes:
+                old_key, (old_value, _, _) = next(iter(self._entries.items()))
+                self._remove(old_key)
+                self.evictions += 1
+                evicted.append((old_key, old_value))
+
+        if self.on_evict:
+            for old_key, old_value in evicted:
+                self.on_evict(old_key, old_value)
+
+    def pop(self, key: str) -> Optional[Any]:
+        """Remove a value from the cache and return it"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._remove(key)
+            return entry[0]
+
+    def purge_expired(self) -> int:
+        """Drop every expired entry, as expired entries are otherwise only dropped on access"""
+        if not self.ttl:
+            return 0
+        now = time.time()
+        with self._lock:
+            expired = [(key, entry[0]) for key, entry in self._entries.items() if entry[2] <= now]
+            for key, _ in expired:
+                self._remove(key)
+            self.evictions += len(expired)
+
+        if self.on_expire:
+            for key, value in expired:
+                self.on_expire(key, value)
+        return len(expired)
+
+    def values(self) -> List[Any]:
+        """Snapshot of the cached values, expired ones included"""
+        with self._lock:
+            return [entry[0] for entry in self._entries.values()]
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remove(self, key: str):
+        _, size, _ = self._entries.pop(key)
+        self.current_bytes -= size
@@ -0,0 +1,133 @@
+import textwrap
+from typing import Dict, List, Tuple
+
+# A4 in points
+PAGE_WIDTH = 595
+PAGE_HEIGHT = 842
+MARGIN = 56
+
+# Font resource, size and space before, by block kind
+_STYLES: Dict[str, Tuple[str, float, float]] = {
+    "title": ("F2", 22, 0),
+    "h1": ("F2", 17, 18),
+    "h2": ("F2", 14, 14),
+    "h3": ("F2", 12, 10),
+    "p": ("F1", 10.5, 6),
+    "li": ("F1", 10.5, 2),
+}
+
+# Average Helvetica glyph width as a fraction of the font size, used for wrapping
+_AVERAGE_WIDTH = 0.5
+
+def _escape(text: str) -> bytes:
+    """Encode text as a PDF literal string in WinAnsi, the encoding of the standard fonts"""
+    encoded = text.encode("cp1252", errors="replace")
+    return encoded.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+class StreamingPDFWriter:
+    """
+    Writes a text-only PDF incrementally, one page at a time.
+
+    Uses the standard Helvetica fonts, which every reader provides, so
+    nothing is embedded. Blocks are laid out top to bottom and wrapped on
+    an average glyph width. Each finished page is returned as bytes right
+    away; only the object offsets are kept until finish() writes the page
+    tree and cross-reference table, so memory does not grow with the
+    document.
+    """
+
+    def __init__(self, title: str = ""):
+        self._offset = 0
+        self._offsets: Dict[int, int] = {}
+        self._pages: List[int] = []
+        # 1 catalog, 2 page tree, 3 and 4 fonts, 5 info; pages follow
+        self._next_object = 6
+        self._lines: List[bytes] = []
+        self._y = PAGE_HEIGHT - MARGIN
+        self._title = title
+
+    def _object(self, number: int, body: bytes) -> bytes:
+        self._offsets[number] = self._offset
+        data = b"%d 0 obj\n" % number + body + b"\nendobj\n"
+        self._offset += len(data)
+        return data
+
+    def _emit(self, data: bytes) -> bytes:
+        self._offset += len(data)
+        return data
+
+    def start(self) -> bytes:
+        out = self._emit(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        out += self._object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        out += self._object(3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+        out += self._object(4, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>")
+        out += self._object(5, b"<< /Title (" + _escape(self._title) + b") /Producer (TuteAI) >>")
+        return out
+
+    def _flush_page(self) -> bytes:
+        if not self._lines:
+            return b""
+        content = b"BT\n" + b"".join(self._lines) + b"ET"
+        content_number, page_number = self._next_object, self._next_object + 1
+        self._next_object += 2
+        self._pages.append(page_number)
+        self._lines = []
+        self._y = PAGE_HEIGHT - MARGIN
+
+        out = self._object(
+            content_number,
+            b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream"
+        )
+        out += self._object(
+            page_number,
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] " % (PAGE_WIDTH, PAGE_HEIGHT)
+            + b"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents %d 0 R >>" % content_number
+        )
+        return out
+
+    def add(self, kind: str, text: str) -> bytes:
+        """Lay out one block and return the pages it completed"""
+        font, size, space_before = _STYLES.get(kind, _STYLES["p"])
+        indent = 14 if kind == "li" else 0
+        leading = size * 1.35
+        width = int((PAGE_WIDTH - 2 * MARGIN - indent) / (size * _AVERAGE_WIDTH))
+        lines = textwrap.wrap(text, width) or [""]
+        if kind == "li":
+            lines[0] = "• " + lines[0]
+
+        out = b""
+        if self._lines:
+            self._y -= space_before
+        for line in lines:
+            if self._y - leading < MARGIN:
+                out += self._flush_page()
+            self._y -= leading
+            self._lines.append(
+                b"/%s %.1f Tf 1 0 0 1 %d %.1f Tm (" % (font.encode(), size, MARGIN + indent, self._y)
+                + _escape(line) + b") Tj\n"
+            )
+        return out
+
+    def page_break(self) -> bytes:
+        return self._flush_page()
+
+    def finish(self) -> bytes:
+        out = self._flush_page()
+        if not self._pages:
+            # A PDF needs at least one page
+            self._lines.append(b"")
+            out += self._flush_page()
+
+        kids = b" ".join(b"%d 0 R" % number for number in self._pages)
+        out += self._object(2, b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % len(self._pages))
+
+        xref_offset = self._offset
+        xref = [b"xref\n0 %d\n" % self._next_object, b"0000000000 65535 f \n"]
+        for number in range(1, self._next_object):
+            xref.append(b"%010d 00000 n \n" % self._offsets[number])
+        out += b"".join(xref)
+        out += (
+            b"trailer\n<< /Size %d /Root 1 0 R /Info 5 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+            % (self._next_object, xref_offset)
+        )
+        return out
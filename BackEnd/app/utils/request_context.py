@@ -0,0 +1,57 @@
+from contextvars import ContextVar
+from typing import Optional
+
+from app.config import get_settings
+from app.utils.metrics import metrics
+
+llm_tokens = metrics.counter(
+    "llm_tokens_total", "Tokens sent to and generated by the model by task", ("task", "direction")
+)
+
+class TokenUsage:
+    """Model tokens consumed while serving one HTTP request"""
+
+    __slots__ = ("tokens_in", "tokens_out")
+
+    def __init__(self):
+        self.tokens_in = 0
+        self.tokens_out = 0
+
+# Set by the token accounting middleware; tasks spawned by the request inherit it
+_current_usage: ContextVar[Optional[TokenUsage]] = ContextVar("token_usage", default=None)
+
+def start_request() -> TokenUsage:
+    """Start counting tokens for the current request"""
+    usage = TokenUsage()
+    _current_usage.set(usage)
+    return usage
+
+def current_usage() -> Optional[TokenUsage]:
+    return _current_usage.get()
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+SPECULATIVE = "speculative"
+PRIORITY_CLASSES = (INTERACTIVE, BATCH, SPECULATIVE)
+
+# Set from the X-Priority header or API key; background jobs and speculation set their own
+_current_priority: ContextVar[Optional[str]] = ContextVar("priority", default=None)
+
+def set_priority(priority: str):
+    """Schedule the model calls of the current request or task in this priority class"""
+    _current_priority.set(priority)
+
+def current_priority() -> str:
+    return _current_priority.get() or get_settings().default_priority
+
+def record_tokens(task: str, tokens_in: Optional[int], tokens_out: Optional[int]):
+    """Add the tokens of one model call to the task metrics and the current request"""
+    tokens_in = tokens_in or 0
+    tokens_out = tokens_out or 0
+    llm_tokens.inc(tokens_in, task=task, direction="in")
+    llm_tokens.inc(tokens_out, task=task, direction="out")
+
+    usage = _current_usage.get()
+    if usage is not None:
+        usage.tokens_in += tokens_in
+        usage.tokens_out += tokens_out
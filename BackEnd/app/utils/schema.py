@@ -0,0 +1,144 @@
+import copy
+from enum import Enum
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple, Type, Union, get_args, get_origin
+
+from pydantic import BaseModel, ValidationError, create_model
+
+# Scalar annotations and their Gemini schema types
+_SCALAR_TYPES = {str: "STRING", int: "INTEGER", float: "NUMBER", bool: "BOOLEAN"}
+
+Path = Tuple[Union[str, int], ...]
+
+def is_server_field(name: str) -> bool:
+    """IDs and metadata are assigned by the server, never generated by the model"""
+    return name.endswith("_id") or name == "metadata"
+
+def _optional_inner(annotation: Any) -> Any:
+    if get_origin(annotation) is Union:
+        args = [arg for arg in get_args(annotation) if arg is not type(None)]
+        if len(args) == 1:
+            return args[0]
+    return None
+
+@lru_cache(maxsize=None)
+def draft_model(model: Type[BaseModel]) -> Type[BaseModel]:
+    """
+    Return a copy of a response model without its server-assigned fields.
+
+    Nested models are replaced by their drafts, so the draft describes
+    exactly what the model is asked to generate.
+    """
+    fields: Dict[str, Any] = {}
+    for name, field in model.model_fields.items():
+        if is_server_field(name):
+            continue
+        annotation = _draft_annotation(field.annotation)
+        fields[name] = (annotation, ... if field.is_required() else field.default)
+    return create_model(f"{model.__name__}Draft", **fields)
+
+def _draft_annotation(annotation: Any) -> Any:
+    inner = _optional_inner(annotation)
+    if inner is not None:
+        return Union[_draft_annotation(inner), None]
+    if get_origin(annotation) in (list, List):
+        return List[_draft_annotation(get_args(annotation)[0])]
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return draft_model(annotation)
+    return annotation
+
+def _schema_for(annotation: Any) -> Dict[str, Any]:
+    inner = _optional_inner(annotation)
+    if inner is not None:
+        return {**_schema_for(inner), "nullable": True}
+    if get_origin(annotation) in (list, List):
+        return {"type": "ARRAY", "items": _schema_for(get_args(annotation)[0])}
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return {
+            "type": "OBJECT",
+            "properties": {
+                name: _schema_for(field.annotation) for name, field in annotation.model_fields.items()
+            },
+            "required": [name for name, field in annotation.model_fields.items() if field.is_required()]
+        }
+    if isinstance(annotation, type) and issubclass(annotation, Enum):
+        return {"type": "STRING", "enum": [member.value for member in annotation]}
+    if annotation in _SCALAR_TYPES:
+        return {"type": _SCALAR_TYPES[annotation]}
+    raise TypeError(f"No response schema for annotation {annotation!r}")
+
+@lru_cache(maxsize=None)
+def _response_schema(model: Type[BaseModel]) -> Dict[str, Any]:
+    return _schema_for(draft_model(model))
+
+def response_schema(model: Type[BaseModel]) -> Dict[str, Any]:
+    """Gemini response schema for the model-generated part of a response model"""
+    return copy.deepcopy(_response_schema(model))
+
+def schema_at(model: Type[BaseModel], path: Path) -> Dict[str, Any]:
+    """Gemini response schema of the subtree at `path` of a response model's draft"""
+    annotation: Any = draft_model(model)
+    for part in path:
+        inner = _optional_inner(annotation)
+        if inner is not None:
+            annotation = inner
+        if isinstance(part, int):
+            annotation = get_args(annotation)[0]
+        else:
+            annotation = annotation.model_fields[part].annotation
+    return _schema_for(annotation)
+
+def invalid_subtrees(model: Type[BaseModel], data: Any) -> Dict[Path, List[str]]:
+    """
+    Validate generated data against a response model's draft in one pass.
+
+    Returns the smallest subtrees that have to be regenerated, mapped to
+    their error messages: the list item containing an error, or the
+    top-level field when the error is not inside a list.
+    """
+    try:
+        draft_model(model).model_validate(data)
+    except ValidationError as e:
+        subtrees: Dict[Path, List[str]] = {}
+        for error in e.errors():
+            path = subtree_path(tuple(error["loc"]))
+            subtrees.setdefault(path, []).append(f"{format_path(tuple(error['loc']))}: {error['msg']}")
+        return subtrees
+    return {}
+
+def subtree_path(loc: Path) -> Path:
+    """Cut an error location back to the deepest list item, or to its top-level field"""
+    for i in range(len(loc) - 1, 0, -1):
+        if isinstance(loc[i], int):
+            return loc[:i + 1]
+    return loc[:1]
+
+def format_path(path: Path) -> str:
+    text = ""
+    for part in path:
+        text += f"[{part}]" if isinstance(part, int) else (f".{part}" if text else part)
+    return text or "(root)"
+
+def get_path(data: Any, path: Path) -> Any:
+    for part in path:
+        try:
+            data = data[part]
+        except (KeyError, IndexError, TypeError):
+            return None
+    return data
+
+def set_path(data: Dict[str, Any], path: Path, value: Any):
+    """Replace the subtree at `path`, appending list items that do not exist yet"""
+    target: Any = data
+    for i, part in enumerate(path[:-1]):
+        current = get_path(target, (part,))
+        if not isinstance(current, (dict, list)):
+            current = [] if isinstance(path[i + 1], int) else {}
+            target[part] = current
+        target = current
+
+    last = path[-1]
+    if isinstance(target, list):
+        while len(target) <= last:
+            target.append(None)
+    target[last] = value
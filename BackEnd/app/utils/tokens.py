@@ -0,0 +1,92 @@
+import math
+from typing import List, Optional, Sequence, Tuple
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for Gemini models (about four characters per token)"""
+    return len(text) // 4 + 1
+
+def chunk_text(text: str, max_tokens: int) -> List[Tuple[int, int, int]]:
+    """
+    Split text into chunks of at most `max_tokens` tokens along paragraph boundaries.
+
+    Consecutive short paragraphs are merged into one chunk and paragraphs
+    longer than the limit are split on line breaks. Returns (start, end, tokens)
+    triples; a chunk's text is text[start:end], so it is not copied.
+    """
+    # (start, end, tokens) of each paragraph, or line of an overlong paragraph
+    pieces: List[Tuple[int, int, int]] = []
+    position = 0
+    for paragraph in text.split("\n\n"):
+        paragraph_start = position
+        position += len(paragraph) + 2
+        stripped = paragraph.strip()
+        if not stripped:
+            continue
+        start = paragraph_start + len(paragraph) - len(paragraph.lstrip())
+        tokens = estimate_tokens(stripped)
+        if tokens <= max_tokens:
+            pieces.append((start, start + len(stripped), tokens))
+            continue
+        line_start = start
+        for line in stripped.split("\n"):
+            if line.strip():
+                pieces.append((line_start, line_start + len(line), estimate_tokens(line)))
+            line_start += len(line) + 1
+
+    chunks: List[Tuple[int, int, int]] = []
+    current: Optional[Tuple[int, int, int]] = None
+    for start, end, tokens in pieces:
+        if current is not None and current[2] + tokens > max_tokens:
+            chunks.append(current)
+            current = None
+        current = (start, end, tokens) if current is None else (current[0], end, current[2] + tokens)
+    if current is not None:
+        chunks.append(current)
+    return chunks
+
+def pack_by_score(token_counts: Sequence[int], scores: Sequence[float], budget: int) -> List[int]:
+    """
+    Pick the highest-scoring chunks that fit into a token budget.
+
+    Chunks with a score of zero or less are never picked. Ties keep document
+    order, and a chunk too large for the remaining budget is skipped in favor
+    of smaller ones. Returns chunk indices in the order they were picked.
+    """
+    ranked = sorted(
+        (i for i, score in enumerate(scores) if score > 0),
+        key=lambda i: (-scores[i], i)
+    )
+    picked: List[int] = []
+    used = 0
+    for i in ranked:
+        if used + token_counts[i] <= budget:
+            picked.append(i)
+            used += token_counts[i]
+    return picked
+
+def pack_spread(token_counts: Sequence[int], budget: int, exclude: Optional[Sequence[int]] = None) -> List[int]:
+    """
+    Pick chunks spread evenly across the document until the token budget is used.
+
+    When everything fits, every chunk is picked. Otherwise evenly spaced
+    chunks are taken first and the gaps are filled afterwards, so the
+    selection covers the whole document instead of only its beginning.
+    Returns chunk indices in document order.
+    """
+    skipped = set(exclude or ())
+    candidates = [i for i in range(len(token_counts)) if i not in skipped]
+    if not candidates or budget <= 0:
+        return []
+
+    average = sum(token_counts[i] for i in candidates) / len(candidates)
+    slots = max(1, int(budget // max(average, 1)))
+    stride = max(1, math.ceil(len(candidates) / slots))
+
+    picked: List[int] = []
+    used = 0
+    for position in sorted(range(len(candidates)), key=lambda p: (p % stride, p)):
+        i = candidates[position]
+        if used + token_counts[i] <= budget:
+            picked.append(i)
+            used += token_counts[i]
+    return sorted(picked)
@@ -0,0 +1,180 @@
+import json
+import logging
+import os
+import queue
+import re
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app.config import get_settings
+from app.utils.metrics import metrics
+
+logger = logging.getLogger("tracing")
+
+span_duration = metrics.histogram(
+    "span_duration_seconds", "Duration of traced request stages by span name", ("span",)
+)
+
+# OTLP span kinds and status codes
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+_STATUS_OK = 1
+_STATUS_ERROR = 2
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+class Span:
+    """One timed stage of a request with its attributes"""
+
+    __slots__ = ("name", "kind", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], kind: int = SPAN_KIND_INTERNAL):
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes: Dict[str, Any] = {}
+        self.error: Optional[str] = None
+
+    def set(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def add(self, key: str, amount: float = 1):
+        """Increment a numeric attribute, e.g. a retry count"""
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    @property
+    def duration(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_otlp_attribute(key, value) for key, value in self.attributes.items()],
+            "status": {"code": _STATUS_ERROR, "message": self.error} if self.error else {"code": _STATUS_OK}
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+class SpanExporter:
+    """
+    Writes finished spans as OTLP/JSON lines from a background thread.
+
+    Each line is an ExportTraceServiceRequest, the format the OpenTelemetry
+    Collector's otlpjsonfile receiver reads, so a local collector can
+    forward the spans to any tracing backend.
+    """
+
+    def __init__(self, path: str, service_name: str):
+        self.path = path
+        self.service_name = service_name
+        self._queue: "queue.SimpleQueue[Span]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+                    self._thread.start()
+        self._queue.put(span)
+
+    def _run(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        while True:
+            batch = [self._queue.get()]
+            while not self._queue.empty() and len(batch) < 512:
+                batch.append(self._queue.get())
+            try:
+                with open(self.path, "a") as f:
+                    f.write(json.dumps(self._request(batch)) + "\n")
+            except OSError as e:
+                logger.warning(f"Could not export {len(batch)} spans: {str(e)}")
+
+    def _request(self, spans: List[Span]) -> Dict[str, Any]:
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", self.service_name)]},
+                "scopeSpans": [{"scope": {"name": "tuteai"}, "spans": [span.to_otlp() for span in spans]}]
+            }]
+        }
+
+_exporter: Optional[SpanExporter] = None
+
+def _get_exporter() -> Optional[SpanExporter]:
+    global _exporter
+    settings = get_settings()
+    if not settings.tracing_enabled:
+        return None
+    if _exporter is None:
+        _exporter = SpanExporter(settings.tracing_export_path, settings.tracing_service_name)
+    return _exporter
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+def parse_traceparent(header: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """Trace and parent span ID from a W3C traceparent header, if it is valid"""
+    match = _TRACEPARENT.match((header or "").strip().lower())
+    return (match.group(1), match.group(2)) if match else (None, None)
+
+@contextmanager
+def span(
+    name: str, kind: int = SPAN_KIND_INTERNAL, trace_id: Optional[str] = None,
+    parent_id: Optional[str] = None, **attributes
+) -> Iterator[Span]:
+    """
+    Time a stage of the current request as a child of the current span.
+
+    The duration feeds the span_duration_seconds histogram; when tracing is
+    enabled the span is also exported. Works in sync and async code, and
+    tasks started inside the block inherit the span as their parent.
+    """
+    parent = _current_span.get()
+    if trace_id is None:
+        trace_id = parent.trace_id if parent is not None else secrets.token_hex(16)
+        parent_id = parent.span_id if parent is not None else None
+
+    current = Span(name, trace_id, parent_id, kind)
+    current.attributes.update(attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {str(e)}"[:500]
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end_ns = time.time_ns()
+        # Read the name at the end, since a server span is renamed to its route template
+        span_duration.observe(current.duration, span=current.name)
+        exporter = _get_exporter()
+        if exporter is not None:
+            exporter.export(current)
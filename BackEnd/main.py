@@ -1,9 +1,36 @@
+from contextlib import asynccontextmanager
+import time
 from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from app.config import get_settings
 from app.api.v1.router import router as v1_router
 from app.api.v2.router import router as v2_router
+from app.services.mcp_service import mcp_pool
+from app.services.job_queue import job_queue
+from app.services.extraction_pool import extraction_pool
+from app.services.loop_monitor import loop_monitor
+from app.utils.request_context import PRIORITY_CLASSES, set_priority, start_request
+from app.utils.metrics import metrics
+from app.utils.tracing import SPAN_KIND_SERVER, parse_traceparent, span
+
+http_request_duration = metrics.histogram(
+    "http_request_duration_seconds", "Time to the response headers by method, route and status",
+    ("method", "route", "status")
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start shared resources before serving and release them on shutdown"""
+    await loop_monitor.start()
+    await mcp_pool.start()
+    await job_queue.start()
+    yield
+    await job_queue.stop()
+    await extraction_pool.stop()
+    await mcp_pool.stop()
+    await loop_monitor.stop()
 
 def create_app() -> FastAPI:
     """Create and configure the FastAPI application"""
@@ -12,7 +39,8 @@ def create_app() -> FastAPI:
     app = FastAPI(
         title="TuteAI Course Generator API",
         description="AI-powered course generation system",
-        version="2.0.0"
+        version="2.0.0",
+        lifespan=lifespan
     )
     
     # Set up CORS
@@ -22,8 +50,54 @@ def create_app() -> FastAPI:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["X-Tokens-In", "X-Tokens-Out", "X-Trace-Id"],
     )
     
+    # Report the model tokens each request consumed
+    @app.middleware("http")
+    async def token_accounting(request: Request, call_next):
+        usage = start_request()
+        response = await call_next(request)
+        response.headers["X-Tokens-In"] = str(usage.tokens_in)
+        response.headers["X-Tokens-Out"] = str(usage.tokens_out)
+        return response
+    
+    # Schedule the request's model calls in the class of its API key or X-Priority header
+    @app.middleware("http")
+    async def priority_class(request: Request, call_next):
+        priority = settings.priority_api_keys.get(request.headers.get("X-API-Key", ""))
+        if priority is None:
+            priority = request.headers.get("X-Priority", "").lower()
+        if priority in PRIORITY_CLASSES:
+            set_priority(priority)
+        return await call_next(request)
+    
+    # Trace each request as a root span, continuing the caller's trace when it sends a traceparent
+    @app.middleware("http")
+    async def request_tracing(request: Request, call_next):
+        trace_id, parent_id = parse_traceparent(request.headers.get("traceparent"))
+        started = time.monotonic()
+        with span(
+            f"{request.method} {request.url.path}", SPAN_KIND_SERVER, trace_id, parent_id,
+            **{"http.method": request.method, "http.target": request.url.path}
+        ) as root:
+            response = await call_next(request)
+            # The matched route template keeps the metric labels bounded
+            route = getattr(request.scope.get("route"), "path", None) or "unmatched"
+            root.name = f"{request.method} {route}"
+            root.set("http.route", route)
+            root.set("http.status_code", response.status_code)
+        http_request_duration.observe(
+            time.monotonic() - started, method=request.method, route=route, status=response.status_code
+        )
+        response.headers["X-Trace-Id"] = root.trace_id
+        return response
+    
+    # Prometheus scrape endpoint with request, stage and model call metrics
+    @app.get("/metrics", include_in_schema=False)
+    async def prometheus_metrics():
+        return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+    
     # Version check endpoint
     @app.get("/api/versions")
     async def api_versions():
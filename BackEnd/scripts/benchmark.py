@@ -0,0 +1,347 @@
+"""
+End-to-end load test of the v1 and v2 endpoints against the simulated model.
+
+Runs the app in-process with LLM_BACKEND=fake, drives each endpoint with a
+fixed number of requests at the given concurrency and reports throughput,
+latency percentiles, time to first byte and event-loop lag. Results are
+written as JSON so runs can be compared; with --baseline the run fails when
+an endpoint's p95 latency or throughput regressed beyond --tolerance.
+
+Run from the BackEnd directory:
+
+    python scripts/benchmark.py --concurrency 16 --requests 64 --output bench.json
+    python scripts/benchmark.py --endpoints v2/plan-course,v2/create-quiz --baseline bench.json
+
+Model behaviour is configured through the usual settings, e.g.
+FAKE_LLM_LATENCY_SECONDS, FAKE_LLM_TOKENS_PER_SECOND or FAKE_LLM_ERROR_RATE.
+With --url the requests go to a running server instead; its model backend
+is whatever that server was started with, and loop lag is not reported.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+COURSE = {
+    "title": "Introduction to Data Engineering",
+    "description": "Build reliable batch and streaming data pipelines with modern tooling",
+    "target_audience": "Software engineers moving into data roles",
+    "time_available": "4 weeks, 5 hours per week"
+}
+MODULE_INFO = {"module_id": "mod_bench", "module_title": "Batch Pipelines", "module_summary": "Scheduling and idempotent jobs"}
+LESSON_INFO = {"lesson_id": "les_bench", "lesson_title": "Idempotent Loads", "lesson_summary": "Re-runnable loads"}
+
+def _scenarios(document_id: Optional[str]) -> Dict[str, Callable[[], Dict[str, Any]]]:
+    """Request factories per endpoint, keyed by '<version>/<path>'"""
+    scenarios = {
+        "v1/plan-course": lambda: {"json": COURSE},
+        "v1/plan-module": lambda: {"json": {
+            "course_title": COURSE["title"], "course_description": COURSE["description"],
+            "module_title": MODULE_INFO["module_title"], "module_summary": MODULE_INFO["module_summary"]
+        }},
+        "v1/create-lesson-content": lambda: {"json": {
+            "course_title": COURSE["title"], "module_title": MODULE_INFO["module_title"],
+            "lesson_title": LESSON_INFO["lesson_title"], "lesson_objective": LESSON_INFO["lesson_summary"]
+        }},
+        "v1/create-quiz": lambda: {"json": {
+            "course_title": COURSE["title"], "module_title": MODULE_INFO["module_title"],
+            "lesson_title": LESSON_INFO["lesson_title"], "lesson_objective": LESSON_INFO["lesson_summary"]
+        }},
+        "v2/plan-course": lambda: {"json": COURSE},
+        "v2/plan-module": lambda: {"json": {
+            "course_id": "course_bench", "module_title": MODULE_INFO["module_title"],
+            "module_summary": MODULE_INFO["module_summary"], "key_concepts": ["scheduling", "idempotency"]
+        }},
+        "v2/create-lesson-content": lambda: {"json": {
+            "module_id": "mod_bench", "lesson_title": LESSON_INFO["lesson_title"],
+            "lesson_objective": LESSON_INFO["lesson_summary"]
+        }},
+        "v2/create-lesson-content/stream": lambda: {"json": {
+            "module_id": "mod_bench", "lesson_title": LESSON_INFO["lesson_title"],
+            "lesson_objective": LESSON_INFO["lesson_summary"]
+        }},
+        "v2/create-quiz": lambda: {"json": {"lesson_id": "les_bench", "num_questions": 5}},
+        "v2/generate-full-course": lambda: {"json": {**COURSE, "include_quizzes": True}},
+        "v2/health": lambda: {"method": "GET"},
+    }
+    if document_id is not None:
+        scenarios.update({
+            "v1/document-courses/generate-course": lambda: {"json": {"document_id": document_id}},
+            "v1/document-courses/generate-module": lambda: {"json": {
+                "document_id": document_id, "module_id": MODULE_INFO["module_id"],
+                "course_info": {"course_title": COURSE["title"], "modules": [MODULE_INFO]}
+            }},
+            "v1/document-courses/generate-lesson": lambda: {"json": {
+                "document_id": document_id, "lesson_id": LESSON_INFO["lesson_id"],
+                "module_info": {**MODULE_INFO, "lessons": [LESSON_INFO]}
+            }},
+            "v1/document-courses/generate-quiz": lambda: {"json": {
+                "document_id": document_id, "lesson_info": LESSON_INFO, "question_count": 5
+            }},
+        })
+    return scenarios
+
+def _percentile(values: List[float], percentile: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(percentile / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+def _summary_ms(values: List[float]) -> Dict[str, Optional[float]]:
+    def ms(value):
+        return round(value * 1000, 2) if value is not None else None
+    return {
+        "p50": ms(_percentile(values, 50)),
+        "p95": ms(_percentile(values, 95)),
+        "p99": ms(_percentile(values, 99)),
+        "max": ms(max(values) if values else None),
+        "mean": ms(sum(values) / len(values) if values else None)
+    }
+
+class LoopLagMonitor:
+    """Samples how late the event loop wakes up a sleeping task"""
+
+    def __init__(self, interval: float = 0.02):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, time.perf_counter() - started - self.interval))
+
+    def start(self):
+        self.samples = []
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> List[float]:
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        return self.samples
+
+async def _request(client, name: str, factory: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+    spec = factory()
+    method = spec.get("method", "POST")
+    started = time.perf_counter()
+    first_byte = None
+    try:
+        async with client.stream(method, f"/api/{name}", json=spec.get("json")) as response:
+            async for _ in response.aiter_bytes():
+                if first_byte is None:
+                    first_byte = time.perf_counter() - started
+            status = response.status_code
+    except Exception as e:
+        return {"status": None, "error": str(e), "latency": time.perf_counter() - started, "ttfb": first_byte}
+    return {"status": status, "error": None, "latency": time.perf_counter() - started, "ttfb": first_byte}
+
+async def _run_scenario(client, name: str, factory, requests: int, concurrency: int, monitor) -> Dict[str, Any]:
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with slots:
+            return await _request(client, name, factory)
+
+    if monitor is not None:
+        monitor.start()
+    started = time.perf_counter()
+    results = await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    lag = await monitor.stop() if monitor is not None else None
+
+    ok = [result for result in results if result["status"] is not None and result["status"] < 400]
+    statuses: Dict[str, int] = {}
+    for result in results:
+        key = str(result["status"]) if result["status"] is not None else "transport_error"
+        statuses[key] = statuses.get(key, 0) + 1
+
+    return {
+        "endpoint": name,
+        "requests": requests,
+        "concurrency": concurrency,
+        "succeeded": len(ok),
+        "errors": requests - len(ok),
+        "statuses": statuses,
+        "duration_seconds": round(elapsed, 3),
+        "throughput_rps": round(len(ok) / elapsed, 3) if elapsed else None,
+        "latency_ms": _summary_ms([result["latency"] for result in ok]),
+        "ttfb_ms": _summary_ms([result["ttfb"] for result in ok if result["ttfb"] is not None]),
+        "loop_lag_ms": _summary_ms(lag) if lag is not None else None
+    }
+
+def _sample_document() -> bytes:
+    from docx import Document
+
+    document = Document()
+    document.add_heading("Data Engineering Handbook", 0)
+    for chapter in range(1, 6):
+        document.add_heading(f"Chapter {chapter}: Pipelines", 1)
+        for _ in range(8):
+            document.add_paragraph(
+                "Reliable pipelines are idempotent, observable and scheduled with clear ownership. "
+                "Batch loads are partitioned by date so reruns replace data instead of duplicating it. "
+            )
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+async def _upload_document(client) -> Optional[str]:
+    """Upload a generated document for the document-based endpoints and wait for processing"""
+    response = await client.post(
+        "/api/v1/documents/upload",
+        files={"file": (
+            "benchmark.docx", _sample_document(),
+            "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+        )}
+    )
+    if response.status_code >= 400:
+        print(f"Document upload failed: {response.status_code} {response.text}", file=sys.stderr)
+        return None
+    document_id = response.json()["document_id"]
+    for _ in range(100):
+        status = await client.get(f"/api/v1/documents/{document_id}")
+        if status.status_code == 200:
+            return document_id
+        if status.status_code != 404:
+            print(f"Document processing failed: {status.text}", file=sys.stderr)
+            return None
+        await asyncio.sleep(0.1)
+    print("Document processing did not finish; skipping document endpoints", file=sys.stderr)
+    return None
+
+def _compare(results: List[Dict[str, Any]], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    previous = {result["endpoint"]: result for result in baseline.get("results", [])}
+    regressions = []
+    for result in results:
+        before = previous.get(result["endpoint"])
+        if before is None:
+            continue
+        p95, p95_before = result["latency_ms"]["p95"], before["latency_ms"]["p95"]
+        if p95 is not None and p95_before and p95 > p95_before * (1 + tolerance):
+            regressions.append(f"{result['endpoint']}: p95 {p95_before} ms -> {p95} ms")
+        rps, rps_before = result["throughput_rps"], before["throughput_rps"]
+        if rps is not None and rps_before and rps < rps_before * (1 - tolerance):
+            regressions.append(f"{result['endpoint']}: throughput {rps_before} -> {rps} req/s")
+    return regressions
+
+async def _benchmark(args) -> Dict[str, Any]:
+    import httpx
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout)
+        app_context = None
+        monitor = None
+    else:
+        import main
+
+        client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=main.app), base_url="http://benchmark", timeout=args.timeout
+        )
+        app_context = main.lifespan(main.app)
+        await app_context.__aenter__()
+        monitor = LoopLagMonitor()
+
+    try:
+        document_id = None
+        if args.documents:
+            document_id = await _upload_document(client)
+
+        scenarios = _scenarios(document_id)
+        selected = args.endpoints.split(",") if args.endpoints else list(scenarios)
+        unknown = [name for name in selected if name not in scenarios]
+        if unknown:
+            raise SystemExit(f"Unknown endpoints: {', '.join(unknown)}; choose from {', '.join(scenarios)}")
+
+        results = []
+        for name in selected:
+            result = await _run_scenario(client, name, scenarios[name], args.requests, args.concurrency, monitor)
+            results.append(result)
+            latency = result["latency_ms"]
+            print(
+                f"{name:<40} {result['throughput_rps'] or 0:>8.2f} req/s  "
+                f"p50 {latency['p50'] or 0:>9.1f}  p95 {latency['p95'] or 0:>9.1f}  "
+                f"p99 {latency['p99'] or 0:>9.1f} ms  errors {result['errors']}",
+                file=sys.stderr
+            )
+    finally:
+        await client.aclose()
+        if app_context is not None:
+            await app_context.__aexit__(None, None, None)
+
+    from app.config import get_settings
+    settings = get_settings()
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "target": args.url or "in-process",
+        "config": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "llm_backend": settings.llm_backend if not args.url else None,
+            "fake_llm_latency_seconds": settings.fake_llm_latency_seconds,
+            "fake_llm_latency_distribution": settings.fake_llm_latency_distribution,
+            "fake_llm_tokens_per_second": settings.fake_llm_tokens_per_second,
+            "fake_llm_error_rate": settings.fake_llm_error_rate,
+            "llm_max_concurrency": settings.llm_max_concurrency,
+            "llm_cache_enabled": settings.llm_cache_enabled
+        },
+        "results": results
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=32, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=8, help="requests in flight per endpoint")
+    parser.add_argument("--endpoints", help="comma-separated endpoints, e.g. v2/plan-course,v1/create-quiz")
+    parser.add_argument("--no-documents", dest="documents", action="store_false", help="skip the document endpoints")
+    parser.add_argument("--cache", action="store_true", help="keep the LLM response cache enabled")
+    parser.add_argument("--keep-quotas", action="store_true", help="keep the configured model rate limits")
+    parser.add_argument("--url", help="benchmark a running server instead of an in-process app")
+    parser.add_argument("--timeout", type=float, default=300.0, help="per-request timeout in seconds")
+    parser.add_argument("--output", help="write the JSON results to this file instead of stdout")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression (default: 0.2)")
+    args = parser.parse_args()
+
+    # Settings are read on first use, so they have to be in the environment before the app is imported
+    os.environ.setdefault("LLM_BACKEND", "fake")
+    # Keep benchmark courses, cache entries and jobs out of the stores that real workers share
+    scratch = tempfile.mkdtemp(prefix="tuteai-bench-")
+    os.environ.setdefault("STORE_PATH", os.path.join(scratch, "store.sqlite3"))
+    os.environ.setdefault("LLM_CACHE_PATH", os.path.join(scratch, "llm_cache.sqlite3"))
+    os.environ.setdefault("EXPORT_CACHE_DIR", os.path.join(scratch, "exports"))
+    os.environ.setdefault("JOB_QUEUE_PATH", os.path.join(scratch, "jobs.sqlite3"))
+    os.environ.setdefault("TRACING_EXPORT_PATH", os.path.join(scratch, "traces.jsonl"))
+    if not args.cache:
+        os.environ["LLM_CACHE_ENABLED"] = "false"
+    if not args.keep_quotas:
+        os.environ["MODEL_RATE_LIMITS"] = "{}"
+        os.environ["DEFAULT_RPM"] = str(10 ** 9)
+        os.environ["DEFAULT_TPM"] = str(10 ** 12)
+
+    report = asyncio.run(_benchmark(args))
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = _compare(report["results"], json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()